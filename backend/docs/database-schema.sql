@@ -32,6 +32,13 @@ CREATE TABLE IF NOT EXISTS messages (
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- 代码文件内容（按 sha256 去重，state.code_refs 和 code artifact 的 content_refs 引用这里）
+CREATE TABLE IF NOT EXISTS code_blobs (
+  sha256 TEXT PRIMARY KEY,
+  content TEXT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- 创建索引
 CREATE INDEX IF NOT EXISTS idx_projects_user_id ON projects(user_id);
 CREATE INDEX IF NOT EXISTS idx_projects_updated_at ON projects(updated_at DESC);
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+沙盒内代理的客户端
+create_sandbox 开启代理后，沙盒的代理地址登记在本地 SQLite 中；daytona_sandbox.py 的文件和命令操作
+优先通过代理在一个 HTTP/1.1 长连接上批量执行，代理不可达时退回 Daytona API。
+
+- 认证令牌由 DAYTONA_API_KEY 和沙盒 ID 派生（HMAC），不需要额外保存
+- 同一进程内对同一沙盒复用连接（部署 worker 一次部署有十几个操作）
+- AgentSandbox 提供 daytona Sandbox 的 process.exec / fs.upload_file 子集，
+  delta_sync、command_logs 等现有代码无需修改即可经由代理执行
+
+用法:
+  python3 scripts/agent_client.py health <sandbox_id>
+"""
+
+import base64
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import shlex
+import sqlite3
+import sys
+import time
+from types import SimpleNamespace
+from typing import Dict, Any, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENTS_DB = os.getenv(
+    'DAYTONA_AGENTS_DB',
+    os.path.join(SCRIPT_DIR, '..', '.cache', 'sandbox-agents.sqlite3'),
+)
+AGENT_PORT = int(os.getenv('DAYTONA_AGENT_PORT', '8787'))
+AGENT_SOURCE = os.path.join(SCRIPT_DIR, 'sandbox_agent.py')
+# 代理在沙盒内的位置和日志
+AGENT_PATH = "/tmp/atom-agent.py"
+AGENT_LOG = "/tmp/atom-agent.log"
+# 读取超时应大于代理的 PING_INTERVAL
+READ_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sandbox_agents (
+  sandbox_id TEXT PRIMARY KEY,
+  url TEXT NOT NULL,
+  preview_token TEXT,
+  created_at REAL NOT NULL
+);
+"""
+
+
+class AgentUnavailable(Exception):
+    """请求未被代理执行（连接失败、代理未启动、认证失败），调用方可以安全地退回 Daytona API"""
+
+
+class AgentError(RuntimeError):
+    """代理已接受请求，但操作失败或事件流中断"""
+
+
+def agent_token(sandbox_id: str, secret: Optional[str] = None) -> str:
+    """由 API Key 和沙盒 ID 派生代理令牌"""
+    key = secret if secret is not None else os.getenv('DAYTONA_API_KEY', '')
+    return hmac.new(key.encode("utf-8"), sandbox_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class AgentRegistry:
+    """已启用代理的沙盒及其预览地址"""
+
+    def __init__(self, path: str = AGENTS_DB):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def remember(self, sandbox_id: str, url: str, preview_token: Optional[str] = None):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sandbox_agents (sandbox_id, url, preview_token, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (sandbox_id, url, preview_token, time.time()),
+            )
+
+    def lookup(self, sandbox_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT url, preview_token FROM sandbox_agents WHERE sandbox_id = ?", (sandbox_id,)
+        ).fetchone()
+        return {"url": row[0], "preview_token": row[1]} if row else None
+
+    def forget(self, sandbox_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM sandbox_agents WHERE sandbox_id = ?", (sandbox_id,))
+
+
+class AgentClient:
+    """在一个 HTTP/1.1 长连接上向代理发送批量操作"""
+
+    def __init__(self, url: str, token: str, preview_token: Optional[str] = None,
+                 timeout: float = READ_TIMEOUT):
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        if preview_token:
+            self.headers["x-daytona-preview-token"] = preview_token
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=self.timeout)
+        return self.conn
+
+    def _open(self, method: str, path: str, body: Optional[bytes] = None) -> http.client.HTTPResponse:
+        """发送请求并读到响应头；复用的连接被对端关闭时重连一次"""
+        for attempt in range(2):
+            reused = self.conn is not None
+            try:
+                conn = self._connect()
+                conn.request(method, self.base_path + path, body=body, headers=self.headers)
+                response = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                self.close()
+                if not reused or attempt:
+                    raise AgentUnavailable(f"Agent connection failed: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                raise AgentUnavailable(f"Agent connection failed: {e}") from e
+
+        if response.status != 200:
+            detail = response.read()[:200].decode("utf-8", errors="replace")
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+            raise AgentUnavailable(f"Agent returned HTTP {response.status}: {detail}")
+        return response
+
+    def health(self) -> bool:
+        try:
+            response = self._open("GET", "/health")
+            return bool(json.loads(response.read()).get("ok"))
+        except (AgentUnavailable, ValueError):
+            return False
+
+    def stream(self, ops: List[Dict[str, Any]], parallel: bool = False) -> Iterator[Dict[str, Any]]:
+        """发送一批操作，按到达顺序产出代理推送的事件（result / log），不含 ping 和 done"""
+        body = json.dumps({"ops": [dict(op, id=i) for i, op in enumerate(ops)], "parallel": parallel})
+        response = self._open("POST", "/batch", body.encode("utf-8"))
+        finished = False
+        try:
+            while True:
+                try:
+                    line = response.readline()
+                except (OSError, http.client.HTTPException) as e:
+                    raise AgentError(f"Agent stream interrupted: {e}") from e
+                if not line:
+                    raise AgentError("Agent stream ended before completion")
+                event = json.loads(line)
+                if event.get("event") == "done":
+                    response.read()
+                    finished = True
+                    return
+                if event.get("event") != "ping":
+                    yield event
+        finally:
+            if not finished:
+                # 未读完的响应会破坏连接上的下一个请求
+                self.close()
+
+    def batch(self, ops: List[Dict[str, Any]], parallel: bool = False) -> List[Dict[str, Any]]:
+        """执行一批操作，按提交顺序返回结果；任一操作失败时抛出 AgentError"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(ops)
+        for event in self.stream(ops, parallel):
+            if event.get("event") == "result":
+                results[event["id"]] = event
+        for op, result in zip(ops, results):
+            if result is None or not result.get("ok"):
+                error = result.get("error") if result else "no result"
+                raise AgentError(f"Agent {op.get('op')} failed: {error}")
+        return results
+
+    def call(self, op: Dict[str, Any]) -> Dict[str, Any]:
+        return self.batch([op])[0]
+
+
+class AgentSandbox:
+    """用代理实现 daytona Sandbox 的 process.exec / fs.upload_file 子集"""
+
+    def __init__(self, client: AgentClient):
+        self.client = client
+        self.process = SimpleNamespace(exec=self._exec)
+        self.fs = SimpleNamespace(upload_file=self._upload_file)
+
+    def _exec(self, command: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+              timeout: Optional[int] = None):
+        if env:
+            exports = " ".join(f"{k}={shlex.quote(v)}" for k, v in env.items())
+            command = f"export {exports}; {command}"
+        result = self.client.call({"op": "exec", "cmd": command, "cwd": cwd, "timeout": timeout})
+        if result.get("timed_out"):
+            raise AgentError(f"Command timed out after {timeout}s")
+        return SimpleNamespace(exit_code=result["exit_code"], result=result["output"])
+
+    def _upload_file(self, content: bytes, path: str):
+        self.client.call({"op": "write", "path": path, "data": base64.b64encode(content).decode("ascii")})
+
+
+# 进程内的连接缓存；连接失败的沙盒在本进程内不再尝试代理
+_clients: Dict[str, AgentClient] = {}
+_unavailable: set = set()
+
+
+def connect_agent(sandbox_id: str) -> Optional[AgentClient]:
+    """返回沙盒的代理客户端；未启用代理或本进程内已确认不可达时返回 None"""
+    if sandbox_id in _unavailable:
+        return None
+    if sandbox_id in _clients:
+        return _clients[sandbox_id]
+    try:
+        registry = AgentRegistry()
+        try:
+            entry = registry.lookup(sandbox_id)
+        finally:
+            registry.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Failed to read agent registry: {e}", file=sys.stderr)
+        return None
+    if entry is None:
+        return None
+    client = AgentClient(entry["url"], agent_token(sandbox_id), entry["preview_token"])
+    _clients[sandbox_id] = client
+    return client
+
+
+def mark_unavailable(sandbox_id: str):
+    client = _clients.pop(sandbox_id, None)
+    if client is not None:
+        client.close()
+    _unavailable.add(sandbox_id)
+
+
+def register_agent(sandbox_id: str, url: str, preview_token: Optional[str] = None):
+    registry = AgentRegistry()
+    try:
+        registry.remember(sandbox_id, url, preview_token)
+    finally:
+        registry.close()
+
+
+def forget_agent(sandbox_id: str):
+    mark_unavailable(sandbox_id)
+    _unavailable.discard(sandbox_id)
+    registry = AgentRegistry()
+    try:
+        registry.forget(sandbox_id)
+    finally:
+        registry.close()
+
+
+def install_agent(sandbox, token: str, supervisord_conf: str, port: int = AGENT_PORT):
+    """上传代理并在 supervisord 配置中登记为 program，需要在 supervisord 启动前调用"""
+    with open(AGENT_SOURCE, "rb") as f:
+        sandbox.fs.upload_file(f.read(), AGENT_PATH)
+    program = (
+        "\n[program:atom-agent]\n"
+        f"command=python3 {AGENT_PATH} --port {port}\n"
+        f"environment=ATOM_AGENT_TOKEN=\"{token}\"\n"
+        "autorestart=true\n"
+        f"stdout_logfile={AGENT_LOG}\n"
+        "redirect_stderr=true\n"
+    )
+    conf = shlex.quote(supervisord_conf)
+    response = sandbox.process.exec(
+        f"grep -q '^\\[program:atom-agent\\]' {conf} || printf %s {shlex.quote(program)} >> {conf}"
+    )
+    if response.exit_code != 0:
+        raise RuntimeError(f"Failed to register agent with supervisord: {response.result}")
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != "health":
+        print(json.dumps({"error": "Usage: agent_client.py health <sandbox_id>"}), file=sys.stderr)
+        sys.exit(1)
+    client = connect_agent(sys.argv[2])
+    if client is None:
+        print(json.dumps({"success": False, "error": "Agent not enabled for this sandbox"}))
+        sys.exit(1)
+    healthy = client.health()
+    print(json.dumps({"success": healthy, "url": f"{'https' if client.https else 'http'}://{client.host}"}))
+    sys.exit(0 if healthy else 1)
+
+
+if __name__ == "__main__":
+    main()
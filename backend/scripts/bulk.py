@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+projects / project_states / messages / code_blobs 批量导入导出工具
+基于 COPY 流式传输，内存占用与数据量无关；每张表按主键切分为多个分块，
+所有表的分块交给同一个线程池并行处理（每个线程一个连接），中断后重新运行同一命令会从断点继续
+
+用法:
+  python3 scripts/bulk.py export --out dump/ [--project-id p1 --project-id p2] \\
+      [--since 2025-01-01] [--until 2025-06-01] [--format csv|binary] [--jobs 8]
+  python3 scripts/bulk.py import --in dump/ [--dsn postgresql://...] [--jobs 8]
+
+导出时所有工作连接共享同一个快照（pg_export_snapshot），保证分块之间、多张表之间一致；
+导入时每个分块在一个事务中完成，并在目标库的 bulk_import_progress 表中记录，保证不会重复导入。
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from db_connection import psycopg2, get_db_connection
+
+TABLES = ["projects", "project_states", "messages", "code_blobs"]
+
+# 每张表的项目过滤列和时间过滤列；code_blobs 按引用过滤，见 build_filter
+FILTER_COLUMNS = {
+    "projects": ("id", "updated_at"),
+    "project_states": ("project_id", "updated_at"),
+    "messages": ("project_id", "timestamp"),
+}
+# 分块使用的主键，未列出的表为 id
+KEY_COLUMNS = {"code_blobs": "sha256"}
+
+# 过滤后的 project_states / messages 引用的代码内容哈希（state.code_refs 和 artifact.content_refs）
+REFERENCED_BLOBS_SQL = """
+sha256 IN (
+  SELECT r.value FROM project_states s, jsonb_each_text(s.state -> 'code_refs') r WHERE {states_where}
+  UNION
+  SELECT r.value FROM messages m,
+    jsonb_array_elements(CASE WHEN jsonb_typeof(m.artifacts) = 'array' THEN m.artifacts ELSE '[]' END) a,
+    jsonb_each_text(a -> 'content_refs') r
+  WHERE {messages_where}
+)
+"""
+
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_FILE = "checkpoint.json"
+COPY_BUFFER_SIZE = 256 * 1024
+
+PROGRESS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS bulk_import_progress (
+  run_id TEXT NOT NULL,
+  chunk TEXT NOT NULL,
+  rows BIGINT,
+  imported_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (run_id, chunk)
+)
+"""
+
+
+def connection_factory(dsn: Optional[str]) -> Callable:
+    """返回创建新连接的函数：指定 --dsn 时直连，否则使用 Supabase 配置"""
+    def connect():
+        if dsn:
+            conn = psycopg2.connect(dsn)
+        else:
+            conn = get_db_connection()
+            if not conn:
+                raise RuntimeError("数据库连接失败")
+        conn.autocommit = False
+        return conn
+    return connect
+
+
+def build_filter(table: str, filters: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """根据项目/时间范围生成 WHERE 子句
+
+    code_blobs 没有项目和时间列：有过滤条件时只导出过滤后的状态和消息引用的内容，
+    否则导入后的库中会缺少 code_refs / content_refs 指向的文件内容。
+    """
+    if table == "code_blobs":
+        if not any(filters.get(key) for key in ("project_ids", "since", "until")):
+            return "TRUE", {}
+        states_where, params = build_filter("project_states", filters)
+        messages_where, _ = build_filter("messages", filters)
+        referenced = REFERENCED_BLOBS_SQL.format(states_where=states_where, messages_where=messages_where)
+        return f"TRUE AND {referenced.strip()}", params
+
+    project_column, time_column = FILTER_COLUMNS[table]
+    clauses = ["TRUE"]
+    params: Dict[str, Any] = {}
+    if filters.get("project_ids"):
+        clauses.append(f"{project_column} = ANY(%(project_ids)s)")
+        params["project_ids"] = filters["project_ids"]
+    if filters.get("since"):
+        clauses.append(f"{time_column} >= %(since)s")
+        params["since"] = filters["since"]
+    if filters.get("until"):
+        clauses.append(f"{time_column} < %(until)s")
+        params["until"] = filters["until"]
+    return " AND ".join(clauses), params
+
+
+class Checkpoint:
+    """已完成分块的记录，每次更新都原子地写回文件"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                self.done = set(json.load(f).get("done", []))
+
+    def mark(self, chunk: str):
+        with self.lock:
+            self.done.add(chunk)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"done": sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+
+class Manifest:
+    """导出计划：格式、过滤条件、每张表的列和分块边界"""
+
+    def __init__(self, path: Path, data: Dict[str, Any]):
+        self.path = path
+        self.data = data
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load_or_create(cls, out_dir: Path, fmt: str, filters: Dict[str, Any]) -> "Manifest":
+        path = out_dir / MANIFEST_FILE
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["format"] != fmt or data["filters"] != filters:
+                raise ValueError(f"{out_dir} 中已有不同参数的导出，请换一个目录或删除 {MANIFEST_FILE}")
+            return cls(path, data)
+        data = {
+            "run_id": f"{int(time.time())}-{os.getpid()}",
+            "format": fmt,
+            "filters": filters,
+            "tables": {},
+        }
+        manifest = cls(path, data)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        with self.lock:
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def set_table(self, table: str, plan: Dict[str, Any]):
+        with self.lock:
+            self.data["tables"][table] = plan
+        self.save()
+
+
+def chunk_file(table: str, index: int, fmt: str) -> str:
+    suffix = "csv.gz" if fmt == "csv" else "copy.gz"
+    return f"{table}.{index:05d}.{suffix}"
+
+
+def plan_table(cursor, table: str, filters: Dict[str, Any], chunk_rows: int, fmt: str) -> Dict[str, Any]:
+    """读取列名，并按主键每 chunk_rows 行取一个边界"""
+    cursor.execute(
+        """
+        SELECT a.attname
+        FROM pg_catalog.pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+        """,
+        (f"public.{table}",),
+    )
+    columns = [row[0] for row in cursor.fetchall()]
+
+    key = KEY_COLUMNS.get(table, "id")
+    where, params = build_filter(table, filters)
+    params["chunk_rows"] = chunk_rows
+    cursor.execute(
+        f"""
+        SELECT {key}::text FROM (
+          SELECT {key}, row_number() OVER (ORDER BY {key}) AS rn
+          FROM {table} WHERE {where}
+        ) s
+        WHERE mod(rn, %(chunk_rows)s) = 0
+        ORDER BY {key}
+        """,
+        params,
+    )
+    boundaries = [row[0] for row in cursor.fetchall()]
+    chunks = [chunk_file(table, i, fmt) for i in range(len(boundaries) + 1)]
+    return {"columns": columns, "key": key, "boundaries": boundaries, "chunks": chunks}
+
+
+def chunk_range(plan: Dict[str, Any], index: int) -> Tuple[str, Dict[str, Any]]:
+    """第 index 个分块的主键范围 (lower, upper]"""
+    key = plan.get("key", "id")
+    clauses = []
+    params = {}
+    if index > 0:
+        clauses.append(f"{key} > %(lower)s")
+        params["lower"] = plan["boundaries"][index - 1]
+    if index < len(plan["boundaries"]):
+        clauses.append(f"{key} <= %(upper)s")
+        params["upper"] = plan["boundaries"][index]
+    return (" AND ".join(clauses) or "TRUE"), params
+
+
+class ConnectionPool:
+    """每个工作线程一个连接，线程内的所有分块复用该连接
+
+    导出连接在第一次使用时开启 REPEATABLE READ 只读事务并导入共享快照，
+    之后该线程导出的所有分块都读同一时刻的数据。
+    """
+
+    def __init__(self, connect, snapshot: Optional[str] = None, readonly: bool = False):
+        self.connect = connect
+        self.snapshot = snapshot
+        self.readonly = readonly
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def get(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            with self.lock:
+                self.connections.append(conn)
+            if self.readonly:
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                if self.snapshot:
+                    cursor = conn.cursor()
+                    cursor.execute("SET TRANSACTION SNAPSHOT %s", (self.snapshot,))
+                    cursor.close()
+            self.local.conn = conn
+        return conn
+
+    def discard(self):
+        """出错后丢弃当前线程的连接（事务已中止），下一个分块重新连接"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            return
+        self.local.conn = None
+        with self.lock:
+            self.connections.remove(conn)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                try:
+                    conn.rollback()
+                    conn.close()
+                except psycopg2.Error:
+                    pass
+            self.connections = []
+
+
+def ensure_plan(pool: ConnectionPool, table: str, manifest: Manifest, chunk_rows: int) -> Dict[str, Any]:
+    """读取或生成一张表的分块计划"""
+    plan = manifest.data["tables"].get(table)
+    if plan is None:
+        cursor = pool.get().cursor()
+        try:
+            plan = plan_table(cursor, table, manifest.data["filters"], chunk_rows, manifest.data["format"])
+        finally:
+            cursor.close()
+        manifest.set_table(table, plan)
+    return plan
+
+
+def export_chunk(pool: ConnectionPool, table: str, plan: Dict[str, Any], index: int, manifest: Manifest,
+                 checkpoint: Checkpoint, out_dir: Path, compresslevel: int):
+    """在当前线程的连接上导出一个分块，完成后记录到断点文件"""
+    fmt = manifest.data["format"]
+    name = plan["chunks"][index]
+    where, filter_params = build_filter(table, manifest.data["filters"])
+    range_sql, range_params = chunk_range(plan, index)
+    options = "FORMAT csv" if fmt == "csv" else "FORMAT binary"
+    column_list = ", ".join(f'"{c}"' for c in plan["columns"])
+    key = plan.get("key", "id")
+
+    part = out_dir / f"{name}.part"
+    try:
+        cursor = pool.get().cursor()
+        try:
+            query = cursor.mogrify(
+                f"SELECT {column_list} FROM {table} WHERE {where} AND {range_sql} ORDER BY {key}",
+                {**filter_params, **range_params},
+            ).decode("utf-8")
+            with gzip.open(part, "wb", compresslevel=compresslevel) as f:
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH ({options})", f, size=COPY_BUFFER_SIZE)
+        finally:
+            cursor.close()
+    except Exception:
+        pool.discard()
+        raise
+    os.replace(part, out_dir / name)
+    checkpoint.mark(name)
+    print(f"  ✅ {table}: {name} ({index + 1}/{len(plan['chunks'])})")
+
+
+def run_chunks(jobs: int, tables, plan_for, chunk_task, verb: str) -> bool:
+    """先为每张表取得计划，再把所有表的未完成分块交给同一个线程池
+
+    plan_for(table) 返回计划，chunk_task(table, plan, index) 返回 False 表示分块已完成被跳过。
+    大表（messages）的分块与其它表的分块一起并行，--jobs 决定总并发数。
+    """
+    ok = True
+    counts = {table: 0 for table in tables}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        plans = {}
+        futures = {executor.submit(plan_for, table): table for table in tables}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                plans[table] = future.result()
+            except Exception as e:
+                print(f"  ❌ {table}: 生成分块计划失败: {e}")
+                ok = False
+
+        futures = {
+            executor.submit(chunk_task, table, plan, index): table
+            for table, plan in plans.items()
+            for index in range(len(plan["chunks"]))
+        }
+        failed = set()
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                if future.result() is not False:
+                    counts[table] += 1
+            except Exception as e:
+                if table not in failed:
+                    print(f"  ❌ {table}: {verb}失败，重新运行同一命令可从断点继续: {e}")
+                failed.add(table)
+                ok = False
+
+    for table in plans:
+        print(f"  📦 {table}: 本次{verb} {counts[table]} 个分块")
+    return ok
+
+
+def run_export(args) -> bool:
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    filters = {"project_ids": args.project_id or None, "since": args.since, "until": args.until}
+    manifest = Manifest.load_or_create(out_dir, args.format, filters)
+    checkpoint = Checkpoint(out_dir / CHECKPOINT_FILE)
+    connect = connection_factory(args.dsn)
+
+    # 协调连接导出快照，让所有工作连接看到同一时刻的数据
+    coordinator = None
+    snapshot = None
+    if not args.no_snapshot:
+        coordinator = connect()
+        coordinator.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cursor = coordinator.cursor()
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot = cursor.fetchone()[0]
+        cursor.close()
+
+    pool = ConnectionPool(connect, snapshot, readonly=True)
+
+    def export_task(table: str, plan: Dict[str, Any], index: int):
+        if plan["chunks"][index] in checkpoint.done:
+            return False
+        export_chunk(pool, table, plan, index, manifest, checkpoint, out_dir, args.compresslevel)
+
+    started = time.perf_counter()
+    try:
+        ok = run_chunks(args.jobs, args.tables,
+                        lambda table: ensure_plan(pool, table, manifest, args.chunk_rows), export_task, "导出")
+    finally:
+        pool.close()
+        if coordinator:
+            coordinator.rollback()
+            coordinator.close()
+
+    print(f"\n⏱️  导出耗时 {time.perf_counter() - started:.1f}s -> {out_dir}")
+    return ok
+
+
+def import_chunk(pool: ConnectionPool, table: str, plan: Dict[str, Any], index: int,
+                 manifest: Dict[str, Any], in_dir: Path):
+    """在当前线程的连接上导入一个分块，分块数据和进度记录在同一事务中提交"""
+    name = plan["chunks"][index]
+    path = in_dir / name
+    if not path.exists():
+        raise FileNotFoundError(f"缺少分块 {path}，请先完成导出")
+    options = "FORMAT csv" if manifest["format"] == "csv" else "FORMAT binary"
+    column_list = ", ".join(f'"{c}"' for c in plan["columns"])
+
+    conn = pool.get()
+    cursor = conn.cursor()
+    try:
+        with gzip.open(path, "rb") as f:
+            cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH ({options})", f, size=COPY_BUFFER_SIZE)
+        rows = cursor.rowcount
+        cursor.execute(
+            "INSERT INTO bulk_import_progress (run_id, chunk, rows) VALUES (%s, %s, %s)",
+            (manifest["run_id"], name, rows),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    print(f"  ✅ {table}: {name} ({index + 1}/{len(plan['chunks'])}, {rows} 行)")
+
+
+def run_import(args) -> bool:
+    in_dir = Path(args.in_dir)
+    with open(in_dir / MANIFEST_FILE, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    connect = connection_factory(args.dsn)
+
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(PROGRESS_TABLE_DDL)
+    cursor.execute("SELECT chunk FROM bulk_import_progress WHERE run_id = %s", (manifest["run_id"],))
+    done = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    pool = ConnectionPool(connect)
+
+    def import_task(table: str, plan: Dict[str, Any], index: int):
+        if plan["chunks"][index] in done:
+            return False
+        import_chunk(pool, table, plan, index, manifest, in_dir)
+
+    tables = [t for t in args.tables if t in manifest["tables"]]
+    started = time.perf_counter()
+    try:
+        ok = run_chunks(args.jobs, tables, lambda table: manifest["tables"][table], import_task, "导入")
+    finally:
+        pool.close()
+
+    print(f"\n⏱️  导入耗时 {time.perf_counter() - started:.1f}s")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于 COPY 的批量导入导出")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    p_export = subparsers.add_parser("export", help="导出到目录")
+    p_export.add_argument("--out", required=True)
+    p_export.add_argument("--project-id", action="append", help="只导出指定项目，可重复")
+    p_export.add_argument("--since", help="时间范围起点（含），ISO 格式")
+    p_export.add_argument("--until", help="时间范围终点（不含），ISO 格式")
+    p_export.add_argument("--format", choices=["csv", "binary"], default="csv")
+    p_export.add_argument("--chunk-rows", type=int, default=100_000, help="每个分块的行数")
+    p_export.add_argument("--compresslevel", type=int, default=1, help="gzip 压缩级别")
+    p_export.add_argument("--no-snapshot", action="store_true", help="不使用共享快照（连接池不支持时）")
+
+    p_import = subparsers.add_parser("import", help="从目录导入")
+    p_import.add_argument("--in", dest="in_dir", required=True)
+
+    for p in (p_export, p_import):
+        p.add_argument("--tables", nargs="+", choices=TABLES, default=TABLES)
+        p.add_argument("--jobs", type=int, default=8, help="并行连接数（所有表的分块共用）")
+        p.add_argument("--dsn", help="连接字符串，不指定时使用 Supabase 配置")
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🚚 批量{'导出' if args.action == 'export' else '导入'}")
+    print("=" * 60)
+
+    try:
+        success = run_export(args) if args.action == "export" else run_import(args)
+    except Exception as e:
+        print(f"❌ {e}")
+        success = False
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+代码内容寻址存储
+文件内容按 sha256 存入 code_blobs，project_states.state 和 messages.artifacts 中只保存引用:
+  state:     {"code": {path: content}}            -> {"code_refs": {path: sha256}}
+  artifacts: [{"type": "code", "content": {...}}] -> [{"type": "code", "content_refs": {path: sha256}}]
+
+用法:
+  python3 scripts/code_blobs.py backfill [--batch-size 500] [--dry-run]
+  python3 scripts/code_blobs.py show <project_id>
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+
+from db_connection import psycopg2, get_db_connection
+from psycopg2.extras import Json, execute_values
+
+# 主键类型，用于批量 UPDATE 时按索引匹配
+ID_TYPES = {"project_states": "uuid", "messages": "text"}
+
+CODE_BLOBS_DDL = """
+CREATE TABLE IF NOT EXISTS code_blobs (
+  sha256 TEXT PRIMARY KEY,
+  content TEXT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+)
+"""
+
+
+def hash_content(content: str) -> str:
+    """文件内容的 sha256（与 backend/src/lib/codeBlobs.ts 一致，按 UTF-8 编码）"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def json_size(value: Any) -> int:
+    """JSON 文本的字节数；改写前后、试运行和实际运行都按同一口径统计（不含 TOAST 压缩）"""
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def dehydrate_code(code: Dict[str, Any]) -> Tuple[Optional[Dict[str, str]], Dict[str, str]]:
+    """把代码映射拆成 (路径 -> 哈希, 哈希 -> 内容)；含有非字符串内容时返回 (None, {})，整份保持内联，
+    否则还原时会变成字符串"""
+    if not all(isinstance(content, str) for content in code.values()):
+        return None, {}
+    refs = {}
+    blobs = {}
+    for path, content in code.items():
+        digest = hash_content(content)
+        refs[path] = digest
+        blobs[digest] = content
+    return refs, blobs
+
+
+def store_blobs(cursor, blobs: Dict[str, str]) -> int:
+    """写入 code_blobs，已存在的跳过，返回新写入内容的字节数"""
+    if not blobs:
+        return 0
+    rows = execute_values(
+        cursor,
+        "INSERT INTO code_blobs (sha256, content) VALUES %s "
+        "ON CONFLICT (sha256) DO NOTHING RETURNING octet_length(content)",
+        list(blobs.items()),
+        fetch=True,
+    )
+    return sum(row[0] for row in rows)
+
+
+def rehydrate_code(cursor, refs: Dict[str, str]) -> Dict[str, str]:
+    """用一次 WHERE sha256 = ANY(...) 查询把引用还原为代码映射"""
+    if not refs:
+        return {}
+    cursor.execute(
+        "SELECT sha256, content FROM code_blobs WHERE sha256 = ANY(%s)",
+        (list(set(refs.values())),),
+    )
+    contents = dict(cursor.fetchall())
+    missing = [path for path, digest in refs.items() if digest not in contents]
+    if missing:
+        raise KeyError(f"code_blobs 中缺少文件内容: {', '.join(missing)}")
+    return {path: contents[digest] for path, digest in refs.items()}
+
+
+def dehydrate_state(state: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+    """state 中的 code 换成 code_refs，没有可转换内容时返回 None"""
+    if not isinstance(state, dict) or not isinstance(state.get("code"), dict):
+        return None, {}
+    refs, blobs = dehydrate_code(state["code"])
+    if refs is None:
+        return None, {}
+    new_state = {k: v for k, v in state.items() if k != "code"}
+    new_state["code_refs"] = refs
+    return new_state, blobs
+
+
+def dehydrate_artifacts(artifacts: List[Any]) -> Tuple[Optional[List[Any]], Dict[str, str]]:
+    """code 类型 artifact 的 content 换成 content_refs，没有可转换内容时返回 None"""
+    if not isinstance(artifacts, list):
+        return None, {}
+    changed = False
+    blobs: Dict[str, str] = {}
+    result = []
+    for artifact in artifacts:
+        if isinstance(artifact, dict) and artifact.get("type") == "code" and isinstance(artifact.get("content"), dict):
+            refs, artifact_blobs = dehydrate_code(artifact["content"])
+            if refs is None:
+                result.append(artifact)
+                continue
+            blobs.update(artifact_blobs)
+            artifact = {k: v for k, v in artifact.items() if k != "content"}
+            artifact["content_refs"] = refs
+            changed = True
+        result.append(artifact)
+    return (result if changed else None), blobs
+
+
+def _backfill_table(conn, table: str, column: str, dehydrate, batch_size: int, dry_run: bool) -> Dict[str, int]:
+    """按主键分批改写一张表，每批一个事务"""
+    stats = {"rows": 0, "before_bytes": 0, "after_bytes": 0, "blob_bytes": 0}
+    if table == "project_states":
+        candidate = "state ? 'code'"
+    else:
+        candidate = "artifacts @> '[{\"type\": \"code\"}]'"
+    last_id = None
+    cursor = conn.cursor()
+
+    while True:
+        keyset = "TRUE" if last_id is None else "id > %(last_id)s"
+        cursor.execute(
+            f"""
+            SELECT id::text, {column}
+            FROM {table}
+            WHERE {keyset} AND {candidate}
+            ORDER BY id
+            LIMIT %(limit)s
+            """,
+            {"last_id": last_id, "limit": batch_size},
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        batch_blobs: Dict[str, str] = {}
+        for row_id, value in rows:
+            new_value, blobs = dehydrate(value)
+            if new_value is None:
+                continue
+            updates.append((row_id, Json(new_value)))
+            batch_blobs.update(blobs)
+            stats["before_bytes"] += json_size(value)
+            stats["after_bytes"] += json_size(new_value)
+
+        if updates and not dry_run:
+            stats["blob_bytes"] += store_blobs(cursor, batch_blobs)
+            execute_values(
+                cursor,
+                f"UPDATE {table} AS t SET {column} = v.value::jsonb FROM (VALUES %s) AS v(id, value) "
+                f"WHERE t.id = v.id::{ID_TYPES[table]}",
+                updates,
+            )
+        elif updates:
+            stats["blob_bytes"] += sum(len(c.encode("utf-8")) for c in batch_blobs.values())
+        conn.commit()
+        stats["rows"] += len(updates)
+        print(f"  ✅ {table}: 已处理 {stats['rows']} 行")
+
+    cursor.close()
+    return stats
+
+
+def backfill(conn, batch_size: int, dry_run: bool) -> bool:
+    """把已有的 state.code 和 code artifacts 改写为哈希引用，并报告节省的空间"""
+    conn.autocommit = False
+    cursor = conn.cursor()
+    cursor.execute(CODE_BLOBS_DDL)
+    conn.commit()
+    cursor.close()
+
+    total = {"before_bytes": 0, "after_bytes": 0, "blob_bytes": 0}
+    for table, column, dehydrate in (
+        ("project_states", "state", dehydrate_state),
+        ("messages", "artifacts", dehydrate_artifacts),
+    ):
+        stats = _backfill_table(conn, table, column, dehydrate, batch_size, dry_run)
+        for key in total:
+            total[key] += stats[key]
+        print(
+            f"  📦 {table}: {stats['rows']} 行, {stats['before_bytes'] / 1024 / 1024:.1f}MB -> "
+            f"{stats['after_bytes'] / 1024 / 1024:.1f}MB"
+        )
+
+    reclaimed = total["before_bytes"] - total["after_bytes"] - total["blob_bytes"]
+    print(f"\n📊 新增 code_blobs: {total['blob_bytes'] / 1024 / 1024:.1f}MB")
+    print(f"📊 净节省: {reclaimed / 1024 / 1024:.1f}MB{'（试运行，未写入）' if dry_run else ''}")
+    if not dry_run:
+        print("💡 运行 VACUUM (ANALYZE) project_states, messages 以复用释放的空间")
+    return True
+
+
+def show(conn, project_id: str):
+    """打印某个项目最新状态还原后的代码文件"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT state FROM project_states WHERE project_id = %s ORDER BY updated_at DESC LIMIT 1",
+        (project_id,),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        print(f"❌ 项目 {project_id} 没有保存的状态")
+        return
+    state = row[0]
+    code = rehydrate_code(cursor, state["code_refs"]) if "code_refs" in state else state.get("code", {})
+    cursor.close()
+    for path, content in sorted(code.items()):
+        print(f"  📄 {path} ({len(content)} 字符)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代码内容寻址存储")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    p_backfill = subparsers.add_parser("backfill", help="把已有数据改写为哈希引用")
+    p_backfill.add_argument("--batch-size", type=int, default=500)
+    p_backfill.add_argument("--dry-run", action="store_true", help="只统计，不写入")
+
+    p_show = subparsers.add_parser("show", help="还原并列出项目的代码文件")
+    p_show.add_argument("project_id")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        if args.action == "backfill":
+            success = backfill(conn, args.batch_size, args.dry_run)
+        else:
+            show(conn, args.project_id)
+            success = True
+    except (psycopg2.Error, KeyError) as e:
+        print(f"❌ {e}")
+        success = False
+    finally:
+        conn.close()
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+沙盒命令日志的有界读取
+命令输出重定向到沙盒内的日志文件，读取时在沙盒内用 head/tail 截取，
+只传回 head_bytes + tail_bytes 字节，中间部分用标记代替（环形缓冲区语义）。
+每次读取返回 next_offset，下次从该字节偏移继续读取增量；命令结束后 exit_code 不再为 None。
+"""
+
+import base64
+import gzip
+import shlex
+from typing import Dict, Any, Optional
+
+LOG_DIR = "/tmp/atom-logs"
+DEFAULT_HEAD_BYTES = 4 * 1024
+DEFAULT_TAIL_BYTES = 60 * 1024
+ENCODINGS = ("text", "gzip+base64")
+
+
+def log_path(log_id: str) -> str:
+    return f"{LOG_DIR}/{log_id}.log"
+
+
+def exit_path(log_id: str) -> str:
+    return f"{LOG_DIR}/{log_id}.exit"
+
+
+def redirect_command(command: str, log_id: str) -> str:
+    """把命令的 stdout/stderr 写入日志文件，结束后把退出码写入 .exit 文件，退出码保持为原命令的退出码
+
+    命令在子 shell 中执行，其中的 exit 不会跳过退出码的记录。
+    结尾用 (exit $rc) 设置退出码而不是 exit，在 Daytona 会话这类常驻 shell 中执行时不会退出会话。
+    """
+    path = shlex.quote(log_path(log_id))
+    done = shlex.quote(exit_path(log_id))
+    return f"mkdir -p {LOG_DIR} && ( {command} ) > {path} 2>&1; rc=$?; echo $rc > {done}; (exit $rc)"
+
+
+def build_read_script(log_id: str, offset: int = 0, head_bytes: int = DEFAULT_HEAD_BYTES,
+                      tail_bytes: int = DEFAULT_TAIL_BYTES) -> str:
+    """生成在沙盒内执行的读取脚本
+
+    输出四行：退出码（运行中为空）、文件大小、头部（base64）、尾部（base64）。
+    退出码先于大小读取，读到退出码时日志已写完；大小在开头固定下来，
+    之后的截取都以该大小为界，命令仍在写日志时游标也保持一致。
+    """
+    path = shlex.quote(log_path(log_id))
+    done = shlex.quote(exit_path(log_id))
+    limit = head_bytes + tail_bytes
+    return (
+        f"cat {done} 2>/dev/null | tr -d '\\n'; echo; "
+        f"f={path}; off={int(offset)}; "
+        f"size=$(wc -c < $f 2>/dev/null || echo 0); size=$((size)); echo $size; "
+        f"[ $off -gt $size ] && off=$size; avail=$((size - off)); "
+        f"if [ $avail -le {limit} ]; then "
+        f"head -c $size $f 2>/dev/null | tail -c +$((off + 1)) | base64 | tr -d '\\n'; echo; echo; "
+        f"else "
+        f"head -c $size $f | tail -c +$((off + 1)) | head -c {int(head_bytes)} | base64 | tr -d '\\n'; echo; "
+        f"head -c $size $f | tail -c {int(tail_bytes)} | base64 | tr -d '\\n'; echo; "
+        f"fi"
+    )
+
+
+def parse_read_output(output: str, offset: int = 0, head_bytes: int = DEFAULT_HEAD_BYTES,
+                      tail_bytes: int = DEFAULT_TAIL_BYTES) -> Dict[str, Any]:
+    """把读取脚本的输出组装为 {output, offset, next_offset, size, truncated_bytes, exit_code}"""
+    lines = (output or "").split("\n")
+    lines += [""] * (4 - len(lines))
+    exit_code = int(lines[0].strip()) if lines[0].strip() else None
+    size = int(lines[1].strip() or 0)
+    head = base64.b64decode(lines[2].strip())
+    tail = base64.b64decode(lines[3].strip())
+    return assemble_log(size, offset, head, tail, exit_code)
+
+
+def assemble_log(size: int, offset: int, head: bytes, tail: bytes, exit_code: Optional[int] = None) -> Dict[str, Any]:
+    """由文件大小和头尾两段组装读取结果，中间被丢弃的部分替换为截断标记"""
+    offset = min(offset, size)
+    truncated = max(0, size - offset - len(head) - len(tail))
+    data = head
+    if tail:
+        data += f"\n... [truncated {truncated} bytes] ...\n".encode("utf-8") + tail
+
+    return {
+        "output": data.decode("utf-8", errors="replace"),
+        "offset": offset,
+        "next_offset": size,
+        "size": size,
+        "truncated_bytes": truncated,
+        "exit_code": exit_code,
+    }
+
+
+def encode_output(result: Dict[str, Any], encoding: Optional[str] = "text") -> Dict[str, Any]:
+    """可选把 output 压缩为 gzip+base64，减小经 stdout 传给 Node 的数据量"""
+    if encoding not in (None, "text", "gzip+base64"):
+        raise ValueError(f"Unknown log encoding: {encoding} (expected {' or '.join(ENCODINGS)})")
+    if encoding == "gzip+base64":
+        raw = result["output"].encode("utf-8")
+        result = dict(result)
+        result["output"] = base64.b64encode(gzip.compress(raw)).decode("ascii")
+        result["encoding"] = "gzip+base64"
+    else:
+        result = dict(result, encoding="text")
+    return result
+
+
+def read_command_log(sandbox, log_id: str, offset: int = 0, head_bytes: int = DEFAULT_HEAD_BYTES,
+                     tail_bytes: int = DEFAULT_TAIL_BYTES) -> Dict[str, Any]:
+    """在沙盒内截取日志，只传回有界的头尾两段"""
+    script = build_read_script(log_id, offset, head_bytes, tail_bytes)
+    response = sandbox.process.exec(f"sh -c {shlex.quote(script)}")
+    return parse_read_output(response.result, offset, head_bytes, tail_bytes)
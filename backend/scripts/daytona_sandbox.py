@@ -4,10 +4,14 @@ Daytona 沙盒服务 Python 脚本
 从 Node.js/TypeScript 调用此脚本来管理 Daytona 沙盒
 """
 
+import base64
 import json
+import sqlite3
 import sys
 import os
-from typing import Dict, Any, Optional
+import time
+import uuid
+from typing import Callable, Dict, Any, Iterator, List, Optional
 
 # 修复 macOS SSL 证书问题
 try:
@@ -29,6 +33,7 @@ try:
         Resources,
         SandboxState,
         SessionExecuteRequest,
+        VolumeMount,
     )
 except ImportError:
     print(json.dumps({
@@ -36,12 +41,86 @@ except ImportError:
     }), file=sys.stderr)
     sys.exit(1)
 
+from agent_client import (
+    AGENT_PORT,
+    AgentSandbox,
+    AgentUnavailable,
+    agent_token,
+    connect_agent,
+    forget_agent,
+    install_agent,
+    mark_unavailable,
+    register_agent,
+)
+from command_logs import (
+    DEFAULT_HEAD_BYTES,
+    DEFAULT_TAIL_BYTES,
+    assemble_log,
+    encode_output,
+    read_command_log,
+    redirect_command,
+)
+from delta_sync import sync_file
+from sandbox_sizing import (
+    MeasurementStore,
+    choose_profile,
+    command_peak_mb,
+    dependency_fingerprint,
+    measurement_kind,
+)
+from target_selection import Route, TargetRouter, candidates_from_env
+from web_server import FREE_PORT_COMMAND, start_command, startup_seconds
 
-def get_daytona_client() -> Daytona:
-    """初始化 Daytona 客户端"""
+
+def _resolve_route(sandbox_id: Optional[str]) -> Route:
+    """已有沙盒使用创建时的 target，新沙盒使用延迟最低的健康 target"""
+    candidates = candidates_from_env()
+    if len(candidates) == 1:
+        return candidates[0]
+    try:
+        router = TargetRouter(candidates)
+        try:
+            if sandbox_id:
+                return router.home(sandbox_id, locate=lambda route: _sandbox_exists(sandbox_id, route))
+            return router.choose()
+        finally:
+            router.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Failed to read target ranking: {e}", file=sys.stderr)
+        return candidates[0]
+
+
+def _sandbox_exists(sandbox_id: str, route: Route) -> bool:
+    """沙盒是否在 route 对应的 target 上，用于查找其它主机创建的沙盒"""
+    try:
+        get_daytona_client(route=route).get(sandbox_id)
+        return True
+    except Exception:
+        return False
+
+
+def _remember_route(sandbox_id: str, route: Optional[Route]):
+    """登记或（route 为 None 时）注销沙盒所在的 target"""
+    candidates = candidates_from_env()
+    if len(candidates) == 1:
+        return
+    try:
+        router = TargetRouter(candidates)
+        try:
+            if route:
+                router.remember(sandbox_id, route)
+            else:
+                router.forget(sandbox_id)
+        finally:
+            router.close()
+    except Exception as e:
+        print(f"Warning: Failed to update sandbox route: {e}", file=sys.stderr)
+
+
+def get_daytona_client(sandbox_id: Optional[str] = None, route: Optional[Route] = None) -> Daytona:
+    """初始化 Daytona 客户端，按 route 或沙盒所在 target 路由"""
     api_key = os.getenv('DAYTONA_API_KEY')
-    server_url = os.getenv('DAYTONA_SERVER_URL', 'https://app.daytona.io/api')
-    target = os.getenv('DAYTONA_TARGET', 'us')
+    target, server_url = route or _resolve_route(sandbox_id)
     
     if not api_key:
         raise ValueError("DAYTONA_API_KEY environment variable is required")
@@ -65,10 +144,118 @@ def get_daytona_client() -> Daytona:
     return Daytona(config)
 
 
-def create_sandbox(password: str = "123456", project_id: Optional[str] = None) -> Dict[str, Any]:
-    """创建新的 Daytona 沙盒"""
+# 快照卷挂载点，每个项目一个卷，保存依赖和构建缓存的 tar 包
+SNAPSHOT_ROOT = "/snapshots"
+SNAPSHOT_VOLUME_PREFIX = "atom-snapshots-"
+# 快照只包含依赖和构建缓存（相对 /workspace），源码由每次部署重新写入，
+# 这样 fork 后不会残留新代码中已删除的文件
+SNAPSHOT_PATHS = ["node_modules", ".next/cache", ".cache", ".parcel-cache"]
+# 每个项目保留的快照数量
+SNAPSHOT_RETENTION = int(os.getenv('DAYTONA_SNAPSHOT_RETENTION', '3'))
+SUPERVISORD_CONF = "/etc/supervisor/conf.d/supervisord.conf"
+# 创建沙盒时是否启动沙盒内代理（文件/命令操作优先经由代理）
+AGENT_ENABLED = os.getenv('DAYTONA_SANDBOX_AGENT', 'false').lower() == 'true'
+
+
+def _try_agent(sandbox_id: str, operation: Callable[[Any], Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """优先通过沙盒内代理执行；未启用或不可达时返回 None，由调用方退回 Daytona API"""
+    client = connect_agent(sandbox_id)
+    if client is None:
+        return None
+    try:
+        return operation(client)
+    except AgentUnavailable as e:
+        print(f"Warning: Sandbox agent unavailable, falling back to API: {e}", file=sys.stderr)
+        mark_unavailable(sandbox_id)
+        return None
+
+
+def _get_started_sandbox(daytona: Daytona, sandbox_id: str):
+    """获取沙盒，已停止或归档时先启动"""
+    sandbox = daytona.get(sandbox_id)
+    if sandbox.state == SandboxState.ARCHIVED or sandbox.state == SandboxState.STOPPED:
+        daytona.start(sandbox)
+        sandbox = daytona.get(sandbox_id)
+    return sandbox
+
+
+def _snapshot_volume_mounts(daytona: Daytona, project_id: str, timeout: int = 60) -> List[VolumeMount]:
+    """获取（必要时创建）项目的快照卷，等待其可挂载"""
+    name = f"{SNAPSHOT_VOLUME_PREFIX}{project_id}"
+    volume = daytona.volume.get(name, create=True)
+    waited = 0
+    while volume.state != "ready":
+        if waited >= timeout or volume.state == "error":
+            raise RuntimeError(f"Snapshot volume {name} is not ready: {volume.state}")
+        time.sleep(2)
+        waited += 2
+        volume = daytona.volume.get(name)
+    return [VolumeMount(volume_id=volume.id, mount_path=SNAPSHOT_ROOT)]
+
+
+def _peak_memory_mb(sandbox) -> Optional[float]:
+    """读取整个沙盒 cgroup 的内存峰值（MB，自沙盒启动起累计），兼容 cgroup v2 / v1"""
+    try:
+        response = sandbox.process.exec(
+            "cat /sys/fs/cgroup/memory.peak 2>/dev/null || cat /sys/fs/cgroup/memory/memory.max_usage_in_bytes"
+        )
+        return int(response.result.strip()) / 1024 / 1024
+    except Exception:
+        return None
+
+
+def _peak_before(sandbox, command: str) -> Optional[float]:
+    """安装/构建命令执行前的沙盒内存峰值，其他命令不读取"""
+    return _peak_memory_mb(sandbox) if measurement_kind(command) else None
+
+
+def _record_measurement(sandbox, sandbox_id: str, command: str, duration_s: float, exit_code: Optional[int],
+                        peak_before_mb: Optional[float]):
+    """记录安装/构建命令的耗时和命令期间的沙盒内存峰值，供下次创建沙盒时选型"""
+    kind = measurement_kind(command)
+    if kind is None:
+        return
+    try:
+        store = MeasurementStore()
+        try:
+            info = store.sandbox_info(sandbox_id)
+            if info:
+                fingerprint, tier = info
+                peak = command_peak_mb(peak_before_mb, _peak_memory_mb(sandbox))
+                store.record(fingerprint, tier, kind, duration_s, peak, exit_code)
+        finally:
+            store.close()
+    except Exception as e:
+        print(f"Warning: Failed to record measurement: {e}", file=sys.stderr)
+
+
+def create_sandbox(password: str = "123456", project_id: Optional[str] = None,
+                   profile: Optional[str] = None, package_json: Optional[str] = None,
+                   agent: Optional[bool] = None) -> Dict[str, Any]:
+    """创建新的 Daytona 沙盒，profile 为 auto 或具体档位（见 sandbox_sizing.PROFILES）
+
+    agent 为 True（默认取 DAYTONA_SANDBOX_AGENT）时在 supervisord 中启动沙盒内代理。
+    """
     try:
-        daytona = get_daytona_client()
+        route = _resolve_route(None)
+        daytona = get_daytona_client(route=route)
+
+        # 根据依赖指纹和历史测量选择资源档位
+        fingerprint = dependency_fingerprint(package_json) if package_json else None
+        store = MeasurementStore()
+        try:
+            sizing = choose_profile(package_json, fingerprint, store, profile)
+        finally:
+            store.close()
+
+        # 挂载项目快照卷，失败时仍然创建沙盒（只是无法快照/恢复）
+        volumes = None
+        if project_id:
+            try:
+                volumes = _snapshot_volume_mounts(daytona, project_id)
+            except Exception as e:
+                print(f"Warning: Failed to prepare snapshot volume: {e}", file=sys.stderr)
+
         sandbox_image = os.getenv('DAYTONA_SANDBOX_IMAGE', 'whitezxj/sandbox:0.1.0')
         
         # 根据文档，使用 CreateSandboxFromImageParams 创建沙盒
@@ -94,17 +281,39 @@ def create_sandbox(password: str = "123456", project_id: Optional[str] = None) -
                 "CHROME_CDP": "",
             },
             resources=Resources(
-                cpu=1,      # 减少 CPU 核心
-                memory=2,   # 减少到 2GB 内存
-                disk=3,     # 减少磁盘空间
+                cpu=sizing["cpu"],
+                memory=sizing["memory"],
+                disk=sizing["disk"],
             ),
             auto_stop_interval=15,
             auto_archive_interval=24 * 60,
+            volumes=volumes,
         )
         
         # 使用 daytona.create() 创建沙盒
         sandbox = daytona.create(params)
+        _remember_route(sandbox.id, route)
+
+        if fingerprint:
+            try:
+                store = MeasurementStore()
+                try:
+                    store.register_sandbox(sandbox.id, fingerprint, sizing["tier"])
+                finally:
+                    store.close()
+            except Exception as e:
+                print(f"Warning: Failed to register sandbox sizing: {e}", file=sys.stderr)
         
+        # 代理需要在 supervisord 启动前登记到配置中
+        agent_installed = False
+        use_agent = AGENT_ENABLED if agent is None else agent
+        if use_agent:
+            try:
+                install_agent(sandbox, agent_token(sandbox.id), SUPERVISORD_CONF)
+                agent_installed = True
+            except Exception as e:
+                print(f"Warning: Failed to install sandbox agent: {e}", file=sys.stderr)
+
         # 启动 supervisord（如果需要）
         try:
             session_id = "supervisord-session"
@@ -112,7 +321,7 @@ def create_sandbox(password: str = "123456", project_id: Optional[str] = None) -
             sandbox.process.execute_session_command(
                 session_id,
                 SessionExecuteRequest(
-                    command="exec /usr/bin/supervisord -n -c /etc/supervisor/conf.d/supervisord.conf",
+                    command=f"exec /usr/bin/supervisord -n -c {SUPERVISORD_CONF}",
                     run_async=True,  # 使用 run_async 替代已废弃的 var_async
                 ),
             )
@@ -131,12 +340,24 @@ def create_sandbox(password: str = "123456", project_id: Optional[str] = None) -
             # 如果获取预览链接失败，使用默认值
             vnc_url = f"https://6080-{sandbox.id}.daytona.work"
             website_url = f"https://8080-{sandbox.id}.daytona.work"
+
+        if agent_installed:
+            try:
+                agent_link = sandbox.get_preview_link(AGENT_PORT)
+                register_agent(sandbox.id, agent_link.url, getattr(agent_link, "token", None))
+            except Exception as e:
+                agent_installed = False
+                print(f"Warning: Failed to register sandbox agent: {e}", file=sys.stderr)
         
         return {
             "success": True,
             "sandbox_id": sandbox.id,
             "vnc_url": vnc_url,
             "website_url": website_url,
+            "snapshot_volume": volumes is not None,
+            "profile": sizing,
+            "target": route[0],
+            "agent": agent_installed,
         }
     except Exception as e:
         import traceback
@@ -164,7 +385,11 @@ def write_file_stdin(sandbox_id: str, file_path: str) -> Dict[str, Any]:
 def write_file(sandbox_id: str, file_path: str, content: str) -> Dict[str, Any]:
     """在沙盒中写入文件"""
     try:
-        daytona = get_daytona_client()
+        via_agent = _try_agent(sandbox_id, lambda client: _write_via_agent(client, file_path, content))
+        if via_agent is not None:
+            return via_agent
+
+        daytona = get_daytona_client(sandbox_id)
         sandbox = daytona.get(sandbox_id)
         
         # 确保沙盒运行中
@@ -191,10 +416,109 @@ def write_file(sandbox_id: str, file_path: str, content: str) -> Dict[str, Any]:
         }
 
 
-def run_command(sandbox_id: str, command: str, blocking: bool = False, timeout: int = 60) -> Dict[str, Any]:
-    """在沙盒中执行命令"""
+def _write_via_agent(client, file_path: str, content: str) -> Dict[str, Any]:
+    file_path = file_path.lstrip('/')
+    AgentSandbox(client).fs.upload_file(content.encode('utf-8'), f"/workspace/{file_path}")
+    return {
+        "success": True,
+        "message": f"File {file_path} written successfully",
+        "via": "agent",
+    }
+
+
+def write_files(sandbox_id: str, files: Dict[str, str]) -> Dict[str, Any]:
+    """批量写入沙盒文件：经由代理时所有写入在一个 /batch 中完成，否则复用同一个沙盒逐个增量上传"""
     try:
-        daytona = get_daytona_client()
+        paths = {file_path.lstrip('/'): content.encode('utf-8') for file_path, content in files.items()}
+        via_agent = _try_agent(sandbox_id, lambda client: _write_files_via_agent(client, paths))
+        if via_agent is not None:
+            return via_agent
+
+        daytona = get_daytona_client(sandbox_id)
+        sandbox = _get_started_sandbox(daytona, sandbox_id)
+        sent = 0
+        for file_path, data in paths.items():
+            sent += sync_file(sandbox, f"/workspace/{file_path}", data)["sent_bytes"]
+
+        return {
+            "success": True,
+            "message": f"{len(paths)} files written successfully",
+            "files": len(paths),
+            "sent_bytes": sent,
+        }
+    except Exception as e:
+        import traceback
+        return {
+            "success": False,
+            "error": f"{str(e)}\n{traceback.format_exc()}",
+        }
+
+
+def _write_files_via_agent(client, paths: Dict[str, bytes]) -> Dict[str, Any]:
+    ops = [
+        {"op": "write", "path": f"/workspace/{file_path}", "data": base64.b64encode(data).decode("ascii")}
+        for file_path, data in paths.items()
+    ]
+    if ops:
+        client.batch(ops, parallel=True)
+    return {
+        "success": True,
+        "message": f"{len(paths)} files written successfully",
+        "files": len(paths),
+        "sent_bytes": sum(len(data) for data in paths.values()),
+        "via": "agent",
+    }
+
+
+def patch_file(sandbox_id: str, file_path: str, content: str) -> Dict[str, Any]:
+    """增量写入沙盒文件：远端已有旧版本时只传输不同的块，否则完整上传"""
+    try:
+        file_path = file_path.lstrip('/')
+        full_path = f"/workspace/{file_path}"
+        data = content.encode('utf-8')
+        result = _try_agent(sandbox_id, lambda client: dict(sync_file(AgentSandbox(client), full_path, data), via="agent"))
+        if result is None:
+            daytona = get_daytona_client(sandbox_id)
+            sandbox = _get_started_sandbox(daytona, sandbox_id)
+            result = sync_file(sandbox, full_path, data)
+
+        return {
+            "success": True,
+            "message": f"File {file_path} written successfully ({result['mode']})",
+            **result,
+        }
+    except Exception as e:
+        import traceback
+        return {
+            "success": False,
+            "error": f"{str(e)}\n{traceback.format_exc()}",
+        }
+
+
+def run_command(sandbox_id: str, command: str, blocking: bool = False, timeout: int = 60,
+                tail_bytes: int = DEFAULT_TAIL_BYTES, head_bytes: int = DEFAULT_HEAD_BYTES,
+                encoding: str = "text") -> Dict[str, Any]:
+    """在沙盒中执行命令
+
+    输出写入沙盒内的日志文件；阻塞命令只返回头 head_bytes、尾 tail_bytes 字节，
+    完整日志可以用 get_command_logs 按 log_id 和字节偏移增量读取。
+    """
+    try:
+        # 如果命令不是以 sh -c 开头，自动包装
+        if not command.startswith('sh -c') and not command.startswith('/bin/sh'):
+            command = f"sh -c '{command.replace(chr(39), chr(39)+chr(39)+chr(39))}'"
+        log_id = uuid.uuid4().hex[:12]
+
+        via_agent = _try_agent(
+            sandbox_id,
+            lambda client: _run_command_via_agent(
+                client, sandbox_id, command, log_id, blocking, timeout, tail_bytes, head_bytes, encoding
+            ),
+        )
+        if via_agent is not None:
+            return via_agent
+
+        daytona = get_daytona_client(sandbox_id)
         sandbox = daytona.get(sandbox_id)
         
         # 确保沙盒运行中
@@ -203,10 +527,6 @@ def run_command(sandbox_id: str, command: str, blocking: bool = False, timeout:
             sandbox = daytona.get(sandbox_id)
         
         # 使用 session 执行命令（shell 命令）
-        # 如果命令不是以 sh -c 开头，自动包装
-        if not command.startswith('sh -c') and not command.startswith('/bin/sh'):
-            command = f"sh -c '{command.replace(chr(39), chr(39)+chr(39)+chr(39))}'"
-        
         session_id = f"cmd-{sandbox_id[:8]}"
         try:
             sandbox.process.create_session(session_id)
@@ -214,11 +534,13 @@ def run_command(sandbox_id: str, command: str, blocking: bool = False, timeout:
             pass  # Session might already exist
         
         req = SessionExecuteRequest(
-            command=command,
+            command=redirect_command(command, log_id),
             run_async=not blocking,
             cwd="/workspace",
         )
         
+        peak_before = _peak_before(sandbox, command) if blocking else None
+        started = time.monotonic()
         response = sandbox.process.execute_session_command(
             session_id=session_id,
             req=req,
@@ -226,50 +548,21 @@ def run_command(sandbox_id: str, command: str, blocking: bool = False, timeout:
         )
         
         if blocking:
-            # 等待命令完成并获取日志
-            import time
-            max_wait = timeout
-            waited = 0
-            while waited < max_wait:
-                try:
-                    logs = sandbox.process.get_session_command_logs(
-                        session_id=session_id,
-                        command_id=response.cmd_id,
-                    )
-                    # 检查命令是否完成（通过检查 exit_code 或日志）
-                    if response.exit_code is not None or (logs and len(logs) > 0):
-                        return {
-                            "success": True,
-                            "output": logs or "",
-                            "exit_code": response.exit_code or 0,
-                        }
-                except:
-                    pass
-                time.sleep(1)
-                waited += 1
-            
-            # 超时后返回当前日志
-            try:
-                logs = sandbox.process.get_session_command_logs(
-                    session_id=session_id,
-                    command_id=response.cmd_id,
-                )
-                return {
-                    "success": True,
-                    "output": logs or "",
-                    "exit_code": response.exit_code or 0,
-                }
-            except:
-                return {
-                    "success": True,
-                    "output": "",
-                    "exit_code": response.exit_code or 0,
-                }
+            _record_measurement(sandbox, sandbox_id, command, time.monotonic() - started, response.exit_code,
+                                peak_before)
+            log = read_command_log(sandbox, log_id, 0, head_bytes, tail_bytes)
+            return {
+                "success": True,
+                **encode_output(log, encoding),
+                "exit_code": response.exit_code or 0,
+                "log_id": log_id,
+            }
         else:
             return {
                 "success": True,
                 "command_id": response.cmd_id,
                 "session_id": session_id,
+                "log_id": log_id,
                 "message": "Command started (non-blocking)",
             }
     except Exception as e:
@@ -280,13 +573,222 @@ def run_command(sandbox_id: str, command: str, blocking: bool = False, timeout:
         }
 
 
+def _run_command_via_agent(client, sandbox_id: str, command: str, log_id: str, blocking: bool, timeout: int,
+                           tail_bytes: int, head_bytes: int, encoding: str) -> Dict[str, Any]:
+    """经由代理执行；阻塞命令的执行和日志读取在同一批次中完成，只需一次请求"""
+    exec_op = {"op": "exec", "cmd": redirect_command(command, log_id), "cwd": "/workspace"}
+    if not blocking:
+        client.call(dict(exec_op, background=True))
+        return {
+            "success": True,
+            "log_id": log_id,
+            "message": "Command started (non-blocking)",
+            "via": "agent",
+        }
+
+    peak_before = _peak_before(AgentSandbox(client), command)
+    started = time.monotonic()
+    ran, tail = client.batch([
+        dict(exec_op, timeout=timeout),
+        {"op": "tail", "log_id": log_id, "offset": 0, "head": head_bytes, "tail": tail_bytes},
+    ])
+    if ran.get("timed_out"):
+        raise TimeoutError(f"Command timed out after {timeout}s")
+    _record_measurement(AgentSandbox(client), sandbox_id, command, time.monotonic() - started, ran["exit_code"],
+                        peak_before)
+    log = _agent_log(tail, 0)
+    return {
+        "success": True,
+        **encode_output(log, encoding),
+        "exit_code": ran["exit_code"] or 0,
+        "log_id": log_id,
+        "via": "agent",
+    }
+
+
+def _agent_log(tail: Dict[str, Any], offset: int) -> Dict[str, Any]:
+    return assemble_log(
+        tail["size"], offset, base64.b64decode(tail["head"]), base64.b64decode(tail["tail"]), tail["exit_code"]
+    )
+
+
+def get_command_logs(sandbox_id: str, log_id: str, offset: int = 0,
+                     tail_bytes: int = DEFAULT_TAIL_BYTES, head_bytes: int = DEFAULT_HEAD_BYTES,
+                     encoding: str = "text") -> Dict[str, Any]:
+    """从字节偏移 offset 读取命令日志的增量，超出 head_bytes + tail_bytes 的中间部分被截断"""
+    try:
+        tail_op = {"op": "tail", "log_id": log_id, "offset": offset, "head": head_bytes, "tail": tail_bytes}
+        log = _try_agent(sandbox_id, lambda client: _agent_log(client.call(tail_op), offset))
+        if log is None:
+            daytona = get_daytona_client(sandbox_id)
+            sandbox = _get_started_sandbox(daytona, sandbox_id)
+            log = read_command_log(sandbox, log_id, offset, head_bytes, tail_bytes)
+        return {
+            "success": True,
+            **encode_output(log, encoding),
+            "log_id": log_id,
+        }
+    except Exception as e:
+        import traceback
+        return {
+            "success": False,
+            "error": f"{str(e)}\n{traceback.format_exc()}",
+        }
+
+
+def follow_command_logs(sandbox_id: str, log_id: str, offset: int = 0, timeout: int = 600,
+                        poll_interval: float = 2.0) -> Iterator[Dict[str, Any]]:
+    """持续产出命令日志的增量直到命令结束
+
+    启用代理时由代理在同一个连接上推送新日志；否则退回 Daytona API 按 poll_interval 轮询。
+    每个增量为 {output, offset, next_offset}，最后一项额外带 exit_code（超时时为 None）。
+    """
+    client = connect_agent(sandbox_id)
+    if client is not None:
+        try:
+            for event in client.stream([{"op": "tail", "log_id": log_id, "offset": offset,
+                                         "follow": True, "timeout": timeout}]):
+                if event["event"] == "log":
+                    yield {
+                        "output": base64.b64decode(event["data"]).decode("utf-8", errors="replace"),
+                        "offset": event["offset"],
+                        "next_offset": event["next_offset"],
+                    }
+                elif event["event"] == "result":
+                    if not event.get("ok"):
+                        raise RuntimeError(event.get("error"))
+                    yield {"output": "", "offset": event["next_offset"], "next_offset": event["next_offset"],
+                           "exit_code": event["exit_code"]}
+            return
+        except AgentUnavailable as e:
+            print(f"Warning: Sandbox agent unavailable, falling back to API: {e}", file=sys.stderr)
+            mark_unavailable(sandbox_id)
+
+    daytona = get_daytona_client(sandbox_id)
+    sandbox = _get_started_sandbox(daytona, sandbox_id)
+    deadline = time.monotonic() + timeout
+    while True:
+        log = read_command_log(sandbox, log_id, offset)
+        done = log["exit_code"] is not None or time.monotonic() > deadline
+        if log["output"] or done:
+            chunk = {"output": log["output"], "offset": log["offset"], "next_offset": log["next_offset"]}
+            yield dict(chunk, exit_code=log["exit_code"]) if done else chunk
+        if done:
+            return
+        offset = log["next_offset"]
+        time.sleep(poll_interval)
+
+
+def start_web_server(sandbox_id: str, package_json: Optional[str] = None) -> Dict[str, Any]:
+    """清理 8080 端口并在后台启动 Web 服务（命令见 web_server.py），返回启动命令的 log_id 和需要等待的秒数"""
+    freed = run_command(sandbox_id, FREE_PORT_COMMAND, True, 15)
+    if not freed.get("success"):
+        # 没有进程占用端口时也可能失败，继续启动
+        print(f"Warning: Failed to free port: {freed.get('error')}", file=sys.stderr)
+
+    command = start_command(package_json)
+    started = run_command(sandbox_id, command, False)
+    if not started.get("success"):
+        return started
+    return {
+        "success": True,
+        "command": command,
+        "log_id": started.get("log_id"),
+        "wait_seconds": startup_seconds(package_json),
+    }
+
+
+def snapshot_sandbox(sandbox_id: str, project_id: str) -> Dict[str, Any]:
+    """把安装好的依赖和构建缓存（SNAPSHOT_PATHS）打包到项目快照卷，按依赖指纹命名"""
+    try:
+        daytona = get_daytona_client(sandbox_id)
+        sandbox = _get_started_sandbox(daytona, sandbox_id)
+
+        check = sandbox.process.exec(f"test -d {SNAPSHOT_ROOT}")
+        if check.exit_code != 0:
+            return {
+                "success": False,
+                "error": f"Sandbox {sandbox_id} has no snapshot volume mounted at {SNAPSHOT_ROOT}",
+            }
+
+        package_json = sandbox.fs.download_file("/workspace/package.json").decode('utf-8')
+        fingerprint = dependency_fingerprint(package_json)
+        # deps 标记只含依赖的快照，旧版本打包整个 /workspace 的快照不会被 fork 恢复
+        name = f"{fingerprint}-deps-{int(time.time())}.tar.gz"
+        target = f"{SNAPSHOT_ROOT}/{name}"
+
+        # 先写临时文件再 mv，fork 不会读到写了一半的包；tar 退出码 1 表示打包时有文件变化，可以接受
+        command = (
+            f"cd /workspace && paths=$(ls -d {' '.join(SNAPSHOT_PATHS)} 2>/dev/null) ; "
+            f"[ -n \"$paths\" ] || {{ echo no node_modules to snapshot ; exit 4 ; }} ; "
+            f"tar -czf {target}.tmp $paths ; rc=$? ; "
+            f"if [ $rc -le 1 ]; then mv {target}.tmp {target}; else rm -f {target}.tmp; exit $rc; fi ; "
+            f"ls -1t {SNAPSHOT_ROOT}/*.tar.gz | tail -n +{SNAPSHOT_RETENTION + 1} | xargs -r rm -f"
+        )
+        response = sandbox.process.exec(f"sh -c '{command}'", timeout=600)
+        if response.exit_code != 0:
+            return {
+                "success": False,
+                "error": f"Snapshot failed (exit {response.exit_code}): {response.result}",
+            }
+
+        return {
+            "success": True,
+            "project_id": project_id,
+            "fingerprint": fingerprint,
+            "snapshot": name,
+        }
+    except Exception as e:
+        import traceback
+        return {
+            "success": False,
+            "error": f"{str(e)}\n{traceback.format_exc()}",
+        }
+
+
+def fork_sandbox(password: str, project_id: str, package_json: str,
+                 profile: Optional[str] = None) -> Dict[str, Any]:
+    """创建新沙盒，并从依赖指纹相同的最新快照恢复依赖和构建缓存"""
+    result = create_sandbox(password, project_id, profile, package_json)
+    if not result.get("success"):
+        return result
+
+    result["restored"] = False
+    if not result.get("snapshot_volume"):
+        return result
+
+    fingerprint = dependency_fingerprint(package_json)
+    try:
+        daytona = get_daytona_client(result["sandbox_id"])
+        sandbox = daytona.get(result["sandbox_id"])
+        command = (
+            f"snap=$(ls -1t {SNAPSHOT_ROOT}/{fingerprint}-deps-*.tar.gz 2>/dev/null | head -n 1) ; "
+            f"[ -n \"$snap\" ] || exit 3 ; "
+            f"mkdir -p /workspace && tar -xzf \"$snap\" -C /workspace && basename \"$snap\""
+        )
+        response = sandbox.process.exec(f"sh -c '{command}'", timeout=600)
+        if response.exit_code == 0:
+            result["restored"] = True
+            result["snapshot"] = response.result.strip()
+        elif response.exit_code != 3:
+            print(f"Warning: Failed to restore snapshot: {response.result}", file=sys.stderr)
+    except Exception as e:
+        # 恢复失败时返回一个全新的沙盒，调用方会重新安装依赖
+        print(f"Warning: Failed to restore snapshot: {e}", file=sys.stderr)
+
+    result["fingerprint"] = fingerprint
+    return result
+
+
 def delete_sandbox(sandbox_id: str) -> Dict[str, Any]:
     """删除沙盒"""
     try:
-        daytona = get_daytona_client()
+        daytona = get_daytona_client(sandbox_id)
         sandbox = daytona.get(sandbox_id)
         # 根据文档，使用 sandbox.delete()
         sandbox.delete()
+        _remember_route(sandbox_id, None)
+        forget_agent(sandbox_id)
         return {
             "success": True,
             "message": f"Sandbox {sandbox_id} deleted",
@@ -299,6 +801,43 @@ def delete_sandbox(sandbox_id: str) -> Dict[str, Any]:
         }
 
 
+def delete_project_snapshots(project_id: str) -> Dict[str, Any]:
+    """删除项目的快照卷；卷仍被沙盒挂载时先删除项目的沙盒（按 labels.id 查找，遍历所有 target）"""
+    name = f"{SNAPSHOT_VOLUME_PREFIX}{project_id}"
+    deleted_sandboxes = []
+    deleted_volumes = 0
+    errors = []
+    for route in candidates_from_env():
+        try:
+            daytona = get_daytona_client(route=route)
+            for sandbox in daytona.list(labels={"id": project_id}):
+                sandbox.delete()
+                _remember_route(sandbox.id, None)
+                forget_agent(sandbox.id)
+                deleted_sandboxes.append(sandbox.id)
+            try:
+                volume = daytona.volume.get(name)
+            except Exception:
+                continue  # 该 target 上没有这个项目的卷
+            daytona.volume.delete(volume)
+            deleted_volumes += 1
+        except Exception as e:
+            errors.append(f"{route[0]}: {e}")
+
+    if errors:
+        return {
+            "success": False,
+            "error": f"Failed to delete snapshot volume {name}: {'; '.join(errors)}",
+            "deleted_sandboxes": deleted_sandboxes,
+        }
+    return {
+        "success": True,
+        "volume": name,
+        "deleted_volumes": deleted_volumes,
+        "deleted_sandboxes": deleted_sandboxes,
+    }
+
+
 def main():
     """主函数：处理命令行参数"""
     if len(sys.argv) < 2:
@@ -313,7 +852,10 @@ def main():
         if action == "create":
             password = sys.argv[2] if len(sys.argv) > 2 else "123456"
             project_id = sys.argv[3] if len(sys.argv) > 3 else None
-            result = create_sandbox(password, project_id)
+            profile = sys.argv[4] if len(sys.argv) > 4 else None
+            # package.json 可选，通过 stdin 传入，用于按依赖选择资源档位
+            package_json = None if sys.stdin.isatty() else (sys.stdin.read() or None)
+            result = create_sandbox(password, project_id, profile, package_json)
             print(json.dumps(result))
         
         elif action == "write_file":
@@ -339,19 +881,103 @@ def main():
             result = write_file_stdin(sandbox_id, file_path)
             print(json.dumps(result))
         
+        elif action == "write_files":
+            if len(sys.argv) < 3:
+                print(json.dumps({
+                    "error": "Usage: write_files <sandbox_id> (JSON {path: content} via stdin)"
+                }), file=sys.stderr)
+                sys.exit(1)
+            result = write_files(sys.argv[2], json.loads(sys.stdin.read()))
+            print(json.dumps(result))
+
+        elif action == "patch":
+            if len(sys.argv) < 4:
+                print(json.dumps({
+                    "error": "Usage: patch <sandbox_id> <file_path> (content via stdin)"
+                }), file=sys.stderr)
+                sys.exit(1)
+            result = patch_file(sys.argv[2], sys.argv[3], sys.stdin.read())
+            print(json.dumps(result))
+
         elif action == "run_command":
             if len(sys.argv) < 4:
                 print(json.dumps({
-                    "error": "Usage: run_command <sandbox_id> <command> [blocking] [timeout]"
+                    "error": "Usage: run_command <sandbox_id> <command> [blocking] [timeout] [tail_bytes] [head_bytes] [encoding]"
                 }), file=sys.stderr)
                 sys.exit(1)
             sandbox_id = sys.argv[2]
             command = sys.argv[3]
             blocking = sys.argv[4].lower() == "true" if len(sys.argv) > 4 else False
             timeout = int(sys.argv[5]) if len(sys.argv) > 5 else 60
-            result = run_command(sandbox_id, command, blocking, timeout)
+            tail_bytes = int(sys.argv[6]) if len(sys.argv) > 6 else DEFAULT_TAIL_BYTES
+            head_bytes = int(sys.argv[7]) if len(sys.argv) > 7 else DEFAULT_HEAD_BYTES
+            encoding = sys.argv[8] if len(sys.argv) > 8 else "text"
+            result = run_command(sandbox_id, command, blocking, timeout, tail_bytes, head_bytes, encoding)
             print(json.dumps(result))
         
+        elif action == "logs":
+            if len(sys.argv) < 4:
+                print(json.dumps({
+                    "error": "Usage: logs <sandbox_id> <log_id> [offset] [tail_bytes] [head_bytes] [encoding]"
+                }), file=sys.stderr)
+                sys.exit(1)
+            offset = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+            tail_bytes = int(sys.argv[5]) if len(sys.argv) > 5 else DEFAULT_TAIL_BYTES
+            head_bytes = int(sys.argv[6]) if len(sys.argv) > 6 else DEFAULT_HEAD_BYTES
+            encoding = sys.argv[7] if len(sys.argv) > 7 else "text"
+            result = get_command_logs(sys.argv[2], sys.argv[3], offset, tail_bytes, head_bytes, encoding)
+            print(json.dumps(result))
+        
+        elif action == "follow":
+            if len(sys.argv) < 4:
+                print(json.dumps({
+                    "error": "Usage: follow <sandbox_id> <log_id> [offset] [timeout]"
+                }), file=sys.stderr)
+                sys.exit(1)
+            offset = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+            timeout = int(sys.argv[5]) if len(sys.argv) > 5 else 600
+            # 每个增量输出一行 JSON，日志到达即输出
+            for chunk in follow_command_logs(sys.argv[2], sys.argv[3], offset, timeout):
+                print(json.dumps(chunk), flush=True)
+
+        elif action == "start_server":
+            if len(sys.argv) < 3:
+                print(json.dumps({
+                    "error": "Usage: start_server <sandbox_id> (package.json via stdin, optional)"
+                }), file=sys.stderr)
+                sys.exit(1)
+            package_json = None if sys.stdin.isatty() else (sys.stdin.read() or None)
+            result = start_web_server(sys.argv[2], package_json)
+            print(json.dumps(result))
+
+        elif action == "snapshot":
+            if len(sys.argv) < 4:
+                print(json.dumps({
+                    "error": "Usage: snapshot <sandbox_id> <project_id>"
+                }), file=sys.stderr)
+                sys.exit(1)
+            result = snapshot_sandbox(sys.argv[2], sys.argv[3])
+            print(json.dumps(result))
+
+        elif action == "fork":
+            if len(sys.argv) < 4:
+                print(json.dumps({
+                    "error": "Usage: fork <password> <project_id> [profile] (package.json via stdin)"
+                }), file=sys.stderr)
+                sys.exit(1)
+            profile = sys.argv[4] if len(sys.argv) > 4 else None
+            result = fork_sandbox(sys.argv[2], sys.argv[3], sys.stdin.read(), profile)
+            print(json.dumps(result))
+
+        elif action == "delete_project":
+            if len(sys.argv) < 3:
+                print(json.dumps({
+                    "error": "Usage: delete_project <project_id>"
+                }), file=sys.stderr)
+                sys.exit(1)
+            result = delete_project_snapshots(sys.argv[2])
+            print(json.dumps(result))
+
         elif action == "delete":
             if len(sys.argv) < 3:
                 print(json.dumps({
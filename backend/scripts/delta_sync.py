@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+沙盒文件增量上传（rsync 风格块差异）
+1. 沙盒内一条命令计算远端文件的块签名（adler32 弱校验 + md5 强校验）
+2. 本地用滚动校验和在新内容中查找相同的块，只保留不同的部分
+3. 上传差异文件，沙盒内重建到临时文件、校验 sha256 后原子替换
+差异不比完整文件小（或远端文件不存在、校验失败）时退回完整上传。
+"""
+
+import hashlib
+import json
+import math
+import shlex
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+# 小于该大小的文件直接完整上传，增量需要 3 次往返，小文件不划算
+PATCH_MIN_BYTES = 64 * 1024
+ADLER_MOD = 65521
+
+# 沙盒内执行：argv = [path, block_size]，输出远端文件的块签名
+SIGNATURE_SCRIPT = """
+import hashlib, json, sys, zlib
+path, bs = sys.argv[1], int(sys.argv[2])
+try:
+    with open(path, 'rb') as f:
+        data = f.read()
+except OSError:
+    print(json.dumps({'exists': False}))
+    sys.exit(0)
+full = len(data) - len(data) % bs
+blocks = [[zlib.adler32(data[i:i + bs]), hashlib.md5(data[i:i + bs]).hexdigest()] for i in range(0, full, bs)]
+print(json.dumps({'exists': True, 'size': len(data), 'block_size': bs,
+                  'sha256': hashlib.sha256(data).hexdigest(), 'blocks': blocks}))
+"""
+
+# 沙盒内执行：argv = [path, delta_path]，按差异重建文件，校验后原子替换
+APPLY_SCRIPT = """
+import hashlib, json, os, shutil, sys
+path, delta_path = sys.argv[1], sys.argv[2]
+with open(delta_path, 'rb') as f:
+    header, _, literals = f.read().partition(b'\\n')
+os.remove(delta_path)
+h = json.loads(header)
+bs = h['block_size']
+with open(path, 'rb') as f:
+    old = f.read()
+if hashlib.sha256(old).hexdigest() != h['base_sha256']:
+    print('base changed')
+    sys.exit(3)
+out = bytearray()
+for kind, start, length in h['ops']:
+    out += old[start * bs:(start + length) * bs] if kind == 0 else literals[start:start + length]
+if hashlib.sha256(out).hexdigest() != h['sha256']:
+    print('checksum mismatch')
+    sys.exit(2)
+tmp = path + '.atom-patch'
+with open(tmp, 'wb') as f:
+    f.write(out)
+shutil.copymode(path, tmp)
+os.replace(tmp, path)
+"""
+
+# 操作类型：复制远端第 start 块起的 length 块 / 取差异数据中 start 起的 length 字节
+COPY, LITERAL = 0, 1
+
+
+def block_size_for(size: int) -> int:
+    """块大小取 sqrt(size)，按 512 对齐，限制在 1KB ~ 64KB"""
+    return max(1024, min(64 * 1024, int(math.sqrt(size)) // 512 * 512))
+
+
+def compute_delta(new: bytes, block_size: int, blocks: List[List[Any]],
+                  max_literal: Optional[int] = None) -> Optional[Tuple[List[List[int]], bytes]]:
+    """在 new 中查找远端已有的块，返回 (ops, literals)
+
+    只有未匹配区域需要逐字节滚动，一次局部修改的代价约为一个块大小。
+    未匹配数据超过 max_literal 时提前返回 None（增量不会更小）。
+    """
+    table: Dict[int, List[Tuple[int, str]]] = {}
+    for index, (weak, strong) in enumerate(blocks):
+        table.setdefault(weak, []).append((index, strong))
+
+    ops: List[List[int]] = []
+    literals = bytearray()
+    n, bs = len(new), block_size
+    p = pending = 0
+    weak = None
+    a = b = 0
+
+    def flush(end: int):
+        if end > pending:
+            ops.append([LITERAL, len(literals), end - pending])
+            literals.extend(new[pending:end])
+
+    while p + bs <= n:
+        if weak is None:
+            weak = zlib.adler32(new[p:p + bs])
+            a, b = weak & 0xffff, weak >> 16
+        candidates = table.get(weak)
+        if candidates:
+            strong = hashlib.md5(new[p:p + bs]).hexdigest()
+            index = next((i for i, s in candidates if s == strong), None)
+            if index is not None:
+                flush(p)
+                last = ops[-1] if ops else None
+                if last and last[0] == COPY and last[1] + last[2] == index:
+                    last[2] += 1
+                else:
+                    ops.append([COPY, index, 1])
+                p += bs
+                pending = p
+                weak = None
+                continue
+
+        if max_literal is not None and len(literals) + (p - pending) > max_literal:
+            return None
+        if p + bs < n:
+            # 滚动 adler32：移出 new[p]，移入 new[p + bs]
+            out_byte, in_byte = new[p], new[p + bs]
+            a = (a - out_byte + in_byte) % ADLER_MOD
+            b = (b - bs * out_byte + a - 1) % ADLER_MOD
+            weak = a | (b << 16)
+        p += 1
+
+    flush(n)
+    if max_literal is not None and len(literals) > max_literal:
+        return None
+    return ops, bytes(literals)
+
+
+def encode_delta(ops: List[List[int]], literals: bytes, block_size: int, base_sha256: str, new: bytes) -> bytes:
+    """差异文件：一行 JSON 头 + 拼接的差异数据"""
+    header = {
+        "block_size": block_size,
+        "base_sha256": base_sha256,
+        "sha256": hashlib.sha256(new).hexdigest(),
+        "ops": ops,
+    }
+    return json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n" + literals
+
+
+def plan_patch(new: bytes, signature: Dict[str, Any]) -> Optional[bytes]:
+    """根据远端签名生成差异文件；远端不存在或差异不比完整文件小时返回 None"""
+    if not signature.get("exists"):
+        return None
+    bs = signature["block_size"]
+    result = compute_delta(new, bs, signature["blocks"], max_literal=len(new))
+    if result is None:
+        return None
+    delta = encode_delta(result[0], result[1], bs, signature["sha256"], new)
+    return delta if len(delta) < len(new) else None
+
+
+def sync_file(sandbox, full_path: str, content: bytes) -> Dict[str, Any]:
+    """增量上传 content 到沙盒的 full_path，必要时退回完整上传"""
+    mode = "full"
+    sent = 0
+    if len(content) >= PATCH_MIN_BYTES:
+        bs = block_size_for(len(content))
+        response = sandbox.process.exec(
+            f"python3 -c {shlex.quote(SIGNATURE_SCRIPT)} {shlex.quote(full_path)} {bs}"
+        )
+        delta = None
+        if response.exit_code == 0:
+            try:
+                delta = plan_patch(content, json.loads(response.result))
+            except (ValueError, KeyError, TypeError):
+                # 签名输出被截断或混入其他输出时按没有签名处理，退回完整上传
+                delta = None
+        if delta is not None:
+            delta_path = f"/tmp/atom-delta-{hashlib.sha256(delta).hexdigest()[:12]}"
+            sandbox.fs.upload_file(delta, delta_path)
+            sent += len(delta)
+            applied = sandbox.process.exec(
+                f"python3 -c {shlex.quote(APPLY_SCRIPT)} {shlex.quote(full_path)} {delta_path}"
+            )
+            if applied.exit_code == 0:
+                mode = "delta"
+
+    if mode == "full":
+        sandbox.fs.upload_file(content, full_path)
+        sent += len(content)
+
+    return {"mode": mode, "sent_bytes": sent, "file_bytes": len(content)}
@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+沙盒部署任务队列
+Node 端把部署任务写入队列，由本脚本的 worker 在有界线程池中执行（创建/fork 沙盒、写文件、安装依赖、启动服务）。
+
+- 公平调度：按 "该用户运行中的任务数 + 任务在该用户队列中的序号" 排序，多个用户的任务轮流执行
+- 并发上限：全局（DEPLOY_MAX_CONCURRENCY，跨所有 worker）和每个用户（DEPLOY_MAX_PER_USER）
+- 背压：队列已满时拒绝入队，并根据近期任务耗时给出 retry_after 秒数
+- 指标：队列深度、运行中任务数、最早任务的等待时间、近期等待时间的平均值和 p95
+
+队列后端（DEPLOY_QUEUE_BACKEND）:
+  sqlite    本地 SQLite（默认，DEPLOY_QUEUE_DB 指定路径），Node 和 worker 在同一台机器上时使用
+  postgres  Supabase PostgreSQL，多个 worker 通过 FOR UPDATE SKIP LOCKED 认领任务
+
+用法:
+  python3 scripts/deploy_queue.py enqueue <user_id> <project_id> < payload.json
+  python3 scripts/deploy_queue.py status <job_id>
+  python3 scripts/deploy_queue.py stats
+  python3 scripts/deploy_queue.py worker [--concurrency 4] [--once]
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Any, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+QUEUE_BACKEND = os.getenv('DEPLOY_QUEUE_BACKEND', 'sqlite')
+QUEUE_DB = os.getenv('DEPLOY_QUEUE_DB', os.path.join(SCRIPT_DIR, '..', '.cache', 'deploy-queue.sqlite3'))
+
+MAX_CONCURRENCY = int(os.getenv('DEPLOY_MAX_CONCURRENCY', '4'))
+MAX_PER_USER = int(os.getenv('DEPLOY_MAX_PER_USER', '1'))
+MAX_QUEUE_DEPTH = int(os.getenv('DEPLOY_MAX_QUEUE_DEPTH', '50'))
+MAX_QUEUED_PER_USER = int(os.getenv('DEPLOY_MAX_QUEUED_PER_USER', '3'))
+MAX_ATTEMPTS = 3
+# 任务租约（秒），worker 在任务执行期间定期续约；超过后视为 worker 已退出，任务重新入队
+JOB_LEASE = int(os.getenv('DEPLOY_JOB_LEASE', '120'))
+# 每个租约周期内的续约次数
+HEARTBEATS_PER_LEASE = 3
+# 快照在部署结果返回后于独立线程池中执行，不占用部署并发槽位
+SNAPSHOT_CONCURRENCY = int(os.getenv('DEPLOY_SNAPSHOT_CONCURRENCY', '2'))
+# 没有历史数据时假设的单个任务耗时（秒）
+DEFAULT_JOB_SECONDS = 60
+# 统计等待时间的近期任务数
+METRICS_WINDOW = 100
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS deploy_jobs (
+      id TEXT PRIMARY KEY,
+      user_id TEXT NOT NULL,
+      project_id TEXT,
+      payload TEXT NOT NULL,
+      status TEXT NOT NULL DEFAULT 'queued',
+      attempts INTEGER NOT NULL DEFAULT 0,
+      result TEXT,
+      error TEXT,
+      created_at DOUBLE PRECISION NOT NULL,
+      available_at DOUBLE PRECISION NOT NULL,
+      started_at DOUBLE PRECISION,
+      finished_at DOUBLE PRECISION,
+      lease_until DOUBLE PRECISION
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_deploy_jobs_status ON deploy_jobs(status, available_at)",
+    "CREATE INDEX IF NOT EXISTS idx_deploy_jobs_user ON deploy_jobs(user_id, status)",
+]
+
+# 公平排序：每个用户的第 k 个排队任务的轮次为 (运行中任务数 + k)，轮次相同按入队时间
+RANKED_JOBS = """
+WITH running AS (
+  SELECT user_id, COUNT(*) AS n FROM deploy_jobs WHERE status = 'running' GROUP BY user_id
+), ranked AS (
+  SELECT j.id,
+         COALESCE(r.n, 0) + ROW_NUMBER() OVER (PARTITION BY j.user_id ORDER BY j.created_at) AS turn,
+         j.created_at
+  FROM deploy_jobs j LEFT JOIN running r ON r.user_id = j.user_id
+  WHERE j.status = 'queued' AND j.available_at <= %(now)s AND COALESCE(r.n, 0) < %(per_user)s
+)
+"""
+
+JOB_COLUMNS = "id, user_id, project_id, payload, status, attempts, result, error, created_at, started_at, finished_at"
+
+# complete / fail / heartbeat 只对认领时的那一次执行生效：任务租约过期被重新入队或再次认领后，
+# status 或 attempts 已经变化，原 worker 的迟到结果不会覆盖新的执行
+OWNED_JOB = "id = %s AND status = 'running' AND attempts = %s"
+
+
+class QueueFull(Exception):
+    """队列已满，调用方应在 retry_after 秒后重试"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """部署任务队列，SQL 使用 %s / %(name)s 占位符，SQLite 后端执行前转换"""
+
+    def __init__(self, conn, clock: Callable[[], float] = time.time):
+        self.conn = conn
+        self.clock = clock
+        cursor = self.conn.cursor()
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        self._commit()
+
+    # 由后端实现
+    def _execute(self, sql: str, params=None):
+        raise NotImplementedError
+
+    def _begin(self):
+        raise NotImplementedError
+
+    def _commit(self):
+        self.conn.commit()
+
+    def _rollback(self):
+        self.conn.rollback()
+
+    def _lock_claim(self):
+        """串行化认领，保证全局并发检查和认领是原子的"""
+
+    def _claim_candidate(self, now: float, per_user: int) -> Optional[str]:
+        raise NotImplementedError
+
+    def close(self):
+        self.conn.close()
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip([c.strip() for c in JOB_COLUMNS.split(",")], row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _avg_job_seconds(self) -> float:
+        row = self._execute(
+            "SELECT AVG(finished_at - started_at) FROM ("
+            "  SELECT finished_at, started_at FROM deploy_jobs WHERE status = 'succeeded'"
+            "  ORDER BY finished_at DESC LIMIT %s"
+            ") recent",
+            (METRICS_WINDOW,),
+        ).fetchone()
+        return row[0] or DEFAULT_JOB_SECONDS
+
+    def enqueue(self, user_id: str, project_id: Optional[str], payload: Dict[str, Any],
+                max_depth: int = MAX_QUEUE_DEPTH, max_per_user: int = MAX_QUEUED_PER_USER,
+                concurrency: int = MAX_CONCURRENCY) -> Dict[str, Any]:
+        """入队；队列或该用户的排队数已满时抛出 QueueFull"""
+        self._begin()
+        try:
+            depth, user_depth = self._execute(
+                "SELECT COUNT(*), COALESCE(SUM(CASE WHEN user_id = %s THEN 1 ELSE 0 END), 0) "
+                "FROM deploy_jobs WHERE status = 'queued'",
+                (user_id,),
+            ).fetchone()
+            if depth >= max_depth or user_depth >= max_per_user:
+                # 估算一个运行槽位空出来的时间；用户自己排满时需要等自己的任务执行完
+                waves = 1 if depth >= max_depth else user_depth
+                retry_after = max(1, math.ceil(self._avg_job_seconds() * waves / max(1, concurrency)))
+                scope = "queue" if depth >= max_depth else f"user {user_id}"
+                raise QueueFull(f"Deploy queue full for {scope} ({depth} queued)", retry_after)
+
+            now = self.clock()
+            job_id = uuid.uuid4().hex
+            self._execute(
+                "INSERT INTO deploy_jobs (id, user_id, project_id, payload, created_at, available_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                (job_id, user_id, project_id, json.dumps(payload), now, now),
+            )
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return {"job_id": job_id, "position": depth + 1}
+
+    def claim(self, concurrency: int = MAX_CONCURRENCY, per_user: int = MAX_PER_USER,
+              lease: int = JOB_LEASE) -> Optional[Dict[str, Any]]:
+        """按公平顺序认领一个任务；全局运行数已达上限或没有可运行任务时返回 None"""
+        self._begin()
+        try:
+            self._lock_claim()
+            running = self._execute("SELECT COUNT(*) FROM deploy_jobs WHERE status = 'running'").fetchone()[0]
+            if running >= concurrency:
+                self._commit()
+                return None
+
+            now = self.clock()
+            job_id = self._claim_candidate(now, per_user)
+            if job_id is None:
+                self._commit()
+                return None
+
+            self._execute(
+                "UPDATE deploy_jobs SET status = 'running', attempts = attempts + 1, "
+                "started_at = %s, lease_until = %s WHERE id = %s",
+                (now, now + lease, job_id),
+            )
+            row = self._execute(f"SELECT {JOB_COLUMNS} FROM deploy_jobs WHERE id = %s", (job_id,)).fetchone()
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return self._row_to_job(row)
+
+    def complete(self, job: Dict[str, Any], result: Dict[str, Any]) -> bool:
+        """标记认领的任务成功，任务已不归本次执行所有时返回 False"""
+        self._begin()
+        cursor = self._execute(
+            "UPDATE deploy_jobs SET status = 'succeeded', result = %s, finished_at = %s, lease_until = NULL "
+            f"WHERE {OWNED_JOB}",
+            (json.dumps(result), self.clock(), job["id"], job["attempts"]),
+        )
+        self._commit()
+        return cursor.rowcount == 1
+
+    def fail(self, job: Dict[str, Any], error: str, max_attempts: int = MAX_ATTEMPTS) -> bool:
+        """失败的任务在达到重试次数前按指数退避重新入队，任务已不归本次执行所有时返回 False"""
+        attempts = job["attempts"]
+        now = self.clock()
+        self._begin()
+        if attempts < max_attempts:
+            cursor = self._execute(
+                "UPDATE deploy_jobs SET status = 'queued', error = %s, available_at = %s, lease_until = NULL "
+                f"WHERE {OWNED_JOB}",
+                (error, now + 30 * 2 ** (attempts - 1), job["id"], attempts),
+            )
+        else:
+            cursor = self._execute(
+                "UPDATE deploy_jobs SET status = 'failed', error = %s, finished_at = %s, lease_until = NULL "
+                f"WHERE {OWNED_JOB}",
+                (error, now, job["id"], attempts),
+            )
+        self._commit()
+        return cursor.rowcount == 1
+
+    def heartbeat(self, jobs, lease: int = JOB_LEASE) -> int:
+        """延长认领的任务的租约，返回续约的任务数；worker 崩溃后不再续约，租约到期由 requeue_expired 回收"""
+        jobs = list(jobs)
+        if not jobs:
+            return 0
+        self._begin()
+        owned = " OR ".join([f"({OWNED_JOB})"] * len(jobs))
+        cursor = self._execute(
+            f"UPDATE deploy_jobs SET lease_until = %s WHERE {owned}",
+            (self.clock() + lease, *(value for job in jobs for value in (job["id"], job["attempts"]))),
+        )
+        self._commit()
+        return cursor.rowcount
+
+    def requeue_expired(self) -> int:
+        """租约过期的运行中任务（worker 崩溃）重新入队"""
+        self._begin()
+        now = self.clock()
+        cursor = self._execute(
+            "UPDATE deploy_jobs SET status = 'queued', available_at = %s, lease_until = NULL "
+            "WHERE status = 'running' AND lease_until < %s",
+            (now, now),
+        )
+        self._commit()
+        return cursor.rowcount
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务状态；排队中的任务附带当前位置"""
+        row = self._execute(f"SELECT {JOB_COLUMNS} FROM deploy_jobs WHERE id = %s", (job_id,)).fetchone()
+        if row is None:
+            self._commit()
+            return None
+        job = self._row_to_job(row)
+        if job["status"] == "queued":
+            job["position"] = self._execute(
+                "SELECT COUNT(*) FROM deploy_jobs WHERE status = 'queued' AND created_at <= %s",
+                (job["created_at"],),
+            ).fetchone()[0]
+        self._commit()
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、运行数和等待时间"""
+        now = self.clock()
+        depth, running, oldest = self._execute(
+            "SELECT COALESCE(SUM(CASE WHEN status = 'queued' THEN 1 ELSE 0 END), 0), "
+            "COALESCE(SUM(CASE WHEN status = 'running' THEN 1 ELSE 0 END), 0), "
+            "MIN(CASE WHEN status = 'queued' THEN created_at END) "
+            "FROM deploy_jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()
+        per_user = self._execute(
+            "SELECT user_id, "
+            "SUM(CASE WHEN status = 'queued' THEN 1 ELSE 0 END), "
+            "SUM(CASE WHEN status = 'running' THEN 1 ELSE 0 END) "
+            "FROM deploy_jobs WHERE status IN ('queued', 'running') GROUP BY user_id"
+        ).fetchall()
+        waits = sorted(
+            row[0] for row in self._execute(
+                "SELECT started_at - created_at FROM deploy_jobs WHERE started_at IS NOT NULL "
+                "ORDER BY started_at DESC LIMIT %s",
+                (METRICS_WINDOW,),
+            ).fetchall()
+        )
+        self._commit()
+        return {
+            "depth": int(depth),
+            "running": int(running),
+            "oldest_wait_s": round(now - oldest, 1) if oldest else 0.0,
+            "wait_avg_s": round(sum(waits) / len(waits), 1) if waits else 0.0,
+            "wait_p95_s": round(waits[max(0, math.ceil(len(waits) * 0.95) - 1)], 1) if waits else 0.0,
+            "users": {user: {"queued": int(q), "running": int(r)} for user, q, r in per_user},
+        }
+
+
+class SQLiteJobQueue(JobQueue):
+    """本地 SQLite 后端，BEGIN IMMEDIATE 串行化写事务"""
+
+    def __init__(self, path: str = QUEUE_DB, clock: Callable[[], float] = time.time):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        super().__init__(conn, clock)
+
+    @staticmethod
+    def _convert(sql: str) -> str:
+        return sql.replace("%s", "?").replace("%(now)s", ":now").replace("%(per_user)s", ":per_user")
+
+    def _execute(self, sql: str, params=None):
+        return self.conn.execute(self._convert(sql), params or ())
+
+    def _begin(self):
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE")
+
+    def _commit(self):
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT")
+
+    def _rollback(self):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+
+    def _claim_candidate(self, now: float, per_user: int) -> Optional[str]:
+        row = self._execute(
+            RANKED_JOBS + "SELECT id FROM ranked ORDER BY turn, created_at LIMIT 1",
+            {"now": now, "per_user": per_user},
+        ).fetchone()
+        return row[0] if row else None
+
+
+class PostgresJobQueue(JobQueue):
+    """PostgreSQL 后端，多个 worker 用 FOR UPDATE SKIP LOCKED 认领任务"""
+
+    def __init__(self, conn, clock: Callable[[], float] = time.time):
+        conn.autocommit = False
+        super().__init__(conn, clock)
+
+    def _execute(self, sql: str, params=None):
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        return cursor
+
+    def _begin(self):
+        # psycopg2 在第一条语句时自动开启事务
+        pass
+
+    def _lock_claim(self):
+        self._execute("SELECT pg_advisory_xact_lock(hashtext('deploy_jobs_claim'))")
+
+    def _claim_candidate(self, now: float, per_user: int) -> Optional[str]:
+        row = self._execute(
+            RANKED_JOBS
+            + "SELECT j.id FROM deploy_jobs j JOIN ranked r ON r.id = j.id "
+              "ORDER BY r.turn, r.created_at LIMIT 1 FOR UPDATE OF j SKIP LOCKED",
+            {"now": now, "per_user": per_user},
+        ).fetchone()
+        return row[0] if row else None
+
+
+def open_queue(backend: str = QUEUE_BACKEND) -> JobQueue:
+    if backend == "postgres":
+        from db_connection import get_db_connection
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Failed to connect to PostgreSQL")
+        return PostgresJobQueue(conn)
+    if backend == "sqlite":
+        return SQLiteJobQueue()
+    raise ValueError(f"Unknown queue backend: {backend} (expected sqlite or postgres)")
+
+
+_snapshot_pool: Optional[ThreadPoolExecutor] = None
+_snapshot_pool_lock = threading.Lock()
+
+
+def _snapshot(ds, sandbox_id: str, project_id: str):
+    try:
+        result = ds.snapshot_sandbox(sandbox_id, project_id)
+        error = None if result.get("success") else result.get("error")
+    except Exception as e:
+        error = str(e)
+    if error:
+        print(f"  ⚠️  沙盒 {sandbox_id[:8]} 快照失败: {error}", file=sys.stderr)
+
+
+def snapshot_in_background(ds, sandbox_id: str, project_id: str) -> Future:
+    """在独立的快照线程池中保存项目快照（与 mike.ts 一样不等待），部署任务不因快照占用槽位"""
+    global _snapshot_pool
+    with _snapshot_pool_lock:
+        if _snapshot_pool is None:
+            _snapshot_pool = ThreadPoolExecutor(max_workers=SNAPSHOT_CONCURRENCY, thread_name_prefix="snapshot")
+        return _snapshot_pool.submit(_snapshot, ds, sandbox_id, project_id)
+
+
+def wait_for_snapshots():
+    """等待已提交的快照完成，worker 退出和压测出报告前调用"""
+    global _snapshot_pool
+    with _snapshot_pool_lock:
+        pool, _snapshot_pool = _snapshot_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def deploy(payload: Dict[str, Any], ds=None, sleep: Callable[[float], None] = time.sleep) -> Dict[str, Any]:
+    """执行一次部署：创建/fork 沙盒、写入文件、安装依赖、启动服务
+
+    ds 默认为 daytona_sandbox 模块，压测时传入接口相同的假后端。
+    """
+    if ds is None:
+        import daytona_sandbox as ds
+
+    files: Dict[str, str] = payload["files"]
+    project_id = payload.get("project_id")
+    password = payload.get("password", "123456")
+    profile = payload.get("profile")
+    package_json = files.get("package.json")
+
+    if package_json:
+        result = ds.fork_sandbox(password, project_id, package_json, profile)
+    else:
+        result = ds.create_sandbox(password, project_id, profile)
+    if not result.get("success"):
+        raise RuntimeError(result.get("error", "Failed to create sandbox"))
+    sandbox_id = result["sandbox_id"]
+
+    try:
+        return _deploy_to_sandbox(ds, sandbox_id, result, files, project_id, sleep)
+    except Exception:
+        # 失败的任务会重试并创建新沙盒，删除本次的沙盒避免占用配额
+        ds.delete_sandbox(sandbox_id)
+        raise
+
+
+def _deploy_to_sandbox(ds, sandbox_id: str, result: Dict[str, Any], files: Dict[str, str],
+                       project_id: Optional[str], sleep: Callable[[float], None]) -> Dict[str, Any]:
+    package_json = files.get("package.json")
+    written = ds.write_files(sandbox_id, files)
+    if not written.get("success"):
+        raise RuntimeError(written.get("error", "Failed to write files"))
+
+    installed = False
+    if package_json and not result.get("restored"):
+        install = ds.run_command(sandbox_id, "cd /workspace && npm install", True, 300)
+        installed = install.get("success") and install.get("exit_code") == 0
+
+    # 端口清理和启动命令与 mike.ts 共用（web_server.py）
+    started = ds.start_web_server(sandbox_id, package_json)
+    if not started.get("success"):
+        raise RuntimeError(started.get("error", "Failed to start web server"))
+
+    if installed and project_id:
+        snapshot_in_background(ds, sandbox_id, project_id)
+
+    sleep(started["wait_seconds"])
+
+    return {
+        "sandbox_id": sandbox_id,
+        "website_url": result["website_url"],
+        "vnc_url": result["vnc_url"],
+        "restored": bool(result.get("restored")),
+        "start_log_id": started.get("log_id"),
+    }
+
+
+def run_worker(queue: JobQueue, handler: Callable[[Dict[str, Any]], Dict[str, Any]] = deploy,
+               concurrency: int = MAX_CONCURRENCY, pool_size: Optional[int] = None,
+               per_user: int = MAX_PER_USER, poll_interval: float = 1.0, once: bool = False,
+               log: Callable[[str], None] = print, stop: Optional[Callable[[], bool]] = None,
+               lease: int = JOB_LEASE) -> int:
+    """认领任务并在线程池中执行；队列只在主线程访问，返回处理的任务数
+
+    once=True 时没有可认领的任务就退出；stop 在空闲时调用，返回 True 时退出。
+    主线程每 lease / HEARTBEATS_PER_LEASE 秒为运行中的任务续约，poll_interval 应小于该间隔。
+    """
+    pool_size = pool_size or concurrency
+    inflight: Dict[Any, Dict[str, Any]] = {}
+    processed = 0
+    last_heartbeat = queue.clock()
+
+    with ThreadPoolExecutor(max_workers=pool_size) as pool:
+        while True:
+            for future in [f for f in inflight if f.done()]:
+                job = inflight.pop(future)
+                processed += 1
+                try:
+                    owned = queue.complete(job, future.result())
+                    log(f"  ✅ {job['id'][:8]} ({job['user_id']}) 完成")
+                except Exception as e:
+                    owned = queue.fail(job, str(e))
+                    log(f"  ❌ {job['id'][:8]} ({job['user_id']}) 失败: {e}")
+                if not owned:
+                    log(f"  ⚠️  {job['id'][:8]} 租约已过期，结果未写入（任务已重新入队）")
+
+            if inflight and queue.clock() - last_heartbeat >= lease / HEARTBEATS_PER_LEASE:
+                queue.heartbeat(inflight.values(), lease)
+                last_heartbeat = queue.clock()
+
+            recovered = queue.requeue_expired()
+            if recovered:
+                log(f"  ⚠️  {recovered} 个任务租约过期，已重新入队")
+
+            claimed = False
+            while len(inflight) < pool_size:
+                job = queue.claim(concurrency, per_user, lease)
+                if job is None:
+                    break
+                claimed = True
+                wait_s = job["started_at"] - job["created_at"]
+                log(f"  🚀 {job['id'][:8]} ({job['user_id']}) 开始，排队 {wait_s:.1f}s")
+                inflight[pool.submit(handler, job["payload"])] = job
+
+            if not inflight and not claimed and (once or (stop is not None and stop())):
+                return processed
+            if inflight:
+                wait(list(inflight), timeout=poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="沙盒部署任务队列")
+    parser.add_argument("--backend", default=QUEUE_BACKEND, choices=["sqlite", "postgres"])
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    p_enqueue = subparsers.add_parser("enqueue", help="入队（payload 通过 stdin 传入）")
+    p_enqueue.add_argument("user_id")
+    p_enqueue.add_argument("project_id")
+
+    p_status = subparsers.add_parser("status", help="查询任务状态")
+    p_status.add_argument("job_id")
+
+    subparsers.add_parser("stats", help="队列指标")
+
+    p_worker = subparsers.add_parser("worker", help="运行 worker")
+    p_worker.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="本 worker 的线程数")
+    p_worker.add_argument("--once", action="store_true", help="队列清空后退出")
+    args = parser.parse_args()
+
+    queue = open_queue(args.backend)
+    try:
+        if args.action == "enqueue":
+            try:
+                result = {"success": True, **queue.enqueue(args.user_id, args.project_id, json.load(sys.stdin))}
+            except QueueFull as e:
+                result = {"success": False, "error": str(e), "retry_after": e.retry_after}
+            print(json.dumps(result))
+        elif args.action == "status":
+            job = queue.status(args.job_id)
+            if job is None:
+                print(json.dumps({"success": False, "error": f"Job {args.job_id} not found"}))
+            else:
+                job.pop("payload")
+                print(json.dumps({"success": True, **job}))
+        elif args.action == "stats":
+            print(json.dumps(queue.stats(), indent=2))
+        else:
+            print(f"🚀 部署 worker 启动（本地 {args.concurrency} 线程，全局上限 {MAX_CONCURRENCY}，"
+                  f"每用户 {MAX_PER_USER}）")
+            try:
+                run_worker(queue, deploy, MAX_CONCURRENCY, args.concurrency, MAX_PER_USER, once=args.once)
+            finally:
+                wait_for_snapshots()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
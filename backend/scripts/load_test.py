@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+沙盒部署压测 / 浸泡测试
+按 mike.ts 的部署流程（create/fork → 写文件 → npm install → 清理端口 → 启动服务 → 等待启动，快照在后台执行）
+在本地假后端上回放，部署按泊松过程到达，假后端每个阶段注入延迟和错误率。
+
+报告：吞吐量、各阶段延迟 p50/p95/p99、错误率和重试率、Python 端资源占用（RSS、CPU、线程、fd）。
+所有时间参数和报告中的延迟都是模拟时间，--time-scale 0.1 表示以 10 倍速运行。
+
+模式:
+  direct  每个部署在线程池中直接执行（DEPLOY_QUEUE 未开启时 Alex 的行为）
+  queue   经 deploy_queue 入队，由 run_worker 执行（DEPLOY_QUEUE=true），包含背压和重试
+
+用法:
+  python3 scripts/load_test.py --concurrency 20 --rate 0.5 --duration 300 --time-scale 0.05
+  python3 scripts/load_test.py --mode queue --concurrency 100 --rate 2 --duration 3600 --time-scale 0.01
+  python3 scripts/load_test.py --latency install=90 --error create=0.05 --max-p95 180 --json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from deploy_queue import QueueFull, SQLiteJobQueue, deploy, run_worker, wait_for_snapshots
+from web_server import startup_seconds
+
+# 各阶段平均延迟（秒），来自线上 Daytona 的典型耗时
+DEFAULT_LATENCY = {
+    "create": 6.0,
+    "fork": 9.0,
+    "write_files": 0.5,
+    "install": 45.0,
+    "cleanup": 0.5,
+    "start": 0.8,
+    "snapshot": 5.0,
+    "delete": 1.5,
+}
+# 延迟服从对数正态分布，sigma 控制长尾
+LATENCY_SIGMA = 0.35
+# 与 create_sandbox 的 auto_stop_interval 一致，到期的沙盒不再占用配额
+SANDBOX_LIFETIME = 15 * 60
+
+PACKAGE_JSON = json.dumps({
+    "name": "load-test-app",
+    "scripts": {"dev": "vite --host 0.0.0.0 --port 8080"},
+    "dependencies": {"react": "^18.2.0", "react-dom": "^18.2.0"},
+    "devDependencies": {"vite": "^5.0.0", "@vitejs/plugin-react": "^4.2.0"},
+}, indent=2)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)]
+
+
+def parse_stage_values(items: List[str], name: str) -> Dict[str, float]:
+    """解析重复的 stage=value 参数"""
+    values = {}
+    for item in items:
+        stage, sep, value = item.partition("=")
+        if not sep or stage not in DEFAULT_LATENCY:
+            raise SystemExit(f"--{name} expects <stage>=<value> with stage in {', '.join(DEFAULT_LATENCY)}: {item}")
+        values[stage] = float(value)
+    return values
+
+
+class SimClock:
+    """模拟时间：墙钟时间除以 time_scale"""
+
+    def __init__(self, time_scale: float):
+        self.time_scale = time_scale
+        self.origin = time.monotonic()
+
+    def now(self) -> float:
+        return (time.monotonic() - self.origin) / self.time_scale
+
+    def sleep(self, seconds: float):
+        time.sleep(max(0.0, seconds) * self.time_scale)
+
+
+class StageRecorder:
+    """线程安全地记录每个阶段的耗时和成败"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float, ok: bool = True):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if not ok:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按部署流程的顺序输出各阶段统计"""
+        with self.lock:
+            order = ["queue_wait", *DEFAULT_LATENCY, "quota", "deploy", "end_to_end"]
+            stages = sorted(self.samples, key=lambda stage: order.index(stage) if stage in order else len(order))
+            return {
+                stage: {
+                    "count": len(values),
+                    "errors": self.errors.get(stage, 0),
+                    "p50": round(percentile(values, 50), 2),
+                    "p95": round(percentile(values, 95), 2),
+                    "p99": round(percentile(values, 99), 2),
+                    "max": round(max(values), 2),
+                }
+                for stage, values in ((stage, self.samples[stage]) for stage in stages)
+            }
+
+
+class FakeSandboxBackend:
+    """接口与 daytona_sandbox 相同的本地假后端，按阶段注入延迟、错误和沙盒配额"""
+
+    def __init__(self, clock: SimClock, recorder: StageRecorder, latency: Dict[str, float],
+                 error_rate: Dict[str, float], restore_ratio: float = 0.0, max_sandboxes: int = 0,
+                 seed: Optional[int] = None):
+        self.clock = clock
+        self.recorder = recorder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.restore_ratio = restore_ratio
+        self.max_sandboxes = max_sandboxes
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.live: Dict[str, float] = {}
+        self.peak_live = 0
+
+    def _stage(self, stage: str) -> bool:
+        """按注入的延迟等待，返回该阶段是否成功"""
+        mean = self.latency.get(stage, 0.0)
+        with self.lock:
+            delay = self.rng.lognormvariate(math.log(mean) - LATENCY_SIGMA ** 2 / 2, LATENCY_SIGMA) if mean > 0 else 0.0
+            ok = self.rng.random() >= self.error_rate.get(stage, 0.0)
+        self.clock.sleep(delay)
+        self.recorder.record(stage, delay, ok)
+        return ok
+
+    def _allocate(self, stage: str, **extra) -> Dict[str, Any]:
+        if not self._stage(stage):
+            return {"success": False, "error": f"Injected {stage} failure"}
+        with self.lock:
+            now = self.clock.now()
+            for sandbox_id in [s for s, created in self.live.items() if now - created > SANDBOX_LIFETIME]:
+                del self.live[sandbox_id]
+            if self.max_sandboxes and len(self.live) >= self.max_sandboxes:
+                self.recorder.record("quota", 0.0, False)
+                return {"success": False, "error": f"Sandbox quota exceeded ({self.max_sandboxes})"}
+            sandbox_id = uuid.uuid4().hex
+            self.live[sandbox_id] = now
+            self.peak_live = max(self.peak_live, len(self.live))
+        return {
+            "success": True,
+            "sandbox_id": sandbox_id,
+            "vnc_url": f"https://6080-{sandbox_id}.fake",
+            "website_url": f"https://8080-{sandbox_id}.fake",
+            **extra,
+        }
+
+    def create_sandbox(self, password: str = "123456", project_id: Optional[str] = None,
+                       profile: Optional[str] = None) -> Dict[str, Any]:
+        return self._allocate("create")
+
+    def fork_sandbox(self, password: str, project_id: str, package_json: str,
+                     profile: Optional[str] = None) -> Dict[str, Any]:
+        with self.lock:
+            restored = self.rng.random() < self.restore_ratio
+        return self._allocate("fork", restored=restored)
+
+    def write_files(self, sandbox_id: str, files: Dict[str, str]) -> Dict[str, Any]:
+        if not self._stage("write_files"):
+            return {"success": False, "error": f"Injected write_files failure ({len(files)} files)"}
+        return {"success": True, "message": f"{len(files)} files written successfully", "files": len(files)}
+
+    def run_command(self, sandbox_id: str, command: str, blocking: bool = False, timeout: int = 60,
+                    *args) -> Dict[str, Any]:
+        if "npm install" in command:
+            # 与线上一致：安装失败表现为非零退出码，部署继续
+            ok = self._stage("install")
+            return {"success": True, "output": "", "exit_code": 0 if ok else 1, "log_id": uuid.uuid4().hex[:12]}
+        if not self._stage("start"):
+            return {"success": False, "error": "Injected start failure"}
+        return {"success": True, "exit_code": 0, "log_id": uuid.uuid4().hex[:12]}
+
+    def start_web_server(self, sandbox_id: str, package_json: Optional[str] = None) -> Dict[str, Any]:
+        # 与线上一致：端口清理失败不影响启动
+        self._stage("cleanup")
+        started = self.run_command(sandbox_id, "start", False)
+        if not started.get("success"):
+            return started
+        return {"success": True, "log_id": started["log_id"], "wait_seconds": startup_seconds(package_json)}
+
+    def snapshot_sandbox(self, sandbox_id: str, project_id: str) -> Dict[str, Any]:
+        ok = self._stage("snapshot")
+        return {"success": ok} if ok else {"success": False, "error": "Injected snapshot failure"}
+
+    def delete_sandbox(self, sandbox_id: str) -> Dict[str, Any]:
+        self._stage("delete")
+        with self.lock:
+            self.live.pop(sandbox_id, None)
+        return {"success": True}
+
+
+class ResourceSampler:
+    """后台线程定期采样 Python 进程的 RSS、线程数和打开的 fd 数"""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.samples: List[Dict[str, float]] = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _rss_mb() -> Optional[float]:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _open_fds() -> Optional[int]:
+        try:
+            return len(os.listdir("/proc/self/fd"))
+        except OSError:
+            return None
+
+    def _sample(self):
+        self.samples.append({"rss_mb": self._rss_mb(), "threads": threading.active_count(), "fds": self._open_fds()})
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        self.wall_start = time.monotonic()
+        self._sample()
+        self.thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        self.stopped.set()
+        self.thread.join()
+        self._sample()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        wall = time.monotonic() - self.wall_start
+        cpu = (usage.ru_utime - self.cpu_start.ru_utime) + (usage.ru_stime - self.cpu_start.ru_stime)
+        rss = [s["rss_mb"] for s in self.samples if s["rss_mb"] is not None]
+        fds = [s["fds"] for s in self.samples if s["fds"] is not None]
+        return {
+            "wall_s": round(wall, 1),
+            "cpu_percent": round(100 * cpu / wall, 1) if wall else 0.0,
+            "rss_start_mb": round(rss[0], 1) if rss else None,
+            "rss_end_mb": round(rss[-1], 1) if rss else None,
+            "rss_peak_mb": round(max(rss), 1) if rss else None,
+            "threads_peak": max(s["threads"] for s in self.samples),
+            "fds_start": fds[0] if fds else None,
+            "fds_end": fds[-1] if fds else None,
+        }
+
+
+def make_payload(rng: random.Random, project_id: str, npm_ratio: float) -> Dict[str, Any]:
+    """生成与 Alex 输出相近的文件集合：框架项目带 package.json，否则是静态页面"""
+    files = {
+        "index.html": "<!DOCTYPE html><html><body><div id=\"root\"></div></body></html>\n" * 20,
+        "src/App.tsx": "export default function App() { return <div>Hello</div> }\n" * 80,
+        "src/index.css": "body { margin: 0; font-family: sans-serif; }\n" * 40,
+    }
+    if rng.random() < npm_ratio:
+        files["package.json"] = PACKAGE_JSON
+        files["src/main.tsx"] = "import App from './App'\n" * 10
+        files["vite.config.ts"] = "export default {}\n"
+    return {"files": files, "project_id": project_id}
+
+
+def arrivals(rng: random.Random, clock: SimClock, rate: float, duration: float, users: int,
+             max_deploys: int) -> Iterator[Tuple[str, str]]:
+    """按泊松过程产生 (user_id, project_id)，到达 duration 或 max_deploys 后停止"""
+    count = 0
+    next_at = 0.0
+    while True:
+        next_at += rng.expovariate(rate)
+        if next_at > duration or (max_deploys and count >= max_deploys):
+            return
+        clock.sleep(next_at - clock.now())
+        count += 1
+        user = rng.randrange(users)
+        yield f"user-{user}", f"project-{user}"
+
+
+def run_direct(args, clock: SimClock, backend: FakeSandboxBackend, recorder: StageRecorder,
+               rng: random.Random) -> Dict[str, Any]:
+    """直接模式：线程池中执行，超出并发的部署在池中等待"""
+    outcomes = {"succeeded": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def run_one(payload: Dict[str, Any], arrived_at: float):
+        started_at = clock.now()
+        recorder.record("queue_wait", started_at - arrived_at)
+        try:
+            deploy(payload, ds=backend, sleep=clock.sleep)
+            ok = True
+        except Exception:
+            ok = False
+        finished_at = clock.now()
+        recorder.record("deploy", finished_at - started_at, ok)
+        recorder.record("end_to_end", finished_at - arrived_at, ok)
+        with lock:
+            outcomes["succeeded" if ok else "failed"] += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _, project_id in arrivals(rng, clock, args.rate, args.duration, args.users, args.deploys):
+            pool.submit(run_one, make_payload(rng, project_id, args.npm_ratio), clock.now())
+
+    return {**outcomes, "rejected": 0, "retried": 0}
+
+
+def run_queued(args, clock: SimClock, backend: FakeSandboxBackend, recorder: StageRecorder,
+               rng: random.Random) -> Dict[str, Any]:
+    """队列模式：生产者线程入队，run_worker 在主线程认领执行；队列使用模拟时钟，重试退避同样按比例缩短"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="atom-load-"), "deploy-queue.sqlite3")
+    worker_queue = SQLiteJobQueue(db_path, clock=clock.now)
+    job_ids: List[str] = []
+    rejected = [0]
+    producing = threading.Event()
+    producing.set()
+
+    def produce():
+        producer_queue = SQLiteJobQueue(db_path, clock=clock.now)
+        try:
+            for user_id, project_id in arrivals(rng, clock, args.rate, args.duration, args.users, args.deploys):
+                payload = make_payload(rng, project_id, args.npm_ratio)
+                try:
+                    job_ids.append(producer_queue.enqueue(user_id, project_id, payload,
+                                                          concurrency=args.concurrency)["job_id"])
+                except QueueFull:
+                    rejected[0] += 1
+        finally:
+            producer_queue.close()
+            producing.clear()
+
+    def handler(payload: Dict[str, Any]) -> Dict[str, Any]:
+        started_at = clock.now()
+        try:
+            result = deploy(payload, ds=backend, sleep=clock.sleep)
+        except Exception:
+            recorder.record("deploy", clock.now() - started_at, False)
+            raise
+        recorder.record("deploy", clock.now() - started_at)
+        return result
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    run_worker(
+        worker_queue,
+        handler,
+        concurrency=args.concurrency,
+        per_user=args.per_user,
+        poll_interval=min(1.0, max(0.01, args.time_scale)),
+        log=lambda message: None,
+        stop=lambda: not producing.is_set() and worker_queue.stats()["depth"] == 0,
+    )
+    producer.join()
+
+    outcomes = {"succeeded": 0, "failed": 0, "rejected": rejected[0], "retried": 0}
+    for job_id in job_ids:
+        job = worker_queue.status(job_id)
+        ok = job["status"] == "succeeded"
+        outcomes["succeeded" if ok else "failed"] += 1
+        outcomes["retried"] += 1 if job["attempts"] > 1 else 0
+        recorder.record("queue_wait", job["started_at"] - job["created_at"])
+        recorder.record("end_to_end", job["finished_at"] - job["created_at"], ok)
+    worker_queue.close()
+    return outcomes
+
+
+def run_load_test(args) -> Dict[str, Any]:
+    clock = SimClock(args.time_scale)
+    recorder = StageRecorder()
+    latency = {**DEFAULT_LATENCY, **parse_stage_values(args.latency, "latency")}
+    backend = FakeSandboxBackend(
+        clock, recorder, latency, parse_stage_values(args.error, "error"),
+        restore_ratio=args.restore_ratio, max_sandboxes=args.max_sandboxes, seed=args.seed,
+    )
+    rng = random.Random(args.seed)
+    sampler = ResourceSampler(interval=max(0.1, min(1.0, args.duration * args.time_scale / 100)))
+
+    sampler.start()
+    runner = run_queued if args.mode == "queue" else run_direct
+    outcomes = runner(args, clock, backend, recorder, rng)
+    elapsed = clock.now()
+    # 快照在部署返回后执行，等待完成后再统计快照阶段
+    wait_for_snapshots()
+    resources = sampler.stop()
+
+    total = outcomes["succeeded"] + outcomes["failed"]
+    offered = total + outcomes["rejected"]
+    return {
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "rate_per_s": args.rate,
+        "duration_s": args.duration,
+        "time_scale": args.time_scale,
+        "elapsed_s": round(elapsed, 1),
+        "deploys": outcomes,
+        "throughput_per_min": round(60 * outcomes["succeeded"] / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(outcomes["failed"] / total, 4) if total else 0.0,
+        "retry_rate": round(outcomes["retried"] / total, 4) if total else 0.0,
+        "reject_rate": round(outcomes["rejected"] / offered, 4) if offered else 0.0,
+        "peak_sandboxes": backend.peak_live,
+        "stages": recorder.summary(),
+        "resources": resources,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    deploys = report["deploys"]
+    print("=" * 72)
+    print(f"📊 部署压测（{report['mode']}，并发 {report['concurrency']}，到达率 {report['rate_per_s']}/s，"
+          f"模拟 {report['elapsed_s']}s，倍速 x{1 / report['time_scale']:g}）")
+    print("=" * 72)
+    print(f"  部署: {deploys['succeeded']} 成功 / {deploys['failed']} 失败 / {deploys['rejected']} 拒绝，"
+          f"{deploys['retried']} 个重试过")
+    print(f"  吞吐: {report['throughput_per_min']}/min，错误率 {report['error_rate']:.1%}，"
+          f"重试率 {report['retry_rate']:.1%}，拒绝率 {report['reject_rate']:.1%}，"
+          f"沙盒峰值 {report['peak_sandboxes']}")
+    print(f"\n  {'阶段':<14}{'次数':>8}{'错误':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage, s in report["stages"].items():
+        print(f"  {stage:<16}{s['count']:>8}{s['errors']:>8}{s['p50']:>9}{s['p95']:>9}{s['p99']:>9}{s['max']:>9}")
+    r = report["resources"]
+    print(f"\n  资源: CPU {r['cpu_percent']}%，RSS {r['rss_start_mb']} → {r['rss_end_mb']} MB"
+          f"（峰值 {r['rss_peak_mb']}），线程峰值 {r['threads_peak']}，fd {r['fds_start']} → {r['fds_end']}")
+    print("=" * 72)
+
+
+def check_thresholds(report: Dict[str, Any], max_p95: Optional[float], max_error_rate: Optional[float]) -> List[str]:
+    """容量回归检查：端到端 p95 或错误率超过阈值时返回失败原因"""
+    failures = []
+    e2e = report["stages"].get("end_to_end", {})
+    if max_p95 is not None and e2e.get("p95", 0.0) > max_p95:
+        failures.append(f"end_to_end p95 {e2e['p95']}s > {max_p95}s")
+    if max_error_rate is not None and report["error_rate"] > max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.2%} > {max_error_rate:.2%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="沙盒部署压测 / 浸泡测试（本地假后端）")
+    parser.add_argument("--mode", choices=["direct", "queue"], default="direct")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时执行的部署数")
+    parser.add_argument("--rate", type=float, default=0.5, help="部署到达率（每秒，泊松过程）")
+    parser.add_argument("--duration", type=float, default=300, help="产生部署的时长（模拟秒），之后等待全部完成")
+    parser.add_argument("--deploys", type=int, default=0, help="最多产生的部署数，0 表示不限制")
+    parser.add_argument("--users", type=int, default=50, help="不同用户数（队列模式的公平调度）")
+    parser.add_argument("--per-user", type=int, default=1, help="队列模式下每个用户的并发上限")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="墙钟 / 模拟时间，0.05 即 20 倍速")
+    parser.add_argument("--latency", action="append", default=[], metavar="STAGE=SECONDS",
+                        help=f"覆盖阶段平均延迟，阶段: {', '.join(DEFAULT_LATENCY)}")
+    parser.add_argument("--error", action="append", default=[], metavar="STAGE=RATE", help="阶段错误率（0~1）")
+    parser.add_argument("--npm-ratio", type=float, default=0.7, help="带 package.json 的项目比例")
+    parser.add_argument("--restore-ratio", type=float, default=0.0, help="fork 命中快照、跳过安装的比例")
+    parser.add_argument("--max-sandboxes", type=int, default=0, help="沙盒配额，0 表示不限制")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 报告")
+    parser.add_argument("--max-p95", type=float, default=None, help="端到端 p95 上限（秒），超过时退出码为 1")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="错误率上限，超过时退出码为 1")
+    args = parser.parse_args()
+
+    if args.rate <= 0 or args.time_scale <= 0 or args.concurrency <= 0:
+        raise SystemExit("--rate, --time-scale and --concurrency must be positive")
+
+    report = run_load_test(args)
+    failures = check_thresholds(report, args.max_p95, args.max_error_rate)
+    if args.json:
+        print(json.dumps({**report, "threshold_failures": failures}, indent=2))
+    else:
+        print_report(report)
+        for failure in failures:
+            print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+messages 表按月分区和历史消息归档工具
+
+用法:
+  python3 scripts/partition_messages.py migrate [--months-ahead 3] [--keep-legacy]
+  python3 scripts/partition_messages.py ensure [--months-ahead 3]
+  python3 scripts/partition_messages.py archive --before 2025-01 [--out archive/messages] [--format csv|binary]
+  python3 scripts/partition_messages.py status
+
+migrate 把 messages 转换为按 timestamp 的范围分区表（每月一个分区 + 默认分区），
+并创建 ensure_message_partitions() 函数自动创建未来的分区（有 pg_cron 时每天调度一次）。
+archive 把早于指定月份的分区 DETACH 后导出为压缩的 COPY 文件，读回归档文件校验行数和 sha256 后删除；
+导出或校验失败时重新 ATTACH 分区。
+
+分区表的主键必须包含分区键，主键变为 (id, timestamp)；id 的唯一性由 message_ids 表和触发器保证，
+重复的 id 与分区前一样以唯一约束冲突（23505）拒绝写入，code_blobs.py 和 bulk.py 仍可按 id 定位和分块；
+id 和 timestamp 写入后不可修改。
+只有带 timestamp 下界的查询才会裁剪分区：项目列表的最后一条消息只查最近 90 天
+（routes/projects.ts，查不到时才扫描全部分区）；消息列表返回项目的完整历史，会扫描项目有消息的所有已挂载分区，
+归档后的月份不再参与查询。
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import re
+import struct
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from db_connection import psycopg2, get_db_connection
+
+PARTITION_PREFIX = "messages_p"
+PARTITION_NAME_RE = re.compile(r"^messages_p(\d{4})(\d{2})$")
+DEFAULT_PARTITION = "messages_default"
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent.parent / "archive" / "messages"
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+# 与 docs/database-schema.sql 中的 messages 保持一致，分区键必须包含在主键中
+PARTITIONED_TABLE_DDL = """
+CREATE TABLE messages_partitioned (
+  id TEXT NOT NULL,
+  project_id TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  role TEXT NOT NULL,
+  content TEXT NOT NULL,
+  agent TEXT,
+  artifacts JSONB,
+  timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+# 分区表上不能建只含 id 的唯一索引，用独立的 message_ids 表保证 id 全局唯一
+MESSAGE_IDS_DDL = """
+CREATE TABLE IF NOT EXISTS message_ids (
+  id TEXT PRIMARY KEY,
+  timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+)
+"""
+
+# 插入时登记 id（重复时违反 message_ids_pkey），删除时释放；
+# 跨分区的 UPDATE 会先触发 BEFORE UPDATE 再触发目标分区的 BEFORE INSERT，因此 id 和 timestamp 不允许修改。
+# ensure_message_partitions() 从默认分区移动行时先删除再插入，登记保持一致
+MESSAGE_IDS_TRIGGER_DDL = """
+CREATE OR REPLACE FUNCTION sync_message_ids()
+RETURNS TRIGGER AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO message_ids (id, timestamp) VALUES (NEW.id, NEW.timestamp);
+    RETURN NEW;
+  ELSIF TG_OP = 'UPDATE' THEN
+    IF NEW.id IS DISTINCT FROM OLD.id OR NEW.timestamp IS DISTINCT FROM OLD.timestamp THEN
+      RAISE EXCEPTION 'messages.id and messages.timestamp cannot be changed (message %)', OLD.id;
+    END IF;
+    RETURN NEW;
+  END IF;
+  DELETE FROM message_ids WHERE id = OLD.id;
+  RETURN OLD;
+END;
+$fn$ LANGUAGE plpgsql;
+
+CREATE TRIGGER messages_register_id BEFORE INSERT ON messages
+  FOR EACH ROW EXECUTE FUNCTION sync_message_ids();
+CREATE TRIGGER messages_freeze_id BEFORE UPDATE OF id, timestamp ON messages
+  FOR EACH ROW EXECUTE FUNCTION sync_message_ids();
+CREATE TRIGGER messages_release_id AFTER DELETE ON messages
+  FOR EACH ROW EXECUTE FUNCTION sync_message_ids();
+"""
+
+MESSAGE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_messages_project_id ON messages(project_id)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_project_timestamp ON messages(project_id, timestamp DESC)",
+]
+
+# 自动创建从本月起未来 N 个月的分区，默认分区中已有的行会先移入新分区
+ENSURE_FUNCTION_DDL = """
+CREATE OR REPLACE FUNCTION ensure_message_partitions(months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $fn$
+DECLARE
+  month_start DATE;
+  partition_name TEXT;
+  created INTEGER := 0;
+BEGIN
+  FOR i IN 0..months_ahead LOOP
+    month_start := (date_trunc('month', now()) + make_interval(months => i))::DATE;
+    partition_name := 'messages_p' || to_char(month_start, 'YYYYMM');
+    IF to_regclass(partition_name) IS NULL THEN
+      CREATE TEMP TABLE IF NOT EXISTS pending_messages (LIKE messages) ON COMMIT DROP;
+      WITH moved AS (
+        DELETE FROM messages_default
+        WHERE timestamp >= month_start AND timestamp < (month_start + INTERVAL '1 month')
+        RETURNING *
+      )
+      INSERT INTO pending_messages SELECT * FROM moved;
+      EXECUTE format(
+        'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+      );
+      INSERT INTO messages SELECT * FROM pending_messages;
+      TRUNCATE pending_messages;
+      created := created + 1;
+    END IF;
+  END LOOP;
+  RETURN created;
+END;
+$fn$ LANGUAGE plpgsql;
+"""
+
+
+def month_floor(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def is_partitioned(cursor) -> bool:
+    """messages 是否已经是分区表"""
+    cursor.execute(
+        """
+        SELECT c.relkind
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = 'messages'
+        """
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise RuntimeError("messages 表不存在，请先运行 create-tables.py")
+    return row[0] == "p"
+
+
+def list_partitions(cursor) -> List[Tuple[str, Optional[date]]]:
+    """列出 messages 的分区，返回 (分区名, 月份)，默认分区的月份为 None"""
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_catalog.pg_inherits i
+        JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.messages'::regclass
+        ORDER BY c.relname
+        """
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME_RE.match(name)
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append((name, month))
+    return partitions
+
+
+def migrate(conn, months_ahead: int, keep_legacy: bool) -> bool:
+    """把 messages 转换为按月范围分区表（单个事务，期间阻塞写入）"""
+    cursor = conn.cursor()
+    if is_partitioned(cursor):
+        print("  ✅ messages 已经是分区表，跳过迁移")
+        cursor.close()
+        return True
+
+    conn.autocommit = False
+    try:
+        cursor.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("SELECT min(timestamp), count(*) FROM messages")
+        oldest, total = cursor.fetchone()
+
+        cursor.execute(PARTITIONED_TABLE_DDL)
+        today = month_floor(datetime.now(timezone.utc).date())
+        first = month_floor(oldest.date()) if oldest else today
+        month = first
+        while month <= add_months(today, months_ahead):
+            cursor.execute(
+                f"CREATE TABLE {partition_name(month)} PARTITION OF messages_partitioned "
+                "FOR VALUES FROM (%s) TO (%s)",
+                (month, add_months(month, 1)),
+            )
+            month = add_months(month, 1)
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages_partitioned DEFAULT")
+        print(f"  ✅ 创建分区 {partition_name(first)} ~ {partition_name(add_months(today, months_ahead))}")
+
+        # 旧表没有 NOT NULL 约束，空 timestamp 用 created_at 补齐
+        cursor.execute(
+            """
+            INSERT INTO messages_partitioned
+              (id, project_id, user_id, role, content, agent, artifacts, timestamp, created_at)
+            SELECT id, project_id, user_id, role, content, agent, artifacts,
+                   COALESCE(timestamp, created_at, NOW()), created_at
+            FROM messages
+            """
+        )
+        print(f"  ✅ 复制 {total} 条消息")
+
+        # 旧表的主键保证了 id 唯一，直接登记；之后的写入由触发器登记
+        cursor.execute(MESSAGE_IDS_DDL)
+        cursor.execute("INSERT INTO message_ids (id, timestamp) SELECT id, timestamp FROM messages_partitioned")
+
+        cursor.execute("ALTER TABLE messages RENAME TO messages_legacy")
+        if keep_legacy:
+            for statement in MESSAGE_INDEXES:
+                index = statement.split()[5]
+                cursor.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_legacy")
+        else:
+            cursor.execute("DROP TABLE messages_legacy")
+        cursor.execute("ALTER TABLE messages_partitioned RENAME TO messages")
+        for statement in MESSAGE_INDEXES:
+            cursor.execute(statement)
+        cursor.execute(MESSAGE_IDS_TRIGGER_DDL)
+        cursor.execute(ENSURE_FUNCTION_DDL)
+        # 通知 PostgREST 重新加载 schema 缓存
+        cursor.execute("NOTIFY pgrst, 'reload schema'")
+
+        conn.commit()
+        print("  ✅ messages 已转换为分区表")
+    except Exception as e:
+        conn.rollback()
+        print(f"  ❌ 迁移失败，已回滚: {e}")
+        return False
+    finally:
+        conn.autocommit = True
+        cursor.close()
+
+    schedule_ensure(conn, months_ahead)
+    return True
+
+
+def schedule_ensure(conn, months_ahead: int):
+    """有 pg_cron 时每天自动创建未来分区"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM pg_catalog.pg_extension WHERE extname = 'pg_cron'")
+        if cursor.fetchone() is None:
+            print("  ⚠️  未安装 pg_cron，请定期运行: python3 scripts/partition_messages.py ensure")
+            return
+        cursor.execute(
+            "SELECT cron.schedule('ensure-message-partitions', '0 3 * * *', %s)",
+            (f"SELECT ensure_message_partitions({int(months_ahead)})",),
+        )
+        print("  ✅ 已通过 pg_cron 每天调度 ensure_message_partitions()")
+    except psycopg2.Error as e:
+        print(f"  ⚠️  pg_cron 调度失败: {e}")
+    finally:
+        cursor.close()
+
+
+def ensure(conn, months_ahead: int) -> int:
+    """创建未来的分区"""
+    cursor = conn.cursor()
+    try:
+        if not is_partitioned(cursor):
+            raise RuntimeError("messages 还不是分区表，请先运行 migrate")
+        cursor.execute(ENSURE_FUNCTION_DDL)
+        cursor.execute("SELECT ensure_message_partitions(%s)", (months_ahead,))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+class _HashingWriter:
+    """计算写入内容 sha256 的文件包装"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.digest.update(data)
+        return self.fileobj.write(data)
+
+
+def export_partition(cursor, name: str, out_dir: Path, fmt: str) -> Dict[str, Any]:
+    """把已 DETACH 的分区以 COPY 流式导出为 gzip 文件"""
+    suffix = "csv.gz" if fmt == "csv" else "copy.gz"
+    path = out_dir / f"{name}.{suffix}"
+    options = "FORMAT csv, HEADER" if fmt == "csv" else "FORMAT binary"
+    with gzip.open(path, "wb") as f:
+        writer = _HashingWriter(f)
+        cursor.copy_expert(f"COPY {name} TO STDOUT WITH ({options})", writer)
+    return {"path": str(path), "sha256": writer.digest.hexdigest()}
+
+
+def _count_binary_rows(f) -> int:
+    """按 COPY BINARY 格式逐条跳过记录并计数，文件截断或缺少结束标记时抛出 ValueError"""
+
+    def read(n: int) -> bytes:
+        data = f.read(n)
+        if len(data) != n:
+            raise ValueError("归档文件被截断")
+        return data
+
+    if read(len(PGCOPY_SIGNATURE)) != PGCOPY_SIGNATURE:
+        raise ValueError("不是 COPY BINARY 文件")
+    _flags, extension = struct.unpack("!iI", read(8))
+    read(extension)
+    rows = 0
+    while True:
+        (fields,) = struct.unpack("!h", read(2))
+        if fields == -1:
+            return rows
+        for _ in range(fields):
+            (length,) = struct.unpack("!i", read(4))
+            if length > 0:
+                read(length)
+        rows += 1
+
+
+def count_archived_rows(path: Path, fmt: str) -> Tuple[int, str]:
+    """读回 gzip 归档文件，返回 (记录数, 解压后内容的 sha256)"""
+    digest = hashlib.sha256()
+    with gzip.open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    with gzip.open(path, "rb") as f:
+        if fmt == "csv":
+            # csv 模块按引号处理 content 中的换行，记录数不含表头
+            rows = sum(1 for _ in csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))) - 1
+        else:
+            rows = _count_binary_rows(f)
+    return max(rows, 0), digest.hexdigest()
+
+
+def archive(conn, before: date, out_dir: Path, fmt: str, keep_detached: bool) -> bool:
+    """归档早于 before 月份的分区: DETACH -> 导出 -> 读回校验 -> DROP，失败时重新 ATTACH"""
+    cursor = conn.cursor()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ok = True
+
+    try:
+        if not is_partitioned(cursor):
+            raise RuntimeError("messages 还不是分区表，请先运行 migrate")
+        targets = [(name, month) for name, month in list_partitions(cursor) if month and month < before]
+        if not targets:
+            print(f"  ✅ 没有早于 {before:%Y-%m} 的分区")
+            return True
+
+        for name, month in targets:
+            cursor.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+            try:
+                cursor.execute(f"SELECT count(*) FROM {name}")
+                rows = cursor.fetchone()[0]
+                result = export_partition(cursor, name, out_dir, fmt)
+                manifest = {
+                    "partition": name,
+                    "month": f"{month:%Y-%m}",
+                    "rows": rows,
+                    "format": fmt,
+                    "sha256": result["sha256"],
+                    "archived_at": datetime.now(timezone.utc).isoformat(),
+                }
+                with open(out_dir / f"{name}.json", "w", encoding="utf-8") as f:
+                    json.dump(manifest, f, indent=2)
+
+                archived_rows, archived_sha256 = count_archived_rows(Path(result["path"]), fmt)
+                if archived_rows != manifest["rows"] or archived_sha256 != manifest["sha256"]:
+                    raise ValueError(f"归档文件校验失败 ({archived_rows}/{manifest['rows']} 条)")
+            except Exception as e:
+                cursor.execute(
+                    f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                    (month, add_months(month, 1)),
+                )
+                print(f"  ❌ {name}: {e}，分区已重新挂载")
+                ok = False
+                continue
+
+            if not keep_detached:
+                cursor.execute(f"DROP TABLE {name}")
+                # DROP 不触发删除触发器，归档的 id 从登记表中释放
+                cursor.execute(
+                    "DELETE FROM message_ids WHERE timestamp >= %s AND timestamp < %s",
+                    (month, add_months(month, 1)),
+                )
+            print(f"  ✅ {name}: 归档 {rows} 条消息 -> {result['path']}")
+    except Exception as e:
+        print(f"  ❌ 归档失败: {e}")
+        print("     已 DETACH 的分区仍作为独立表保留，可用 ALTER TABLE messages ATTACH PARTITION 恢复")
+        return False
+    finally:
+        cursor.close()
+    return ok
+
+
+def status(conn):
+    """显示分区和大小"""
+    cursor = conn.cursor()
+    try:
+        if not is_partitioned(cursor):
+            print("  ⚠️  messages 还不是分区表")
+            return
+        for name, _ in list_partitions(cursor):
+            cursor.execute(
+                f"SELECT count(*), pg_size_pretty(pg_total_relation_size('{name}')) FROM {name}"
+            )
+            rows, size = cursor.fetchone()
+            print(f"  📦 {name}: {rows} 条, {size}")
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="messages 分区和归档")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    p_migrate = subparsers.add_parser("migrate", help="转换为分区表")
+    p_migrate.add_argument("--months-ahead", type=int, default=3)
+    p_migrate.add_argument("--keep-legacy", action="store_true", help="保留旧表 messages_legacy")
+
+    p_ensure = subparsers.add_parser("ensure", help="创建未来的分区")
+    p_ensure.add_argument("--months-ahead", type=int, default=3)
+
+    p_archive = subparsers.add_parser("archive", help="归档旧分区")
+    p_archive.add_argument("--before", required=True, help="归档早于该月份的分区，格式 YYYY-MM")
+    p_archive.add_argument("--out", type=Path, default=DEFAULT_ARCHIVE_DIR)
+    p_archive.add_argument("--format", choices=["csv", "binary"], default="csv")
+    p_archive.add_argument("--keep-detached", action="store_true", help="导出后保留已 DETACH 的表")
+
+    subparsers.add_parser("status", help="显示分区")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        if args.action == "migrate":
+            success = migrate(conn, args.months_ahead, args.keep_legacy)
+        elif args.action == "ensure":
+            created = ensure(conn, args.months_ahead)
+            print(f"  ✅ 新建 {created} 个分区")
+            success = True
+        elif args.action == "archive":
+            before = datetime.strptime(args.before, "%Y-%m").date()
+            success = archive(conn, before, args.out, args.format, args.keep_detached)
+        else:
+            status(conn)
+            success = True
+    except Exception as e:
+        print(f"❌ {e}")
+        success = False
+    finally:
+        conn.close()
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+沙盒内代理
+由 create_sandbox 上传到沙盒并交给 supervisord 管理，只依赖标准库。
+通过预览端口提供 HTTP/1.1 长连接接口，客户端在同一个连接上批量发送操作，
+省去每个操作一次 Daytona 控制面请求和日志轮询。
+
+  GET  /health
+  POST /batch  {"ops": [...], "parallel": false}
+       返回分块的 NDJSON 事件流：
+         {"id": 0, "event": "result", "ok": true, ...}   每个操作完成时推送
+         {"id": 1, "event": "log", "data": "<base64>", "offset": 0, "next_offset": 42}   follow 的 tail 推送新日志
+         {"event": "ping"}   操作执行期间定期发送，防止代理断开空闲连接
+         {"event": "done"}
+
+操作:
+  write  {"path", "data": base64}                         写入文件（临时文件 + 原子替换）
+  exec   {"cmd", "cwd", "timeout", "background"}          sh -c 执行，返回 exit_code 和 output
+  stat   {"path", "sha256": false}                        文件信息
+  tail   {"log_id", "offset", "head", "tail", "follow"}   读取 command_logs 的日志文件；
+                                                          follow 时持续推送到命令结束
+
+认证：Authorization: Bearer $ATOM_AGENT_TOKEN
+用法:
+  ATOM_AGENT_TOKEN=... python3 sandbox_agent.py [--port 8787]
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VERSION = 1
+DEFAULT_PORT = 8787
+WORKSPACE = "/workspace"
+# 与 command_logs.LOG_DIR 一致
+LOG_DIR = "/tmp/atom-logs"
+PING_INTERVAL = 10.0
+FOLLOW_INTERVAL = 0.2
+FOLLOW_CHUNK = 64 * 1024
+MAX_FOLLOW_SECONDS = 30 * 60
+MAX_PARALLEL = 8
+
+
+def _resolve(path: str) -> str:
+    return path if path.startswith("/") else os.path.join(WORKSPACE, path)
+
+
+def op_write(op, emit):
+    path = _resolve(op["path"])
+    data = base64.b64decode(op["data"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.atom-write"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    if os.path.exists(path):
+        shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+    return {"size": len(data)}
+
+
+def op_exec(op, emit):
+    cwd = _resolve(op.get("cwd") or WORKSPACE)
+    if not os.path.isdir(cwd):
+        cwd = "/"
+    if op.get("background"):
+        proc = subprocess.Popen(
+            ["sh", "-c", op["cmd"]], cwd=cwd, start_new_session=True,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        threading.Thread(target=proc.wait, daemon=True).start()
+        return {"pid": proc.pid}
+
+    proc = subprocess.Popen(
+        ["sh", "-c", op["cmd"]], cwd=cwd, start_new_session=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    )
+    try:
+        output, _ = proc.communicate(timeout=op.get("timeout"))
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        output, _ = proc.communicate()
+        return {"exit_code": None, "timed_out": True, "output": output.decode("utf-8", errors="replace")}
+    return {"exit_code": proc.returncode, "output": output.decode("utf-8", errors="replace")}
+
+
+def op_stat(op, emit):
+    path = _resolve(op["path"])
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {"exists": False}
+    result = {"exists": True, "size": st.st_size, "mtime": st.st_mtime, "mode": st.st_mode & 0o7777,
+              "is_dir": os.path.isdir(path)}
+    if op.get("sha256") and not result["is_dir"]:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        result["sha256"] = digest.hexdigest()
+    return result
+
+
+def _exit_code(log_id: str):
+    try:
+        with open(os.path.join(LOG_DIR, f"{log_id}.exit")) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _read_range(path: str, start: int, length: int) -> bytes:
+    if length <= 0:
+        return b""
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+def op_tail(op, emit):
+    """与 command_logs.build_read_script 相同的有界读取；follow 时按 FOLLOW_CHUNK 推送增量直到命令结束"""
+    log_id = op["log_id"]
+    path = os.path.join(LOG_DIR, f"{log_id}.log")
+    offset = int(op.get("offset", 0))
+
+    if op.get("follow"):
+        deadline = time.monotonic() + min(op.get("timeout") or MAX_FOLLOW_SECONDS, MAX_FOLLOW_SECONDS)
+        while True:
+            # 先读退出码：读到时日志已写完，本轮读完即可结束
+            exit_code = _exit_code(log_id)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            while offset < size:
+                chunk = _read_range(path, offset, min(FOLLOW_CHUNK, size - offset))
+                emit({"id": op["id"], "event": "log", "data": base64.b64encode(chunk).decode("ascii"),
+                      "offset": offset, "next_offset": offset + len(chunk)})
+                offset += len(chunk)
+            if exit_code is not None or time.monotonic() > deadline:
+                return {"next_offset": offset, "size": size, "exit_code": exit_code}
+            time.sleep(FOLLOW_INTERVAL)
+
+    head_bytes = int(op.get("head", 0))
+    tail_bytes = int(op.get("tail", 0))
+    exit_code = _exit_code(log_id)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    offset = min(offset, size)
+    if size - offset <= head_bytes + tail_bytes:
+        head, tail = _read_range(path, offset, size - offset), b""
+    else:
+        head, tail = _read_range(path, offset, head_bytes), _read_range(path, size - tail_bytes, tail_bytes)
+    return {
+        "size": size,
+        "head": base64.b64encode(head).decode("ascii"),
+        "tail": base64.b64encode(tail).decode("ascii"),
+        "exit_code": exit_code,
+    }
+
+
+OPERATIONS = {"write": op_write, "exec": op_exec, "stat": op_stat, "tail": op_tail}
+
+
+def run_op(op, emit):
+    try:
+        handler = OPERATIONS.get(op.get("op"))
+        if handler is None:
+            raise ValueError(f"Unknown op: {op.get('op')}")
+        result = {"ok": True, **handler(op, emit)}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    emit({"id": op["id"], "event": "result", **result})
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    token = ""
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"ok": True, "version": VERSION})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if self.path != "/batch":
+            self._send_json(404, {"error": "not found"})
+            return
+        supplied = self.headers.get("Authorization", "")
+        if not self.token or not hmac.compare_digest(supplied, f"Bearer {self.token}"):
+            self._send_json(401, {"error": "unauthorized"})
+            return
+        try:
+            body = json.loads(raw)
+            ops = [dict(op, id=op.get("id", i)) for i, op in enumerate(body["ops"])]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        lock = threading.Lock()
+        finished = threading.Event()
+        closed = []
+
+        def emit(event):
+            data = json.dumps(event).encode("utf-8") + b"\n"
+            with lock:
+                if closed:
+                    return
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        def ping():
+            while not finished.wait(PING_INTERVAL):
+                emit({"event": "ping"})
+
+        threading.Thread(target=ping, daemon=True).start()
+        try:
+            if body.get("parallel") and len(ops) > 1:
+                with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(ops))) as pool:
+                    list(pool.map(lambda op: run_op(op, emit), ops))
+            else:
+                for op in ops:
+                    run_op(op, emit)
+        finally:
+            finished.set()
+        emit({"event": "done"})
+        with lock:
+            closed.append(True)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+
+def serve(port: int = DEFAULT_PORT, token: str = "", host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """创建服务（不启动循环），便于测试在本地线程中运行"""
+    handler = type("BoundAgentHandler", (AgentHandler,), {"token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    port = DEFAULT_PORT
+    if len(sys.argv) > 2 and sys.argv[1] == "--port":
+        port = int(sys.argv[2])
+    token = os.environ.get("ATOM_AGENT_TOKEN", "")
+    if not token:
+        print("ATOM_AGENT_TOKEN is required", file=sys.stderr)
+        sys.exit(1)
+    server = serve(port, token)
+    print(f"atom sandbox agent v{VERSION} listening on :{port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
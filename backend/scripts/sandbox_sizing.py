@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Daytona 沙盒资源自动选型
+根据 package.json 的依赖指纹和历史测量（安装耗时、构建耗时、内存峰值）选择资源档位。
+测量记录在本地 SQLite 中，由 daytona_sandbox.py 的阻塞命令路径写入。
+
+内存峰值读取的是整个沙盒 cgroup 的 memory.peak，包含 VNC、Chrome 等常驻进程：
+档位需要同时容纳这些进程和安装/构建命令，因此按沙盒整体峰值选型。
+memory.peak 从沙盒启动起累计，只有命令执行期间峰值升高时才记录（见 command_peak_mb），
+否则该次测量的峰值记为未知。
+
+用法:
+  python3 scripts/sandbox_sizing.py choose [profile] < package.json
+  python3 scripts/sandbox_sizing.py history <fingerprint>
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from typing import Dict, Any, List, Optional, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DB = os.getenv(
+    'DAYTONA_METRICS_DB',
+    os.path.join(SCRIPT_DIR, '..', '.cache', 'sandbox-metrics.sqlite3'),
+)
+
+# 资源档位，按成本从低到高排列；cost 为相对成本单位
+PROFILES = [
+    {"tier": "small", "cpu": 1, "memory": 1, "disk": 3, "cost": 1},
+    {"tier": "standard", "cpu": 1, "memory": 2, "disk": 3, "cost": 2},
+    {"tier": "large", "cpu": 2, "memory": 4, "disk": 5, "cost": 4},
+    {"tier": "xlarge", "cpu": 4, "memory": 8, "disk": 10, "cost": 8},
+]
+TIER_INDEX = {p["tier"]: i for i, p in enumerate(PROFILES)}
+
+# 自动选型的最低档位：small 的 1GB 还要容纳常驻的 VNC 和 Chrome，只留给显式指定，
+# 等测量数据表明峰值足够低后再考虑放开
+MIN_AUTO_TIER = "standard"
+
+# 成本上限，超过时降到不超过上限的最高档位
+MAX_COST = float(os.getenv('DAYTONA_SIZING_MAX_COST', '4'))
+
+# 构建较重的框架，默认从 large 开始
+HEAVY_FRAMEWORKS = ("next", "nuxt", "@angular/core", "gatsby", "@remix-run/react", "@sveltejs/kit")
+# 依赖数量超过该值时也视为重项目
+HEAVY_DEPENDENCY_COUNT = 40
+
+# 影响 node_modules 的 package.json 字段
+DEPENDENCY_FIELDS = ("dependencies", "devDependencies", "peerDependencies", "optionalDependencies")
+
+# 内存峰值需要预留的余量
+MEMORY_HEADROOM = 1.3
+# 超过该耗时（秒）视为 CPU 不足，升一档
+SLOW_SECONDS = {"install": 180, "build": 240}
+# 被 OOM killer 杀掉的退出码
+OOM_EXIT_CODE = 137
+# 参与计算的最近测量条数
+HISTORY_LIMIT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sandboxes (
+  sandbox_id TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  tier TEXT NOT NULL,
+  created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS measurements (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  fingerprint TEXT NOT NULL,
+  tier TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  duration_s REAL NOT NULL,
+  peak_memory_mb REAL,
+  exit_code INTEGER,
+  recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_measurements_fingerprint ON measurements(fingerprint, recorded_at);
+"""
+
+
+class MeasurementStore:
+    """按依赖指纹保存沙盒测量数据的本地 SQLite 存储"""
+
+    def __init__(self, path: str = METRICS_DB):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def register_sandbox(self, sandbox_id: str, fingerprint: str, tier: str):
+        """记录沙盒对应的依赖指纹和档位，之后的测量据此归类"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sandboxes (sandbox_id, fingerprint, tier, created_at) VALUES (?, ?, ?, ?)",
+                (sandbox_id, fingerprint, tier, time.time()),
+            )
+
+    def sandbox_info(self, sandbox_id: str) -> Optional[Tuple[str, str]]:
+        """返回 (fingerprint, tier)，未登记的沙盒返回 None"""
+        row = self.conn.execute(
+            "SELECT fingerprint, tier FROM sandboxes WHERE sandbox_id = ?", (sandbox_id,)
+        ).fetchone()
+        return (row["fingerprint"], row["tier"]) if row else None
+
+    def record(self, fingerprint: str, tier: str, kind: str, duration_s: float,
+               peak_memory_mb: Optional[float], exit_code: Optional[int]):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO measurements (fingerprint, tier, kind, duration_s, peak_memory_mb, exit_code, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, tier, kind, duration_s, peak_memory_mb, exit_code, time.time()),
+            )
+
+    def history(self, fingerprint: str, limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT tier, kind, duration_s, peak_memory_mb, exit_code, recorded_at FROM measurements "
+            "WHERE fingerprint = ? ORDER BY recorded_at DESC LIMIT ?",
+            (fingerprint, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def dependency_fingerprint(package_json: str) -> str:
+    """根据 package.json 的依赖声明计算指纹，依赖不变时指纹不变"""
+    try:
+        pkg = json.loads(package_json)
+        deps = {field: pkg.get(field) or {} for field in DEPENDENCY_FIELDS}
+        data = json.dumps(deps, sort_keys=True)
+    except (ValueError, AttributeError):
+        data = package_json
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+def measurement_kind(command: str) -> Optional[str]:
+    """从命令判断测量类型：install / build，其他命令不记录"""
+    if any(k in command for k in ("npm install", "npm ci", "yarn install", "pnpm install")):
+        return "install"
+    if any(k in command for k in ("npm run build", "next build", "yarn build", "pnpm build", "vite build")):
+        return "build"
+    return None
+
+
+def command_peak_mb(before_mb: Optional[float], after_mb: Optional[float]) -> Optional[float]:
+    """命令执行前后读取的沙盒内存峰值 -> 命令期间的沙盒峰值
+
+    峰值没有升高时，命令期间的最高用量不超过之前的峰值但具体值未知，返回 None，
+    避免把启动阶段（如 Chrome）留下的峰值算到这条命令上。
+    """
+    if before_mb is None or after_mb is None or after_mb <= before_mb:
+        return None
+    return after_mb
+
+
+def baseline_profile(package_json: Optional[str]) -> Tuple[int, str]:
+    """没有历史数据时，根据 package.json 的静态特征选择档位"""
+    if not package_json:
+        return TIER_INDEX[MIN_AUTO_TIER], "no package.json, static project"
+    try:
+        pkg = json.loads(package_json)
+    except ValueError:
+        return TIER_INDEX["standard"], "unparseable package.json"
+
+    deps = {}
+    for field in ("dependencies", "devDependencies"):
+        deps.update(pkg.get(field) or {})
+    heavy = [name for name in HEAVY_FRAMEWORKS if name in deps]
+    if heavy:
+        return TIER_INDEX["large"], f"heavy framework: {', '.join(heavy)}"
+    if len(deps) > HEAVY_DEPENDENCY_COUNT:
+        return TIER_INDEX["large"], f"{len(deps)} dependencies"
+    return TIER_INDEX["standard"], f"{len(deps)} dependencies"
+
+
+def history_profile(history: List[Dict[str, Any]]) -> Tuple[int, str]:
+    """根据历史测量选择档位：按内存峰值留余量，OOM 或过慢时比当时的档位高一档"""
+    peaks = [m["peak_memory_mb"] for m in history if m["peak_memory_mb"] is not None]
+    if peaks:
+        needed_mb = max(peaks) * MEMORY_HEADROOM
+        index = next(
+            (i for i, p in enumerate(PROFILES) if p["memory"] * 1024 >= needed_mb),
+            len(PROFILES) - 1,
+        )
+        reasons = [f"peak {max(peaks):.0f}MB over {len(history)} runs"]
+    else:
+        # 没有内存数据时沿用最近一次的档位
+        index = TIER_INDEX.get(history[0]["tier"], TIER_INDEX["standard"])
+        reasons = [f"{len(history)} runs on {history[0]['tier']}, no memory data"]
+
+    for m in history:
+        measured = TIER_INDEX.get(m["tier"], 0)
+        if m["exit_code"] == OOM_EXIT_CODE:
+            reasons.append(f"OOM on {m['tier']}")
+            index = max(index, min(measured + 1, len(PROFILES) - 1))
+        elif m["duration_s"] > SLOW_SECONDS.get(m["kind"], float("inf")):
+            reasons.append(f"{m['kind']} took {m['duration_s']:.0f}s on {m['tier']}")
+            index = max(index, min(measured + 1, len(PROFILES) - 1))
+
+    return index, ", ".join(dict.fromkeys(reasons))
+
+
+def choose_profile(package_json: Optional[str], fingerprint: Optional[str],
+                   store: Optional[MeasurementStore] = None, requested: Optional[str] = None,
+                   max_cost: float = MAX_COST) -> Dict[str, Any]:
+    """选择资源档位，返回档位配置和选择理由"""
+    if requested and requested != "auto":
+        if requested not in TIER_INDEX:
+            raise ValueError(f"Unknown sandbox profile: {requested} (expected auto or {', '.join(TIER_INDEX)})")
+        index, reason = TIER_INDEX[requested], "requested"
+    else:
+        history = store.history(fingerprint) if store and fingerprint else []
+        if history:
+            index, reason = history_profile(history)
+        else:
+            index, reason = baseline_profile(package_json)
+        index = max(index, TIER_INDEX[MIN_AUTO_TIER])
+
+    if PROFILES[index]["cost"] > max_cost:
+        capped = max(
+            (i for i, p in enumerate(PROFILES) if p["cost"] <= max_cost),
+            default=0,
+        )
+        reason += f"; capped from {PROFILES[index]['tier']} by cost ceiling {max_cost:g}"
+        index = capped
+
+    return {**PROFILES[index], "fingerprint": fingerprint, "reason": reason}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("choose", "history"):
+        print(__doc__)
+        sys.exit(1)
+
+    with closing(MeasurementStore()) as store:
+        if sys.argv[1] == "choose":
+            package_json = sys.stdin.read() or None
+            fingerprint = dependency_fingerprint(package_json) if package_json else None
+            requested = sys.argv[2] if len(sys.argv) > 2 else None
+            print(json.dumps(choose_profile(package_json, fingerprint, store, requested), indent=2))
+        else:
+            if len(sys.argv) < 3:
+                print(__doc__)
+                sys.exit(1)
+            print(json.dumps(store.history(sys.argv[2]), indent=2))
+
+
+if __name__ == "__main__":
+    main()
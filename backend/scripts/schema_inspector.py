@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+数据库 schema 检查工具
+解析 database-schema.sql 得到期望的表、列、索引、函数和触发器，
+用一次 pg_catalog 查询读取数据库实际状态，对比后只生成需要补齐的 DDL
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from sql_tokenizer import split_statements
+
+SCHEMA_FILE = Path(__file__).parent.parent / "docs" / "database-schema.sql"
+
+# 表定义中不是列的条目（表级约束）
+CONSTRAINT_KEYWORDS = ("CONSTRAINT", "PRIMARY", "UNIQUE", "FOREIGN", "CHECK", "EXCLUDE")
+
+# 列定义中的行内键约束；补列时拆成单独的 ADD CONSTRAINT，列本身只带类型、默认值和 NOT NULL
+INLINE_CONSTRAINT_RE = re.compile(
+    r"\s+(?:CONSTRAINT\s+(\w+)\s+)?"
+    r"(PRIMARY\s+KEY|UNIQUE|REFERENCES\s+\w+(?:\s*\([^)]*\))?"
+    r"(?:\s+ON\s+(?:DELETE|UPDATE)\s+(?:CASCADE|RESTRICT|NO\s+ACTION|SET\s+NULL|SET\s+DEFAULT))*)"
+    r"(?=\s|$)",
+    re.IGNORECASE,
+)
+# PostgreSQL 默认约束名的后缀
+CONSTRAINT_SUFFIXES = {"PRIMARY": "pkey", "UNIQUE": "key", "FOREIGN": "fkey", "CHECK": "check", "EXCLUDE": "excl"}
+
+CREATE_TABLE_RE = re.compile(
+    r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)\s*;?$",
+    re.IGNORECASE | re.DOTALL,
+)
+CREATE_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(?:ONLY\s+)?(\w+)",
+    re.IGNORECASE,
+)
+CREATE_FUNCTION_RE = re.compile(
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+(\w+)\s*\(",
+    re.IGNORECASE,
+)
+CREATE_TRIGGER_RE = re.compile(
+    r"CREATE\s+TRIGGER\s+(\w+)\s+.*?\bON\s+(\w+)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# 一次查询取回所有期望对象的目录状态
+CATALOG_QUERY = """
+SELECT 'table' AS kind, c.relname AS table_name, c.relname AS name
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public'
+  AND c.relkind IN ('r', 'p')
+  AND c.relname = ANY(%(tables)s)
+UNION ALL
+SELECT 'column', c.relname, a.attname
+FROM pg_catalog.pg_attribute a
+JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public'
+  AND c.relkind IN ('r', 'p')
+  AND c.relname = ANY(%(tables)s)
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+UNION ALL
+SELECT 'index', t.relname, i.relname
+FROM pg_catalog.pg_index x
+JOIN pg_catalog.pg_class i ON i.oid = x.indexrelid
+JOIN pg_catalog.pg_class t ON t.oid = x.indrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = i.relnamespace
+WHERE n.nspname = 'public'
+  AND i.relname = ANY(%(indexes)s)
+UNION ALL
+SELECT 'function', NULL, p.proname
+FROM pg_catalog.pg_proc p
+JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace
+WHERE n.nspname = 'public'
+  AND p.proname = ANY(%(functions)s)
+UNION ALL
+SELECT 'trigger', c.relname, tg.tgname
+FROM pg_catalog.pg_trigger tg
+JOIN pg_catalog.pg_class c ON c.oid = tg.tgrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public'
+  AND NOT tg.tgisinternal
+  AND tg.tgname = ANY(%(triggers)s)
+"""
+
+
+def _split_top_level(body: str) -> List[str]:
+    """按顶层逗号分割表定义，忽略括号内的逗号"""
+    items = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(body):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append(body[start:i])
+            start = i + 1
+    items.append(body[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def _constraint_name(table: str, kind: str, columns: List[str]) -> str:
+    """与 PostgreSQL 自动生成的约束名一致：{table}_pkey、{table}_{columns}_key 等"""
+    suffix = CONSTRAINT_SUFFIXES[kind]
+    if kind == "PRIMARY":
+        return f"{table}_{suffix}"
+    return "_".join([table, *columns, suffix])
+
+
+def _split_column(table: str, column: str, item: str):
+    """把列定义拆成 (不含键约束的列定义, 行内键约束列表)"""
+    constraints = []
+    for match in INLINE_CONSTRAINT_RE.finditer(item):
+        body = re.sub(r"\s+", " ", match.group(2))
+        if body.upper().startswith("REFERENCES"):
+            kind, body = "FOREIGN", f"FOREIGN KEY ({column}) {body}"
+        else:
+            kind = body.split()[0].upper()
+            body = f"{body} ({column})"
+        constraints.append({
+            "name": match.group(1) or _constraint_name(table, kind, [column]),
+            "columns": [column],
+            "ddl": body,
+        })
+    return INLINE_CONSTRAINT_RE.sub("", item).strip(), constraints
+
+
+def _table_constraint(table: str, item: str, columns: Dict[str, str]) -> Dict[str, Any]:
+    """表级约束；columns 为约束涉及的列（键约束取括号内的列，CHECK 取表达式中出现的列）"""
+    match = re.match(r"CONSTRAINT\s+(\w+)\s+(.*)$", item, re.IGNORECASE | re.DOTALL)
+    name, body = (match.group(1), match.group(2)) if match else (None, item)
+    kind = body.split()[0].upper().split("(")[0]
+    if kind == "CHECK":
+        words = re.findall(r"\w+", body[len("CHECK"):])
+    else:
+        words = re.findall(r"\w+", re.search(r"\(([^)]*)\)", body).group(1))
+    involved = list(dict.fromkeys(w.lower() for w in words if w.lower() in columns))
+    return {
+        "name": name or _constraint_name(table, kind, involved),
+        "columns": involved,
+        "ddl": re.sub(r"\s+", " ", body).strip(),
+    }
+
+
+def parse_schema(sql: str) -> Dict[str, Any]:
+    """
+    解析 schema SQL，返回期望的对象模型:
+    {
+        "tables": {name: {"ddl": str, "columns": {column: definition},
+                          "constraints": [{"name": str, "columns": [column], "ddl": str}]}},
+        "indexes": {name: {"table": str, "ddl": str}},
+        "functions": {name: {"ddl": str}},
+        "triggers": {name: {"table": str, "ddl": str}},
+    }
+    """
+    model: Dict[str, Any] = {"tables": {}, "indexes": {}, "functions": {}, "triggers": {}}
+
+    for statement in split_statements(sql, strip_comments=True):
+        if not statement.endswith(";"):
+            statement += ";"
+
+        match = CREATE_TABLE_RE.match(statement)
+        if match:
+            table = match.group(1).lower()
+            columns = {}
+            constraints = []
+            table_level = []
+            for item in _split_top_level(match.group(2)):
+                name = re.match(r'"?(\w+)', item).group(1)
+                if name.upper() in CONSTRAINT_KEYWORDS:
+                    table_level.append(item)
+                    continue
+                columns[name.lower()], inline = _split_column(table, name.lower(), item)
+                constraints.extend(inline)
+            constraints.extend(_table_constraint(table, item, columns) for item in table_level)
+            model["tables"][table] = {"ddl": statement, "columns": columns, "constraints": constraints}
+            continue
+
+        match = CREATE_INDEX_RE.match(statement)
+        if match:
+            model["indexes"][match.group(1).lower()] = {
+                "table": match.group(2).lower(),
+                "ddl": statement,
+            }
+            continue
+
+        match = CREATE_FUNCTION_RE.match(statement)
+        if match:
+            model["functions"][match.group(1).lower()] = {"ddl": statement}
+            continue
+
+        match = CREATE_TRIGGER_RE.match(statement)
+        if match:
+            model["triggers"][match.group(1).lower()] = {
+                "table": match.group(2).lower(),
+                "ddl": statement,
+            }
+
+    return model
+
+
+def load_schema_model(sql_file: Path = SCHEMA_FILE) -> Dict[str, Any]:
+    """读取并解析 schema 文件"""
+    with open(sql_file, "r", encoding="utf-8") as f:
+        return parse_schema(f.read())
+
+
+def fetch_catalog_state(cursor, model: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    一次往返读取数据库中期望对象的实际状态:
+    {"tables": {table: set(columns)}, "indexes": set, "functions": set, "triggers": set}
+    """
+    cursor.execute(
+        CATALOG_QUERY,
+        {
+            "tables": list(model["tables"]),
+            "indexes": list(model["indexes"]),
+            "functions": list(model["functions"]),
+            "triggers": list(model["triggers"]),
+        },
+    )
+
+    state: Dict[str, Any] = {"tables": {}, "indexes": set(), "functions": set(), "triggers": set()}
+    for kind, table_name, name in cursor.fetchall():
+        if kind == "table":
+            state["tables"].setdefault(table_name, set())
+        elif kind == "column":
+            state["tables"].setdefault(table_name, set()).add(name)
+        elif kind == "index":
+            state["indexes"].add(name)
+        elif kind == "function":
+            state["functions"].add(name)
+        elif kind == "trigger":
+            state["triggers"].add(name)
+    return state
+
+
+def diff_schema(model: Dict[str, Any], state: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    对比期望模型和实际状态，返回需要执行的 DDL 列表（按依赖顺序）
+    每项: {"kind": ..., "name": ..., "ddl": ...}
+    """
+    changes: List[Dict[str, str]] = []
+
+    for table, spec in model["tables"].items():
+        if table not in state["tables"]:
+            changes.append({"kind": "table", "name": table, "ddl": spec["ddl"]})
+            continue
+        existing = state["tables"][table]
+        missing = [column for column in spec["columns"] if column not in existing]
+        for column in missing:
+            changes.append({
+                "kind": "column",
+                "name": f"{table}.{column}",
+                "ddl": f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {spec['columns'][column]};",
+            })
+        # 键约束单独添加：只补涉及新增列的约束，已有列上的约束视为已存在
+        for constraint in spec.get("constraints", []):
+            if any(column in missing for column in constraint["columns"]):
+                changes.append({
+                    "kind": "constraint",
+                    "name": constraint["name"],
+                    "ddl": f"ALTER TABLE {table} ADD CONSTRAINT {constraint['name']} {constraint['ddl']};",
+                })
+
+    for function, spec in model["functions"].items():
+        if function not in state["functions"]:
+            changes.append({"kind": "function", "name": function, "ddl": spec["ddl"]})
+
+    for index, spec in model["indexes"].items():
+        if index not in state["indexes"]:
+            changes.append({"kind": "index", "name": index, "ddl": spec["ddl"]})
+
+    for trigger, spec in model["triggers"].items():
+        if trigger not in state["triggers"]:
+            changes.append({"kind": "trigger", "name": trigger, "ddl": spec["ddl"]})
+
+    return changes
+
+
+def inspect_schema(conn, model: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """使用已有连接检查 schema，返回需要补齐的 DDL"""
+    if model is None:
+        model = load_schema_model()
+    cursor = conn.cursor()
+    try:
+        state = fetch_catalog_state(cursor, model)
+    finally:
+        cursor.close()
+    return diff_schema(model, state)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+流式 SQL 语句切分器
+单遍扫描，从文件对象中逐条产出完整的 SQL 语句，支持 PostgreSQL 的各种引号形式:
+  - 字符串 '...'（'' 转义）和 E'...'（反斜杠转义）
+  - 带引号的标识符 "..."
+  - 美元引号 $$...$$ 和带标签的 $fn$...$fn$
+  - 行注释 -- 和可嵌套的块注释 /* ... */
+"""
+
+import sys
+from typing import IO, Iterator, List
+
+NORMAL = 0
+SINGLE_QUOTE = 1
+DOUBLE_QUOTE = 2
+DOLLAR_QUOTE = 3
+LINE_COMMENT = 4
+BLOCK_COMMENT = 5
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def _is_ident_char(ch: str) -> bool:
+    """标识符字符（用于判断 $ 和 E'' 是否属于前一个单词）"""
+    return ch.isalnum() or ch == "_" or ch == "$" or ord(ch) > 127
+
+
+def _is_tag_char(ch: str, first: bool) -> bool:
+    """美元引号标签字符，首字符不能是数字"""
+    if first:
+        return ch.isalpha() or ch == "_" or ord(ch) > 127
+    return ch.isalnum() or ch == "_" or ord(ch) > 127
+
+
+class StatementSplitter:
+    """
+    推送式语句切分器: 多次 feed() 文本块，每次返回已完整的语句，最后调用 close()
+    语句之间的注释和空白会被丢弃，语句末尾保留分号
+    """
+
+    def __init__(self, strip_comments: bool = False):
+        self.strip_comments = strip_comments
+        self._buf = ""
+        self._pos = 0
+        self._start = None  # 当前语句在 _buf 中的起点，None 表示语句尚未开始或处于被剥离的注释中
+        self._started = False
+        self._pieces: List[str] = []  # 当前语句已扫描、已移出 _buf 的部分
+        self._state = NORMAL
+        self._tag = ""
+        self._depth = 0
+        self._escape = False
+        self._lookbehind = ""
+
+    def feed(self, data: str) -> List[str]:
+        """追加文本块，返回其中已完整的语句"""
+        self._compact()
+        self._buf += data
+        return self._scan(final=False)
+
+    def close(self) -> List[str]:
+        """输入结束，返回剩余的语句（最后一条语句可以没有分号）"""
+        statements = self._scan(final=True)
+        if self._started:
+            if self._start is not None:
+                self._pieces.append(self._buf[self._start:])
+            statement = "".join(self._pieces).strip()
+            if statement:
+                statements.append(statement)
+        self._buf = ""
+        self._pos = 0
+        self._start = None
+        self._started = False
+        self._pieces = []
+        return statements
+
+    def _compact(self):
+        """把已扫描的部分移出缓冲区，保证每个字符只被复制常数次"""
+        if self._pos == 0:
+            return
+        self._lookbehind = (self._lookbehind + self._buf[max(0, self._pos - 2):self._pos])[-2:]
+        if self._start is not None:
+            self._pieces.append(self._buf[self._start:self._pos])
+            self._start = 0
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+
+    def _before(self) -> str:
+        """当前位置之前的两个字符"""
+        return (self._lookbehind + self._buf[max(0, self._pos - 2):self._pos])[-2:]
+
+    def _begin_statement(self):
+        if not self._started:
+            self._started = True
+            self._start = self._pos
+
+    def _begin_comment(self, state: int):
+        self._state = state
+        if self.strip_comments and self._start is not None:
+            self._pieces.append(self._buf[self._start:self._pos])
+            self._pieces.append(" ")
+            self._start = None
+
+    def _end_comment(self):
+        self._state = NORMAL
+        if self._started and self._start is None:
+            self._start = self._pos
+
+    def _emit(self) -> str:
+        self._pieces.append(self._buf[self._start:self._pos])
+        statement = "".join(self._pieces).strip()
+        self._pieces = []
+        self._start = None
+        self._started = False
+        return statement
+
+    def _scan(self, final: bool) -> List[str]:
+        statements = []
+        buf = self._buf
+        end = len(buf)
+
+        while self._pos < end:
+            pos = self._pos
+            ch = buf[pos]
+            state = self._state
+
+            if state == NORMAL:
+                if ch == ";":
+                    self._begin_statement()
+                    self._pos = pos + 1
+                    statements.append(self._emit())
+                    continue
+                if ch == "-" or ch == "/":
+                    if pos + 1 >= end and not final:
+                        break
+                    nxt = buf[pos + 1] if pos + 1 < end else ""
+                    if ch == "-" and nxt == "-":
+                        self._begin_comment(LINE_COMMENT)
+                        self._pos = pos + 2
+                        continue
+                    if ch == "/" and nxt == "*":
+                        self._begin_comment(BLOCK_COMMENT)
+                        self._depth = 1
+                        self._pos = pos + 2
+                        continue
+                    self._begin_statement()
+                    self._pos = pos + 1
+                    continue
+                if ch == "'":
+                    before = self._before()
+                    self._escape = (
+                        len(before) > 0
+                        and before[-1] in "eE"
+                        and (len(before) < 2 or not _is_ident_char(before[-2]))
+                    )
+                    self._begin_statement()
+                    self._state = SINGLE_QUOTE
+                    self._pos = pos + 1
+                    continue
+                if ch == '"':
+                    self._begin_statement()
+                    self._state = DOUBLE_QUOTE
+                    self._pos = pos + 1
+                    continue
+                if ch == "$":
+                    self._begin_statement()
+                    before = self._before()
+                    if before and _is_ident_char(before[-1]):
+                        # 标识符中的 $，或者 $1 这样的参数
+                        self._pos = pos + 1
+                        continue
+                    j = pos + 1
+                    while j < end and buf[j] != "$" and _is_tag_char(buf[j], j == pos + 1):
+                        j += 1
+                    if j >= end and not final:
+                        break
+                    if j < end and buf[j] == "$":
+                        self._tag = buf[pos:j + 1]
+                        self._state = DOLLAR_QUOTE
+                        self._pos = j + 1
+                    else:
+                        self._pos = pos + 1
+                    continue
+                if not ch.isspace():
+                    self._begin_statement()
+                self._pos = pos + 1
+
+            elif state == SINGLE_QUOTE:
+                if self._escape and ch == "\\":
+                    if pos + 1 >= end and not final:
+                        break
+                    self._pos = pos + 2
+                    continue
+                if ch == "'":
+                    if pos + 1 >= end and not final:
+                        break
+                    if pos + 1 < end and buf[pos + 1] == "'":
+                        self._pos = pos + 2
+                        continue
+                    self._state = NORMAL
+                self._pos = pos + 1
+
+            elif state == DOUBLE_QUOTE:
+                if ch == '"':
+                    if pos + 1 >= end and not final:
+                        break
+                    if pos + 1 < end and buf[pos + 1] == '"':
+                        self._pos = pos + 2
+                        continue
+                    self._state = NORMAL
+                self._pos = pos + 1
+
+            elif state == DOLLAR_QUOTE:
+                close = buf.find(self._tag, pos)
+                if close < 0:
+                    # 保留可能是结束标签前缀的尾部，等待更多数据
+                    self._pos = max(pos, end - len(self._tag) + 1)
+                    break
+                self._state = NORMAL
+                self._pos = close + len(self._tag)
+
+            elif state == LINE_COMMENT:
+                newline = buf.find("\n", pos)
+                if newline < 0:
+                    self._pos = end
+                    break
+                self._pos = newline
+                self._end_comment()
+
+            elif state == BLOCK_COMMENT:
+                if ch == "*" or ch == "/":
+                    if pos + 1 >= end and not final:
+                        break
+                    pair = buf[pos:pos + 2]
+                    if pair == "*/":
+                        self._depth -= 1
+                        self._pos = pos + 2
+                        if self._depth == 0:
+                            self._end_comment()
+                        continue
+                    if pair == "/*":
+                        self._depth += 1
+                        self._pos = pos + 2
+                        continue
+                self._pos = pos + 1
+
+        return statements
+
+
+def iter_statements(
+    stream: IO[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    strip_comments: bool = False,
+) -> Iterator[str]:
+    """从文件对象中流式读取，逐条产出完整语句，内存占用与单条语句大小相关"""
+    splitter = StatementSplitter(strip_comments=strip_comments)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        for statement in splitter.feed(chunk):
+            yield statement
+    for statement in splitter.close():
+        yield statement
+
+
+def split_statements(sql: str, strip_comments: bool = False) -> List[str]:
+    """切分整段 SQL 文本"""
+    splitter = StatementSplitter(strip_comments=strip_comments)
+    return splitter.feed(sql) + splitter.close()
+
+
+if __name__ == "__main__":
+    # 用法: python sql_tokenizer.py <file.sql>，每条语句之间输出一个空行
+    if len(sys.argv) < 2:
+        print("Usage: python sql_tokenizer.py <file.sql>", file=sys.stderr)
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        for statement in iter_statements(f):
+            print(statement)
+            print()
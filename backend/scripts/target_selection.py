@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Daytona target（区域）选择
+测量每个候选 target 控制面的往返延迟，排名缓存在本地磁盘（带 TTL），新沙盒使用最快的健康 target；
+已有沙盒始终路由到创建时的 target。
+
+延迟按 URL 测量：共用同一个 URL 的 target 无法区分，只按配置顺序选择（会打印警告），
+所有候选共用一个 URL 时不探测。沙盒所在 target 只登记在本机，其它主机上的 worker
+查不到记录时逐个 target 查找该沙盒（见 TargetRouter.home 的 locate 参数）并登记到本机。
+
+候选配置（DAYTONA_TARGETS，逗号分隔，未配置 URL 的使用 DAYTONA_SERVER_URL）:
+  DAYTONA_TARGETS="us=https://app.daytona.io/api,eu=https://eu.example.com/api"
+
+用法:
+  python3 scripts/target_selection.py rank [--refresh]
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TARGETS_DB = os.getenv(
+    'DAYTONA_TARGETS_DB',
+    os.path.join(SCRIPT_DIR, '..', '.cache', 'sandbox-targets.sqlite3'),
+)
+DEFAULT_SERVER_URL = 'https://app.daytona.io/api'
+
+# 排名缓存有效期（秒）
+RANKING_TTL = int(os.getenv('DAYTONA_TARGET_TTL', '600'))
+# 每个 target 的探测次数，取中位数
+PROBE_ATTEMPTS = 3
+PROBE_TIMEOUT = 2.0
+
+Route = Tuple[str, str]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS target_ranking (
+  target TEXT NOT NULL,
+  api_url TEXT NOT NULL,
+  rtt_ms REAL,
+  measured_at REAL NOT NULL,
+  PRIMARY KEY (target, api_url)
+);
+CREATE TABLE IF NOT EXISTS sandbox_homes (
+  sandbox_id TEXT PRIMARY KEY,
+  target TEXT NOT NULL,
+  api_url TEXT NOT NULL,
+  created_at REAL NOT NULL
+);
+"""
+
+
+def parse_candidates(spec: Optional[str], default_target: str = 'us',
+                     default_url: str = DEFAULT_SERVER_URL) -> List[Route]:
+    """解析 "us,eu=https://..." 形式的候选列表，保持配置顺序（延迟相同时靠前的优先）"""
+    routes: List[Route] = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        target, _, url = item.partition('=')
+        route = (target.strip(), url.strip() or default_url)
+        if route not in routes:
+            routes.append(route)
+    return routes or [(default_target, default_url)]
+
+
+def shared_url_targets(candidates: List[Route]) -> List[List[str]]:
+    """共用同一个控制面 URL 的 target 分组（只返回两个及以上的组）"""
+    groups: Dict[str, List[str]] = {}
+    for target, url in candidates:
+        groups.setdefault(url, []).append(target)
+    return [targets for targets in groups.values() if len(targets) > 1]
+
+
+def candidates_from_env() -> List[Route]:
+    return parse_candidates(
+        os.getenv('DAYTONA_TARGETS'),
+        os.getenv('DAYTONA_TARGET', 'us'),
+        os.getenv('DAYTONA_SERVER_URL', DEFAULT_SERVER_URL),
+    )
+
+
+def probe_rtt(api_url: str, attempts: int = PROBE_ATTEMPTS, timeout: float = PROBE_TIMEOUT) -> Optional[float]:
+    """对控制面发起无鉴权 GET，返回往返延迟中位数（毫秒）；连接失败或 5xx 视为不健康，返回 None"""
+    samples = []
+    for _ in range(attempts):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(api_url, timeout=timeout) as response:
+                response.read(0)
+        except urllib.error.HTTPError as e:
+            # 4xx（未鉴权、路径不存在）说明控制面可达
+            if e.code >= 500:
+                return None
+        except (urllib.error.URLError, OSError):
+            return None
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+class TargetRouter:
+    """为新沙盒选择最快的健康 target，为已有沙盒返回其所在 target"""
+
+    def __init__(self, candidates: List[Route], path: str = TARGETS_DB, ttl: float = RANKING_TTL,
+                 probe: Callable[[str], Optional[float]] = probe_rtt, clock: Callable[[], float] = time.time):
+        self.candidates = candidates
+        self.ttl = ttl
+        self.probe = probe
+        self.clock = clock
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _cached_ranking(self) -> Optional[List[Dict[str, Any]]]:
+        rows = self.conn.execute("SELECT target, api_url, rtt_ms, measured_at FROM target_ranking").fetchall()
+        cached = {(target, url): (rtt, measured_at) for target, url, rtt, measured_at in rows}
+        now = self.clock()
+        if any(
+            route not in cached or now - cached[route][1] > self.ttl
+            for route in self.candidates
+        ):
+            return None
+        return [
+            {"target": target, "api_url": url, "rtt_ms": cached[(target, url)][0]}
+            for target, url in self.candidates
+        ]
+
+    def _measure(self) -> List[Dict[str, Any]]:
+        """并发探测所有候选，总耗时约等于最慢的一个"""
+        urls = list(dict.fromkeys(url for _, url in self.candidates))
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            rtts = dict(zip(urls, pool.map(self.probe, urls)))
+
+        now = self.clock()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO target_ranking (target, api_url, rtt_ms, measured_at) VALUES (?, ?, ?, ?)",
+                [(target, url, rtts[url], now) for target, url in self.candidates],
+            )
+        return [{"target": target, "api_url": url, "rtt_ms": rtts[url]} for target, url in self.candidates]
+
+    def ranking(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """按延迟排序的候选列表，不健康的（rtt_ms 为 None）排在最后"""
+        entries = None if refresh else self._cached_ranking()
+        if entries is None:
+            entries = self._measure()
+        return sorted(entries, key=lambda e: (e["rtt_ms"] is None, e["rtt_ms"] or 0))
+
+    def choose(self) -> Route:
+        """新沙盒使用的 target；只有一个候选或所有候选共用一个 URL 时不探测"""
+        if len({url for _, url in self.candidates}) == 1:
+            return self.candidates[0]
+        for targets in shared_url_targets(self.candidates):
+            print(f"Warning: targets {', '.join(targets)} share a server URL, latency cannot tell them apart",
+                  file=sys.stderr)
+        best = self.ranking()[0]
+        if best["rtt_ms"] is None:
+            # 全部探测失败时退回配置中的第一个
+            return self.candidates[0]
+        return best["target"], best["api_url"]
+
+    def remember(self, sandbox_id: str, route: Route):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sandbox_homes (sandbox_id, target, api_url, created_at) VALUES (?, ?, ?, ?)",
+                (sandbox_id, route[0], route[1], self.clock()),
+            )
+
+    def forget(self, sandbox_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM sandbox_homes WHERE sandbox_id = ?", (sandbox_id,))
+
+    def home(self, sandbox_id: str, locate: Optional[Callable[[Route], bool]] = None) -> Route:
+        """沙盒创建时的 target
+
+        本机没有登记时（其它主机创建的，或早于本功能创建的），按配置顺序用 locate(route)
+        查找沙盒所在的 target 并登记；找不到或未提供 locate 时使用配置中的第一个。
+        """
+        row = self.conn.execute(
+            "SELECT target, api_url FROM sandbox_homes WHERE sandbox_id = ?", (sandbox_id,)
+        ).fetchone()
+        if row:
+            return row[0], row[1]
+        if locate:
+            for route in self.candidates:
+                if locate(route):
+                    self.remember(sandbox_id, route)
+                    return route
+        return self.candidates[0]
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "rank":
+        print(__doc__)
+        sys.exit(1)
+
+    router = TargetRouter(candidates_from_env())
+    try:
+        for entry in router.ranking(refresh="--refresh" in sys.argv):
+            rtt = f"{entry['rtt_ms']:.0f}ms" if entry["rtt_ms"] is not None else "unhealthy"
+            print(f"  {entry['target']:<8} {rtt:>10}  {entry['api_url']}")
+    finally:
+        router.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+批量导入导出测试
+用内存中的假数据库代替 PostgreSQL，验证过滤条件、分块范围、分块级并行和断点续传
+"""
+
+import gzip
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import bulk
+from bulk import CHECKPOINT_FILE, build_filter, chunk_range
+
+
+class FakeDatabase:
+    """按主键有序的内存表；copy_expert 按分块范围输出 id，可注入失败和延迟"""
+
+    def __init__(self, tables, delay: float = 0.0):
+        self.tables = {name: sorted(ids) for name, ids in tables.items()}
+        self.delay = delay
+        self.fail = set()
+        self.lock = threading.Lock()
+        self.snapshots = []
+        self.active = 0
+        self.max_active = 0
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.params = {}
+
+    def set_session(self, **kwargs):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+        self.db = conn.db
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        if "pg_export_snapshot" in sql:
+            self.rows = [("snapshot-1",)]
+        elif "SET TRANSACTION SNAPSHOT" in sql:
+            with self.db.lock:
+                self.db.snapshots.append(params[0])
+        elif "pg_attribute" in sql:
+            self.rows = [("id",)]
+        elif "row_number()" in sql:
+            ids = self.db.tables[re.search(r"FROM (\w+) WHERE", sql).group(1)]
+            self.rows = [(i,) for i in ids[params["chunk_rows"] - 1::params["chunk_rows"]]]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def mogrify(self, sql, params):
+        self.conn.params = params
+        return sql.encode("utf-8")
+
+    def copy_expert(self, sql, f, size=None):
+        table = re.search(r"FROM (\w+) WHERE", sql).group(1)
+        lower, upper = self.conn.params.get("lower"), self.conn.params.get("upper")
+        with self.db.lock:
+            if (table, lower) in self.db.fail:
+                raise RuntimeError(f"injected failure for {table} after {lower}")
+            self.db.active += 1
+            self.db.max_active = max(self.db.max_active, self.db.active)
+        time.sleep(self.db.delay)
+        ids = [i for i in self.db.tables[table] if (lower is None or i > lower) and (upper is None or i <= upper)]
+        f.write("".join(f"{i}\n" for i in ids).encode("utf-8"))
+        with self.db.lock:
+            self.db.active -= 1
+
+    def close(self):
+        pass
+
+
+def export_args(out_dir: str, **overrides):
+    args = dict(out=out_dir, project_id=None, since=None, until=None, format="csv", dsn=None,
+                no_snapshot=False, jobs=4, tables=["projects", "messages"], chunk_rows=10, compresslevel=1)
+    args.update(overrides)
+    return SimpleNamespace(**args)
+
+
+def run_export(db: FakeDatabase, args) -> bool:
+    original = bulk.connection_factory
+    bulk.connection_factory = lambda dsn: db.connect
+    try:
+        return bulk.run_export(args)
+    finally:
+        bulk.connection_factory = original
+
+
+def exported_ids(out_dir: str, table: str):
+    ids = []
+    for path in sorted(Path(out_dir).glob(f"{table}.*.csv.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            ids.extend(f.read().split())
+    return ids
+
+
+def test_build_filter():
+    """测试 1: 按表选择过滤列，未指定的条件不出现在 WHERE 中，code_blobs 按引用过滤"""
+    assert build_filter("messages", {}) == ("TRUE", {})
+    where, params = build_filter("messages", {"project_ids": ["p1"], "since": "2025-01-01", "until": None})
+    assert where == "TRUE AND project_id = ANY(%(project_ids)s) AND timestamp >= %(since)s", where
+    assert params == {"project_ids": ["p1"], "since": "2025-01-01"}
+    where, _ = build_filter("projects", {"project_ids": ["p1"], "until": "2025-06-01"})
+    assert where == "TRUE AND id = ANY(%(project_ids)s) AND updated_at < %(until)s", where
+
+    # code_blobs 只在有过滤条件时限制为过滤后的状态和消息引用的内容
+    assert build_filter("code_blobs", {"project_ids": None, "since": None, "until": None}) == ("TRUE", {})
+    where, params = build_filter("code_blobs", {"project_ids": ["p1"]})
+    assert where.startswith("TRUE AND sha256 IN (") and "s.state -> 'code_refs'" in where, where
+    assert "a -> 'content_refs'" in where and where.count("project_id = ANY(%(project_ids)s)") == 2, where
+    assert params == {"project_ids": ["p1"]}
+
+
+def test_chunk_range():
+    """测试 2: 分块范围 (lower, upper] 首尾开放且相邻分块不重叠"""
+    plan = {"boundaries": ["b", "d"]}
+    assert chunk_range(plan, 0) == ("id <= %(upper)s", {"upper": "b"})
+    assert chunk_range(plan, 1) == ("id > %(lower)s AND id <= %(upper)s", {"lower": "b", "upper": "d"})
+    assert chunk_range(plan, 2) == ("id > %(lower)s", {"lower": "d"})
+    assert chunk_range({"boundaries": []}, 0) == ("TRUE", {})
+    assert chunk_range({"key": "sha256", "boundaries": ["ab"]}, 1) == ("sha256 > %(lower)s", {"lower": "ab"})
+
+
+def test_chunks_run_in_parallel_on_shared_snapshot():
+    """测试 3: 同一张大表的分块并行导出，所有工作连接导入同一个快照"""
+    db = FakeDatabase({"projects": ["p1", "p2"], "messages": [f"m{i:04d}" for i in range(80)]}, delay=0.05)
+    out_dir = tempfile.mkdtemp(prefix="atom-bulk-")
+    assert run_export(db, export_args(out_dir))
+    assert exported_ids(out_dir, "messages") == db.tables["messages"]
+    assert exported_ids(out_dir, "projects") == db.tables["projects"]
+    assert db.max_active > 2, db.max_active
+    assert len(db.snapshots) > 1 and set(db.snapshots) == {"snapshot-1"}, db.snapshots
+
+
+def test_checkpoint_resume():
+    """测试 4: 分块失败后重新运行只导出未完成的分块，结果不重复不遗漏"""
+    db = FakeDatabase({"projects": ["p1", "p2"], "messages": [f"m{i:04d}" for i in range(45)]})
+    db.fail.add(("messages", "m0019"))
+    out_dir = tempfile.mkdtemp(prefix="atom-bulk-")
+    assert not run_export(db, export_args(out_dir))
+    assert not (Path(out_dir) / "messages.00002.csv.gz").exists()
+    with open(Path(out_dir) / CHECKPOINT_FILE) as f:
+        assert "messages.00002.csv.gz" not in f.read()
+
+    db.fail.clear()
+    copied = []
+    original = FakeCursor.copy_expert
+    FakeCursor.copy_expert = lambda self, sql, f, size=None: (copied.append(self.conn.params.get("lower")),
+                                                               original(self, sql, f, size))
+    try:
+        assert run_export(db, export_args(out_dir))
+    finally:
+        FakeCursor.copy_expert = original
+    assert copied == ["m0019"], copied
+    assert exported_ids(out_dir, "messages") == db.tables["messages"]
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("批量导入导出测试")
+    print("=" * 60)
+
+    tests = [
+        test_build_filter,
+        test_chunk_range,
+        test_chunks_run_in_parallel_on_shared_snapshot,
+        test_checkpoint_resume,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+代码内容寻址存储测试
+验证 state 和 artifacts 改写为哈希引用、非字符串内容保持内联，以及回填按主键分批、每批提交
+"""
+
+import os
+import sys
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import code_blobs
+from code_blobs import dehydrate_artifacts, dehydrate_code, dehydrate_state, hash_content
+
+
+def test_dehydrate_code():
+    """测试 1: 相同内容共用一个哈希，含非字符串内容时整份不改写"""
+    refs, blobs = dehydrate_code({"a.js": "x", "b.js": "x", "c.js": "y"})
+    assert refs == {"a.js": hash_content("x"), "b.js": hash_content("x"), "c.js": hash_content("y")}
+    assert blobs == {hash_content("x"): "x", hash_content("y"): "y"}
+    assert dehydrate_code({"a.js": "x", "package.json": {"name": "app"}}) == (None, {})
+    assert dehydrate_code({}) == ({}, {})
+
+
+def test_dehydrate_state():
+    """测试 2: state.code 换成 code_refs 并保留其它字段，没有 code 或含非字符串内容时返回 None"""
+    state = {"code": {"index.html": "<html></html>"}, "step": 3}
+    new_state, blobs = dehydrate_state(state)
+    digest = hash_content("<html></html>")
+    assert new_state == {"step": 3, "code_refs": {"index.html": digest}}, new_state
+    assert blobs == {digest: "<html></html>"}
+    assert "code" in state, "input state must not be modified"
+    assert dehydrate_state({"step": 3}) == (None, {})
+    assert dehydrate_state({"code_refs": {}}) == (None, {})
+    assert dehydrate_state({"code": {"data.json": [1, 2]}}) == (None, {})
+    assert dehydrate_state(None) == (None, {})
+
+
+def test_dehydrate_artifacts():
+    """测试 3: 只改写 content 为字符串映射的 code artifact，其它 artifact 原样保留"""
+    artifacts = [
+        {"type": "code", "title": "v1", "content": {"a.js": "1"}},
+        {"type": "text", "content": {"a.js": "1"}},
+        {"type": "code", "content": {"a.js": {"nested": True}}},
+        {"type": "code", "content": "not a map"},
+        "raw",
+    ]
+    result, blobs = dehydrate_artifacts(artifacts)
+    assert result[0] == {"type": "code", "title": "v1", "content_refs": {"a.js": hash_content("1")}}, result[0]
+    assert result[1:] == artifacts[1:], result
+    assert blobs == {hash_content("1"): "1"}
+    assert dehydrate_artifacts(artifacts[1:]) == (None, {})
+    assert dehydrate_artifacts(None) == (None, {})
+
+
+class FakeCursor:
+    """按 id 排序返回 id > last_id 的前 limit 行，记录每次查询的 last_id"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows)
+        self.last_ids = []
+        self.result = []
+
+    def execute(self, sql, params=None):
+        last_id = params["last_id"]
+        self.last_ids.append(last_id)
+        remaining = [row for row in self.rows if last_id is None or row[0] > last_id]
+        self.result = remaining[:params["limit"]]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+
+def run_backfill(rows, batch_size: int, dry_run: bool):
+    """用假的 execute_values 记录写入的 blob 和 UPDATE 行，执行后恢复模块函数"""
+    inserted, updated = [], []
+
+    def fake_execute_values(cursor, sql, values, fetch=False):
+        if sql.startswith("INSERT INTO code_blobs"):
+            inserted.extend(values)
+            return [(len(content.encode("utf-8")),) for _, content in values]
+        updated.extend(row_id for row_id, _ in values)
+        return None
+
+    cursor = FakeCursor(rows)
+    conn = FakeConn(cursor)
+    original = code_blobs.execute_values
+    code_blobs.execute_values = fake_execute_values
+    try:
+        stats = code_blobs._backfill_table(conn, "messages", "artifacts", dehydrate_artifacts, batch_size, dry_run)
+    finally:
+        code_blobs.execute_values = original
+    return stats, cursor.last_ids, conn.commits, inserted, updated
+
+
+def test_backfill_batches():
+    """测试 4: 按主键分批推进、每批提交一次，跳过无需改写的行；试运行只统计不写入"""
+    rows = [
+        (f"m{i}", [{"type": "code", "content": {"a.js": f"content {i}"}}]) for i in range(5)
+    ] + [("m9", [{"type": "code", "content": {"a.js": 1}}])]
+    stats, last_ids, commits, inserted, updated = run_backfill(rows, batch_size=2, dry_run=False)
+    assert last_ids == [None, "m1", "m3", "m9"], last_ids
+    assert commits == 3
+    assert updated == ["m0", "m1", "m2", "m3", "m4"], updated
+    assert len(inserted) == 5 and stats["rows"] == 5
+    assert stats["blob_bytes"] == sum(len(f"content {i}") for i in range(5))
+
+    dry_stats, _, _, inserted, updated = run_backfill(rows, batch_size=2, dry_run=True)
+    assert inserted == [] and updated == []
+    assert dry_stats == stats, (dry_stats, stats)
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("代码内容寻址存储测试")
+    print("=" * 60)
+
+    tests = [
+        test_dehydrate_code,
+        test_dehydrate_state,
+        test_dehydrate_artifacts,
+        test_backfill_batches,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+命令日志有界读取测试
+用本地 sh 代替沙盒执行重定向和读取脚本，验证截断标记、字节游标和编码
+"""
+
+import base64
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import command_logs
+from command_logs import build_read_script, encode_output, parse_read_output, redirect_command
+
+command_logs.LOG_DIR = tempfile.mkdtemp(prefix="atom-logs-")
+
+
+def sh(script: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["sh", "-c", script], capture_output=True, text=True)
+
+
+def read(log_id: str, offset: int = 0, head_bytes: int = 16, tail_bytes: int = 32):
+    output = sh(build_read_script(log_id, offset, head_bytes, tail_bytes)).stdout
+    return parse_read_output(output, offset, head_bytes, tail_bytes)
+
+
+def log_bytes(log_id: str) -> bytes:
+    with open(command_logs.log_path(log_id), "rb") as f:
+        return f.read()
+
+
+def test_redirect_keeps_exit_code():
+    """测试 1: 重定向后保留原命令退出码，stdout/stderr 都写入日志，读取时返回退出码"""
+    result = sh(redirect_command("echo out; echo err >&2; exit 3", "exit"))
+    assert result.returncode == 3
+    assert result.stdout == ""
+    assert log_bytes("exit") == b"out\nerr\n"
+    assert read("exit")["exit_code"] == 3
+
+
+def test_redirect_keeps_session_shell_alive():
+    """测试 2: 同一个常驻 shell 中连续执行两条重定向命令，shell 不退出且各自记录退出码"""
+    shell = subprocess.Popen(["sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        for log_id, command in (("session-1", "echo first; exit 2"), ("session-2", "echo second")):
+            shell.stdin.write(redirect_command(command, log_id) + "\n")
+            shell.stdin.write("echo rc=$?\n")
+            shell.stdin.flush()
+            assert shell.stdout.readline() == f"rc={2 if log_id == 'session-1' else 0}\n"
+        assert shell.poll() is None, "session shell exited"
+    finally:
+        shell.stdin.close()
+        shell.wait(timeout=5)
+    assert log_bytes("session-1") == b"first\n" and log_bytes("session-2") == b"second\n"
+    assert read("session-1")["exit_code"] == 2 and read("session-2")["exit_code"] == 0
+
+
+def test_small_log_returned_whole():
+    """测试 3: 日志不超过 head + tail 时完整返回，不加截断标记"""
+    sh(redirect_command("printf 'hello\\nworld\\n'", "small"))
+    result = read("small")
+    assert result["output"] == "hello\nworld\n"
+    assert result["truncated_bytes"] == 0
+    assert result["next_offset"] == result["size"] == 12
+
+
+def test_large_log_truncated():
+    """测试 4: 大日志只返回头尾两段，标记中记录丢弃的字节数"""
+    sh(redirect_command("seq 1 5000", "large"))
+    data = log_bytes("large")
+    result = read("large", head_bytes=16, tail_bytes=32)
+    head, _, rest = result["output"].partition("\n... [truncated ")
+    dropped, _, tail = rest.partition(" bytes] ...\n")
+    assert head.encode() == data[:16]
+    assert tail.encode() == data[-32:]
+    assert int(dropped) == result["truncated_bytes"] == len(data) - 48
+    assert result["next_offset"] == len(data)
+
+
+def test_cursor_reads_increments():
+    """测试 5: 按 next_offset 续读只返回新增内容，越界偏移返回空"""
+    sh(redirect_command("seq 1 3", "cursor"))
+    first = read("cursor")
+    with open(command_logs.log_path("cursor"), "a") as f:
+        f.write("4\n5\n")
+    second = read("cursor", first["next_offset"])
+    assert second["output"] == "4\n5\n"
+    assert second["offset"] == first["next_offset"]
+    third = read("cursor", second["next_offset"] + 100)
+    assert third["output"] == "" and third["next_offset"] == second["next_offset"]
+    missing = read("does-not-exist")
+    assert missing["output"] == "" and missing["size"] == 0
+    assert missing["exit_code"] is None
+
+
+def test_gzip_base64_encoding():
+    """测试 6: gzip+base64 编码可以还原为文本输出"""
+    sh(redirect_command("seq 1 5000", "gzip"))
+    result = read("gzip", head_bytes=1024, tail_bytes=1024)
+    encoded = encode_output(result, "gzip+base64")
+    assert encoded["encoding"] == "gzip+base64"
+    assert gzip.decompress(base64.b64decode(encoded["output"])).decode() == result["output"]
+    assert encode_output(result)["output"] == result["output"]
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("命令日志有界读取测试")
+    print("=" * 60)
+
+    tests = [
+        test_redirect_keeps_exit_code,
+        test_redirect_keeps_session_shell_alive,
+        test_small_log_returned_whole,
+        test_large_log_truncated,
+        test_cursor_reads_increments,
+        test_gzip_base64_encoding,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
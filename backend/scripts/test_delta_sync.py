@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+沙盒文件增量上传测试
+用本地 sh 和文件系统代替沙盒执行签名和重建脚本，验证差异大小、重建结果和各种退回完整上传的情况
+"""
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from delta_sync import PATCH_MIN_BYTES, block_size_for, compute_delta, sync_file
+
+
+class LocalSandbox:
+    """本地替身：process.exec 用 sh 执行，fs.upload_file 写本地文件，记录上传字节数"""
+
+    def __init__(self):
+        self.uploaded = 0
+        self.process = SimpleNamespace(exec=self._exec)
+        self.fs = SimpleNamespace(upload_file=self._upload)
+
+    def _exec(self, command: str):
+        result = subprocess.run(["sh", "-c", command], capture_output=True, text=True)
+        return SimpleNamespace(exit_code=result.returncode, result=result.stdout)
+
+    def _upload(self, content: bytes, path: str):
+        self.uploaded += len(content)
+        with open(path, "wb") as f:
+            f.write(content)
+
+
+rng = random.Random(42)
+BASE = bytes(rng.getrandbits(8) for _ in range(200 * 1024))
+WORKDIR = tempfile.mkdtemp(prefix="atom-delta-")
+
+
+def sync(name: str, old, new: bytes):
+    path = os.path.join(WORKDIR, name)
+    if old is not None:
+        with open(path, "wb") as f:
+            f.write(old)
+    sandbox = LocalSandbox()
+    result = sync_file(sandbox, path, new)
+    with open(path, "rb") as f:
+        assert f.read() == new, f"{name}: content mismatch"
+    assert result["sent_bytes"] == sandbox.uploaded
+    return result
+
+
+def test_local_edits_send_small_delta():
+    """测试 1: 插入、替换、删除后只传输修改附近的块"""
+    edits = {
+        "insert": BASE[:1000] + b"console.log('hi')" + BASE[1000:],
+        "replace": BASE[:100000] + b"X" * 64 + BASE[100064:],
+        "delete": BASE[:5000] + BASE[9000:],
+    }
+    for name, new in edits.items():
+        result = sync(name, BASE, new)
+        assert result["mode"] == "delta", (name, result)
+        assert result["sent_bytes"] < 2 * block_size_for(len(new)) + 1024, (name, result)
+
+
+def test_rolling_checksum_matches_zlib():
+    """测试 2: 滚动更新的弱校验和与逐块计算一致，偏移后的块仍能匹配"""
+    import hashlib
+    import zlib
+    bs = 1024
+    blocks = [[zlib.adler32(BASE[i:i + bs]), hashlib.md5(BASE[i:i + bs]).hexdigest()]
+              for i in range(0, 8 * bs, bs)]
+    ops, literals = compute_delta(b"abc" + BASE[:8 * bs], bs, blocks)
+    assert ops == [[1, 0, 3], [0, 0, 8]], ops
+    assert literals == b"abc"
+
+
+def test_missing_remote_uploads_full():
+    """测试 3: 远端文件不存在时完整上传"""
+    result = sync("missing", None, BASE)
+    assert result["mode"] == "full" and result["sent_bytes"] == len(BASE)
+
+
+def test_unrelated_content_uploads_full():
+    """测试 4: 差异不比完整文件小时退回完整上传，小文件不走增量"""
+    other = bytes(rng.getrandbits(8) for _ in range(len(BASE)))
+    result = sync("unrelated", BASE, other)
+    assert result["mode"] == "full" and result["sent_bytes"] == len(other)
+
+    small = BASE[:PATCH_MIN_BYTES - 2]
+    result = sync("small", small, small + b"!")
+    assert result["mode"] == "full"
+
+
+def test_changed_base_falls_back():
+    """测试 5: 签名后远端文件被修改时重建校验失败，退回完整上传"""
+    path = os.path.join(WORKDIR, "race")
+    with open(path, "wb") as f:
+        f.write(BASE)
+    sandbox = LocalSandbox()
+    calls = []
+
+    def exec_and_touch(command):
+        response = sandbox._exec(command)
+        calls.append(command)
+        if len(calls) == 1:
+            # 签名完成后远端文件被其他进程追加
+            with open(path, "ab") as f:
+                f.write(b"concurrent write")
+        return response
+
+    sandbox.process.exec = exec_and_touch
+    new = BASE[:10] + b"edit" + BASE[10:]
+    result = sync_file(sandbox, path, new)
+    assert len(calls) == 2 and result["mode"] == "full"
+    assert result["sent_bytes"] == sandbox.uploaded > len(new)
+    with open(path, "rb") as f:
+        assert f.read() == new
+
+
+def test_bad_signature_falls_back():
+    """测试 6: 签名输出不是合法 JSON 或缺少字段时退回完整上传"""
+    new = BASE[:10] + b"edit" + BASE[10:]
+    for output in ("", "Traceback (most recent call last):", '{"exists": true}'):
+        path = os.path.join(WORKDIR, "bad-signature")
+        with open(path, "wb") as f:
+            f.write(BASE)
+        sandbox = LocalSandbox()
+        sandbox.process.exec = lambda command: SimpleNamespace(exit_code=0, result=output)
+        result = sync_file(sandbox, path, new)
+        assert result["mode"] == "full" and result["sent_bytes"] == len(new), (output, result)
+        with open(path, "rb") as f:
+            assert f.read() == new
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("沙盒文件增量上传测试")
+    print("=" * 60)
+
+    tests = [
+        test_local_edits_send_small_delta,
+        test_rolling_checksum_matches_zlib,
+        test_missing_remote_uploads_full,
+        test_unrelated_content_uploads_full,
+        test_changed_base_falls_back,
+        test_bad_signature_falls_back,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+沙盒部署任务队列测试
+用内存 SQLite 队列和可控时钟验证公平调度、每用户和全局并发上限、队列满时的 retry_after、
+租约续约和过期回收、过期任务的迟到结果不生效，以及快照不阻塞部署结果
+"""
+
+import os
+import sys
+import threading
+import time
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from deploy_queue import DEFAULT_JOB_SECONDS, QueueFull, SQLiteJobQueue, deploy, run_worker, wait_for_snapshots
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def make_queue():
+    clock = FakeClock()
+    return SQLiteJobQueue(":memory:", clock=clock), clock
+
+
+def enqueue(queue, clock, user_id: str, **kwargs) -> str:
+    # 入队时间递增，保证同一轮次内按入队顺序认领
+    clock.advance(1)
+    return queue.enqueue(user_id, None, {"name": user_id}, **kwargs)["job_id"]
+
+
+def claim_users(queue, count: int, **kwargs):
+    users = []
+    for _ in range(count):
+        job = queue.claim(**kwargs)
+        users.append(job["user_id"] if job else None)
+    return users
+
+
+def test_fair_ordering():
+    """测试 1: 先入队多个任务的用户不会占满队首，各用户的任务轮流认领"""
+    queue, clock = make_queue()
+    for user_id in ("a", "a", "a", "b", "c"):
+        enqueue(queue, clock, user_id)
+    assert claim_users(queue, 6, concurrency=10, per_user=5) == ["a", "b", "c", "a", "a", None]
+
+
+def test_per_user_and_global_caps():
+    """测试 2: 每个用户的运行数和全局运行数达到上限时不再认领，任务完成后空出槽位"""
+    queue, clock = make_queue()
+    for user_id in ("a", "a", "b", "c"):
+        enqueue(queue, clock, user_id)
+    first = queue.claim(concurrency=4, per_user=1)
+    assert first["user_id"] == "a"
+    # a 已有运行中的任务，第二个任务受每用户上限阻塞
+    assert claim_users(queue, 3, concurrency=4, per_user=1) == ["b", "c", None]
+
+    enqueue(queue, clock, "d")
+    enqueue(queue, clock, "e")
+    assert claim_users(queue, 2, concurrency=4, per_user=1) == ["d", None], "global cap exceeded"
+    assert queue.stats()["running"] == 4
+
+    assert queue.complete(first, {"ok": True})
+    # a 的第二个任务与 e 轮次相同，按入队时间先认领
+    assert claim_users(queue, 2, concurrency=4, per_user=1) == ["a", None]
+
+
+def test_queue_full_retry_after():
+    """测试 3: 队列或用户排队数已满时抛出 QueueFull，retry_after 按近期任务耗时和并发数估算"""
+    queue, clock = make_queue()
+    enqueue(queue, clock, "a", max_depth=2)
+    enqueue(queue, clock, "b", max_depth=2)
+    try:
+        enqueue(queue, clock, "c", max_depth=2, concurrency=4)
+        raise AssertionError("expected QueueFull")
+    except QueueFull as e:
+        assert e.retry_after == DEFAULT_JOB_SECONDS // 4, e.retry_after
+        assert "queue" in str(e)
+
+    # 用户自己排满时需要等待自己排队的任务依次执行完
+    try:
+        enqueue(queue, clock, "a", max_depth=10, max_per_user=1, concurrency=4)
+        raise AssertionError("expected QueueFull")
+    except QueueFull as e:
+        assert e.retry_after == DEFAULT_JOB_SECONDS // 4 and "user a" in str(e), e
+
+    # 有完成的任务后按实际平均耗时估算
+    job = queue.claim(concurrency=4, per_user=1)
+    clock.advance(200)
+    queue.complete(job, {"ok": True})
+    try:
+        enqueue(queue, clock, "b", max_depth=10, max_per_user=1, concurrency=4)
+        raise AssertionError("expected QueueFull")
+    except QueueFull as e:
+        assert e.retry_after == 50, e.retry_after
+    assert queue.stats()["depth"] == 1
+
+
+def test_heartbeat_extends_lease():
+    """测试 4: 续约后的任务不会被回收，停止续约后租约到期重新入队"""
+    queue, clock = make_queue()
+    job_id = enqueue(queue, clock, "a")
+    job = queue.claim(concurrency=1, per_user=1, lease=30)
+    assert job["id"] == job_id
+    clock.advance(20)
+    assert queue.heartbeat([job], lease=30) == 1
+    clock.advance(20)
+    assert queue.requeue_expired() == 0
+    assert queue.status(job_id)["status"] == "running"
+    clock.advance(31)
+    assert queue.requeue_expired() == 1
+    assert queue.status(job_id)["status"] == "queued"
+    assert queue.heartbeat([job], lease=30) == 0, "queued jobs must not be renewed"
+    assert queue.heartbeat([]) == 0
+
+
+def test_stale_owner_cannot_finish():
+    """测试 5: 租约过期后被重新认领的任务，原 worker 的 complete/fail/heartbeat 不生效"""
+    queue, clock = make_queue()
+    enqueue(queue, clock, "a")
+    stale = queue.claim(concurrency=1, per_user=1, lease=30)
+    clock.advance(31)
+    assert queue.requeue_expired() == 1
+    # 重新入队后、再次认领前，迟到的结果同样不生效
+    assert not queue.complete(stale, {"worker": "stale"})
+    current = queue.claim(concurrency=1, per_user=1, lease=30)
+    assert current["id"] == stale["id"] and current["attempts"] == stale["attempts"] + 1
+
+    assert not queue.complete(stale, {"worker": "stale"})
+    assert not queue.fail(stale, "stale failure")
+    assert queue.heartbeat([stale], lease=30) == 0
+    job = queue.status(stale["id"])
+    assert job["status"] == "running" and job["error"] is None, job
+
+    assert queue.complete(current, {"worker": "current"})
+    job = queue.status(stale["id"])
+    assert job["status"] == "succeeded" and job["result"] == {"worker": "current"}, job
+    assert not queue.fail(current, "too late")
+
+
+class FakeBackend:
+    """部署流程的假后端，快照在 release 之前一直阻塞"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.snapshots = []
+
+    def fork_sandbox(self, password, project_id, package_json, profile=None):
+        return {"success": True, "sandbox_id": "sb-1", "website_url": "https://8080-sb-1",
+                "vnc_url": "https://6080-sb-1"}
+
+    def write_files(self, sandbox_id, files):
+        return {"success": True}
+
+    def run_command(self, sandbox_id, command, blocking=False, timeout=60):
+        return {"success": True, "exit_code": 0}
+
+    def start_web_server(self, sandbox_id, package_json=None):
+        return {"success": True, "log_id": "log-1", "wait_seconds": 3}
+
+    def snapshot_sandbox(self, sandbox_id, project_id):
+        self.release.wait(5)
+        self.snapshots.append((sandbox_id, project_id))
+        return {"success": True}
+
+
+def test_snapshot_after_result():
+    """测试 6: 安装依赖后的快照在后台执行，部署结果不等待快照完成"""
+    backend = FakeBackend()
+    waits = []
+    payload = {"files": {"package.json": "{}", "index.js": ""}, "project_id": "p1"}
+    result = deploy(payload, ds=backend, sleep=waits.append)
+    assert result["sandbox_id"] == "sb-1" and waits == [3], (result, waits)
+    assert backend.snapshots == [], "deploy must not wait for the snapshot"
+    backend.release.set()
+    wait_for_snapshots()
+    assert backend.snapshots == [("sb-1", "p1")]
+
+
+def test_worker_renews_long_jobs():
+    """测试 7: 执行时间超过租约的任务由 worker 续约，不会被重新入队重复执行"""
+    queue = SQLiteJobQueue(":memory:")
+    job_id = queue.enqueue("a", None, {"name": "slow"})["job_id"]
+    calls = []
+    lock = threading.Lock()
+
+    def handler(payload):
+        with lock:
+            calls.append(payload["name"])
+        time.sleep(1.5)
+        return {"ok": True}
+
+    processed = run_worker(queue, handler, concurrency=1, poll_interval=0.05, once=True,
+                           log=lambda message: None, lease=1)
+    assert processed == 1 and calls == ["slow"], calls
+    job = queue.status(job_id)
+    assert job["status"] == "succeeded" and job["attempts"] == 1, job
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("部署任务队列测试")
+    print("=" * 60)
+
+    tests = [
+        test_fair_ordering,
+        test_per_user_and_global_caps,
+        test_queue_full_retry_after,
+        test_heartbeat_extends_lease,
+        test_stale_owner_cannot_finish,
+        test_snapshot_after_result,
+        test_worker_renews_long_jobs,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+索引建议工具测试
+验证分位数计算、根据查询使用情况给出的保留/删除建议，以及 --json 时 stdout 只包含 JSON 文档
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import index_advisor
+from index_advisor import percentile, recommend
+
+
+def index(table, columns, unique=False, primary=False):
+    return {"table": table, "columns": columns, "unique": unique, "primary": primary, "size_bytes": 8192}
+
+
+def test_percentile():
+    """测试 1: 最近秩法分位数，空列表返回 0"""
+    values = [float(v) for v in range(100, 0, -1)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_recommend():
+    """测试 2: 主键保留，被查询使用的保留，复合索引前缀和未使用的索引建议删除，schema 之外的索引忽略"""
+    indexes = {
+        "messages_pkey": index("messages", ["id"], unique=True, primary=True),
+        "idx_messages_project_id": index("messages", ["project_id"]),
+        "idx_messages_project_timestamp": index("messages", ["project_id", "timestamp"]),
+        "idx_messages_user_id": index("messages", ["user_id"]),
+        "idx_projects_user_id": index("projects", ["user_id"]),
+        "idx_manual": index("messages", ["role"]),
+    }
+    results = {
+        "messages.list": {"indexes": ["idx_messages_project_timestamp"]},
+        "projects.list": {"indexes": ["idx_projects_user_id"]},
+        "messages.last": {"indexes": ["idx_messages_project_timestamp", "idx_messages_project_id"]},
+    }
+    advice = {item["index"]: (item["action"], item["reason"]) for item in recommend(indexes, results)}
+    assert set(advice) == set(indexes) - {"idx_manual"}, advice
+    assert advice["messages_pkey"][0] == "keep"
+    assert advice["idx_messages_project_id"][0] == "drop"
+    assert "idx_messages_project_timestamp" in advice["idx_messages_project_id"][1]
+    assert advice["idx_messages_project_timestamp"] == ("keep", "被 messages.list, messages.last 使用")
+    assert advice["idx_projects_user_id"][0] == "keep"
+    assert advice["idx_messages_user_id"] == ("drop", "没有查询使用")
+
+
+def test_json_output_is_parseable():
+    """测试 3: --json 时进度信息写到 stderr，stdout 可以直接解析为 JSON"""
+    report = {"queries": {}, "insert_p50_ms": 1.5, "indexes": {}, "advice": [], "drop_comparison": {}}
+
+    def fake_run(args):
+        print("🚀 progress")
+        return report
+
+    original_run, original_argv = index_advisor.run, sys.argv
+    index_advisor.run = fake_run
+    sys.argv = ["index_advisor.py", "--json"]
+    stdout, stderr = io.StringIO(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            index_advisor.main()
+    finally:
+        index_advisor.run, sys.argv = original_run, original_argv
+    assert json.loads(stdout.getvalue()) == report, stdout.getvalue()
+    assert "progress" in stderr.getvalue()
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("索引建议工具测试")
+    print("=" * 60)
+
+    tests = [
+        test_percentile,
+        test_recommend,
+        test_json_output_is_parseable,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+messages 分区和归档测试
+验证月份计算、CSV/COPY BINARY 归档文件的读回计数和 sha256，
+以及 archive() 校验通过才 DROP、校验失败时重新 ATTACH 分区
+"""
+
+import gzip
+import os
+import struct
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from partition_messages import (
+    PGCOPY_SIGNATURE,
+    add_months,
+    archive,
+    count_archived_rows,
+    export_partition,
+    month_floor,
+    partition_name,
+)
+
+CSV_ROWS = (
+    "id,project_id,content\n"
+    "m1,p1,hello\n"
+    "m2,p1,\"multi\nline, with comma\"\n"
+    "m3,p2,\"quoted \"\"text\"\"\"\n"
+)
+
+
+def binary_copy(rows, trailer: bool = True) -> bytes:
+    """按 COPY BINARY 格式编码，None 字段写为 -1 长度"""
+    data = PGCOPY_SIGNATURE + struct.pack("!iI", 0, 0)
+    for row in rows:
+        data += struct.pack("!h", len(row))
+        for value in row:
+            if value is None:
+                data += struct.pack("!i", -1)
+            else:
+                data += struct.pack("!i", len(value)) + value
+    if trailer:
+        data += struct.pack("!h", -1)
+    return data
+
+
+def write_gzip(data: bytes, suffix: str) -> Path:
+    path = Path(tempfile.mkdtemp(prefix="atom-archive-")) / f"archive.{suffix}"
+    with gzip.open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_months():
+    """测试 1: 月份加减跨年，分区名按 YYYYMM"""
+    assert add_months(date(2025, 1, 1), 1) == date(2025, 2, 1)
+    assert add_months(date(2025, 12, 1), 1) == date(2026, 1, 1)
+    assert add_months(date(2025, 3, 1), -3) == date(2024, 12, 1)
+    assert add_months(date(2024, 11, 1), 14) == date(2026, 1, 1)
+    assert month_floor(date(2025, 7, 31)) == date(2025, 7, 1)
+    assert partition_name(date(2025, 7, 1)) == "messages_p202507"
+
+
+def test_count_csv_archive():
+    """测试 2: CSV 归档按记录计数（不含表头，引号内的换行不算新记录）"""
+    path = write_gzip(CSV_ROWS.encode("utf-8"), "csv.gz")
+    rows, _ = count_archived_rows(path, "csv")
+    assert rows == 3, rows
+    assert count_archived_rows(write_gzip(b"id,project_id\n", "csv.gz"), "csv")[0] == 0
+
+
+def test_count_binary_archive():
+    """测试 3: COPY BINARY 归档逐条计数，NULL 和空字段正确跳过，截断或签名错误时报错"""
+    data = binary_copy([[b"m1", b"p1", None], [b"m2", b"", b"x" * 5000], [b"m3", None, None]])
+    assert count_archived_rows(write_gzip(data, "copy.gz"), "binary")[0] == 3
+    assert count_archived_rows(write_gzip(binary_copy([]), "copy.gz"), "binary")[0] == 0
+    for broken in (data[:-2], data[:-10], b"NOTCOPY" + data[7:]):
+        try:
+            count_archived_rows(write_gzip(broken, "copy.gz"), "binary")
+            raise AssertionError("expected ValueError")
+        except ValueError:
+            pass
+
+
+class FakeCursor:
+    """记录执行的 SQL；COPY 输出 copy_rows 条 CSV 记录，count(*) 返回 counted 条"""
+
+    def __init__(self, counted: int, copy_rows: int):
+        self.counted = counted
+        self.copy_rows = copy_rows
+        self.executed = []
+        self.result = None
+
+    def execute(self, sql, params=None):
+        self.executed.append(" ".join(sql.split()))
+        if "relkind" in sql:
+            self.result = [("p",)]
+        elif "pg_inherits" in sql:
+            self.result = [("messages_default",), ("messages_p202401",), ("messages_p202402",)]
+        elif "count(*)" in sql:
+            self.result = [(self.counted,)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def copy_expert(self, sql, f):
+        f.write("id,content\n")
+        for i in range(self.copy_rows):
+            f.write(f"m{i},\"line\nbreak\"\n")
+
+    def close(self):
+        pass
+
+
+def run_archive(counted: int, copy_rows: int):
+    cursor = FakeCursor(counted, copy_rows)
+    conn = type("FakeConn", (), {"cursor": lambda self: cursor})()
+    out_dir = Path(tempfile.mkdtemp(prefix="atom-archive-"))
+    ok = archive(conn, date(2024, 2, 1), out_dir, "csv", keep_detached=False)
+    return ok, cursor.executed, out_dir
+
+
+def test_archive_drops_only_verified():
+    """测试 4: 归档文件记录数与清单一致时才 DROP 并释放 id，不一致时重新 ATTACH 且不删除"""
+    ok, executed, out_dir = run_archive(counted=4, copy_rows=4)
+    assert ok
+    assert "ALTER TABLE messages DETACH PARTITION messages_p202401" in executed
+    assert "DROP TABLE messages_p202401" in executed
+    assert any(sql.startswith("DELETE FROM message_ids") for sql in executed), executed
+    assert not any("messages_p202402" in sql for sql in executed), "only months before --before are archived"
+    assert (out_dir / "messages_p202401.csv.gz").exists() and (out_dir / "messages_p202401.json").exists()
+
+    ok, executed, _ = run_archive(counted=5, copy_rows=4)
+    assert not ok
+    assert "DROP TABLE messages_p202401" not in executed
+    assert not any(sql.startswith("DELETE FROM message_ids") for sql in executed)
+    assert executed[-1].startswith("ALTER TABLE messages ATTACH PARTITION messages_p202401"), executed
+
+
+def test_export_hash_matches_readback():
+    """测试 5: 导出时计算的 sha256 与读回解压内容的 sha256 一致"""
+    cursor = FakeCursor(0, 3)
+    out_dir = Path(tempfile.mkdtemp(prefix="atom-archive-"))
+    result = export_partition(cursor, "messages_p202401", out_dir, "csv")
+    rows, digest = count_archived_rows(Path(result["path"]), "csv")
+    assert rows == 3 and digest == result["sha256"]
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("messages 分区和归档测试")
+    print("=" * 60)
+
+    tests = [
+        test_months,
+        test_count_csv_archive,
+        test_count_binary_archive,
+        test_archive_drops_only_verified,
+        test_export_hash_matches_readback,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
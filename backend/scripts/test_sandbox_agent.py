@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+沙盒内代理测试
+在本地线程中运行代理（工作目录和日志目录指向临时目录），验证批量操作、长连接复用、
+日志推送、认证和不可达时的 AgentUnavailable（调用方据此退回 Daytona API）
+"""
+
+import base64
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import command_logs
+import sandbox_agent
+from agent_client import AgentClient, AgentSandbox, AgentUnavailable, agent_token, install_agent
+from command_logs import assemble_log, read_command_log, redirect_command
+from delta_sync import sync_file
+
+WORKDIR = tempfile.mkdtemp(prefix="atom-agent-")
+sandbox_agent.WORKSPACE = WORKDIR
+sandbox_agent.LOG_DIR = os.path.join(WORKDIR, "logs")
+sandbox_agent.PING_INTERVAL = 0.1
+
+TOKEN = agent_token("sandbox-1", secret="test-key")
+SERVER = sandbox_agent.serve(0, TOKEN, host="127.0.0.1")
+URL = f"http://127.0.0.1:{SERVER.server_address[1]}"
+CONNECTIONS = []
+_process_request = SERVER.process_request
+SERVER.process_request = lambda request, address: (CONNECTIONS.append(address), _process_request(request, address))
+threading.Thread(target=SERVER.serve_forever, daemon=True).start()
+
+
+def client() -> AgentClient:
+    # 其他测试模块也会修改 command_logs.LOG_DIR，每次使用前对齐到代理的日志目录
+    command_logs.LOG_DIR = sandbox_agent.LOG_DIR
+    return AgentClient(URL, TOKEN)
+
+
+def test_batch_write_exec_stat():
+    """测试 1: 一个批次内写文件、执行命令、查询文件信息，按提交顺序返回结果"""
+    agent = client()
+    written, ran, stat, missing = agent.batch([
+        {"op": "write", "path": "src/App.tsx", "data": "ZXhwb3J0IHt9Cg=="},
+        {"op": "exec", "cmd": "cat src/App.tsx; echo err >&2; exit 2"},
+        {"op": "stat", "path": "src/App.tsx", "sha256": True},
+        {"op": "stat", "path": "missing.txt"},
+    ])
+    assert written["size"] == 10
+    assert ran["exit_code"] == 2 and ran["output"] == "export {}\nerr\n", ran
+    assert stat["exists"] and stat["size"] == 10 and len(stat["sha256"]) == 64
+    assert missing == dict(missing, exists=False)
+    agent.close()
+
+
+def test_connection_reused():
+    """测试 2: 同一客户端的多个批次复用一个连接，并行批次的结果仍按提交顺序返回"""
+    agent = client()
+    before = len(CONNECTIONS)
+    for i in range(5):
+        assert agent.call({"op": "exec", "cmd": f"echo {i}"})["output"] == f"{i}\n"
+    started = time.monotonic()
+    results = agent.batch([{"op": "exec", "cmd": f"sleep 0.3; echo {i}"} for i in range(4)], parallel=True)
+    assert [r["output"] for r in results] == [f"{i}\n" for i in range(4)]
+    assert time.monotonic() - started < 1.0
+    assert len(CONNECTIONS) - before == 1, CONNECTIONS
+    agent.close()
+
+
+def test_adapter_reuses_existing_paths():
+    """测试 3: AgentSandbox 上的 command_logs 读取和增量上传与直接读取沙盒一致"""
+    adapter = AgentSandbox(client())
+    adapter.process.exec(redirect_command("seq 1 3000", "adapter"))
+    via_script = read_command_log(adapter, "adapter", 0, 64, 128)
+    tail = adapter.client.call({"op": "tail", "log_id": "adapter", "offset": 0, "head": 64, "tail": 128})
+    via_tail = assemble_log(tail["size"], 0, base64.b64decode(tail["head"]), base64.b64decode(tail["tail"]),
+                            tail["exit_code"])
+    assert via_script == via_tail and via_tail["exit_code"] == 0, (via_script, via_tail)
+
+    path = os.path.join(WORKDIR, "bundle.js")
+    base = b"".join(b"const line%d = %d;\n" % (i, i) for i in range(10000))
+    adapter.fs.upload_file(base, path)
+    new = base.replace(b"line5000 ", b"line5000_renamed ")
+    result = sync_file(adapter, path, new)
+    assert result["mode"] == "delta" and result["sent_bytes"] < len(new) // 10, result
+    with open(path, "rb") as f:
+        assert f.read() == new
+    adapter.client.close()
+
+
+def test_follow_pushes_logs():
+    """测试 4: follow 在命令运行时推送日志，命令结束后返回退出码"""
+    agent = client()
+    agent.call({"op": "exec", "cmd": redirect_command("for i in 1 2 3; do echo line$i; sleep 0.3; done; exit 4",
+                                                      "follow"), "background": True})
+    started = time.monotonic()
+    arrivals, output, result = [], b"", None
+    for event in agent.stream([{"op": "tail", "log_id": "follow", "follow": True, "timeout": 10}]):
+        if event["event"] == "log":
+            arrivals.append(time.monotonic() - started)
+            output += base64.b64decode(event["data"])
+        else:
+            result = event
+    assert output == b"line1\nline2\nline3\n", output
+    assert len(arrivals) >= 2 and arrivals[0] < 0.5, arrivals
+    assert result["exit_code"] == 4 and result["next_offset"] == len(output)
+    # 事件流读完后连接仍然可用
+    assert agent.call({"op": "stat", "path": "."})["is_dir"]
+    agent.close()
+
+
+def test_unavailable_and_timeouts():
+    """测试 5: 令牌错误或代理不可达时抛出 AgentUnavailable，命令超时被终止"""
+    for bad in (AgentClient(URL, "wrong-token"), AgentClient("http://127.0.0.1:9", TOKEN, timeout=1)):
+        try:
+            bad.call({"op": "stat", "path": "."})
+            raise AssertionError("expected AgentUnavailable")
+        except AgentUnavailable:
+            pass
+    assert client().health() and not AgentClient("http://127.0.0.1:9", TOKEN, timeout=1).health()
+
+    ran = client().call({"op": "exec", "cmd": "sleep 5", "timeout": 0.3})
+    assert ran["timed_out"] and ran["exit_code"] is None
+
+
+def test_install_registers_program():
+    """测试 6: 安装代理时上传脚本并只登记一次 supervisord program"""
+    conf = os.path.join(WORKDIR, "supervisord.conf")
+    with open(conf, "w") as f:
+        f.write("[supervisord]\nnodaemon=true\n")
+    uploads = []
+    adapter = AgentSandbox(client())
+    fake = SimpleNamespace(process=adapter.process,
+                           fs=SimpleNamespace(upload_file=lambda content, path: uploads.append(path)))
+    install_agent(fake, TOKEN, conf, port=9999)
+    install_agent(fake, TOKEN, conf, port=9999)
+    with open(conf) as f:
+        text = f.read()
+    assert text.count("[program:atom-agent]") == 1, text
+    assert f'ATOM_AGENT_TOKEN="{TOKEN}"' in text and "--port 9999" in text
+    assert uploads == ["/tmp/atom-agent.py"] * 2
+    adapter.client.close()
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("沙盒内代理测试")
+    print("=" * 60)
+
+    tests = [
+        test_batch_write_exec_stat,
+        test_connection_reused,
+        test_adapter_reuses_existing_paths,
+        test_follow_pushes_logs,
+        test_unavailable_and_timeouts,
+        test_install_registers_program,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+沙盒资源选型测试
+用内存 SQLite 中的测量记录验证基线选型、按历史测量选型、成本上限和命令期间内存峰值的判定
+"""
+
+import json
+import os
+import sys
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sandbox_sizing import MeasurementStore, choose_profile, command_peak_mb, dependency_fingerprint
+
+
+def package(deps=None, dev_deps=None) -> str:
+    return json.dumps({"name": "app", "dependencies": deps or {}, "devDependencies": dev_deps or {}})
+
+
+def store_with(*rows) -> MeasurementStore:
+    """rows: (tier, kind, duration_s, peak_memory_mb, exit_code)，按时间顺序写入指纹 fp"""
+    store = MeasurementStore(":memory:")
+    for i, (tier, kind, duration, peak, exit_code) in enumerate(rows):
+        store.record("fp", tier, kind, duration, peak, exit_code)
+        store.conn.execute("UPDATE measurements SET recorded_at = ? WHERE id = last_insert_rowid()", (1000 + i,))
+    return store
+
+
+def test_baseline_profile():
+    """测试 1: 没有历史数据时按 package.json 的静态特征选择档位，自动选型不低于 standard"""
+    assert choose_profile(None, None)["tier"] == "standard"
+    assert choose_profile(package({"react": "^18"}), "fp")["tier"] == "standard"
+    assert choose_profile("{not json", "fp")["tier"] == "standard"
+    heavy = choose_profile(package({"next": "14.0.0", "react": "^18"}), "fp")
+    assert heavy["tier"] == "large" and "next" in heavy["reason"], heavy
+    many = {f"dep-{i}": "1.0.0" for i in range(41)}
+    assert choose_profile(package(many), "fp", store_with())["tier"] == "large"
+
+
+def test_history_memory_peak():
+    """测试 2: 有历史测量时按最高内存峰值加余量选择档位，而不是静态特征"""
+    store = store_with(("large", "install", 60, 900, 0), ("large", "build", 90, 1400, 0))
+    chosen = choose_profile(package({"next": "14.0.0"}), "fp", store)
+    # 1400MB * 1.3 = 1820MB，在 standard 的 2GB 以内，不再按 next 选 large
+    assert chosen["tier"] == "standard" and "peak 1400MB" in chosen["reason"], chosen
+    store = store_with(("standard", "install", 60, 1700, 0))
+    assert choose_profile(package(), "fp", store)["tier"] == "large"
+    # 峰值很低时也不会自动选 small
+    store = store_with(("standard", "install", 60, 300, 0))
+    assert choose_profile(package(), "fp", store)["tier"] == "standard"
+
+
+def test_history_oom_and_slow_bump_tier():
+    """测试 3: OOM 或耗时过长时比测量时的档位高一档，没有内存数据时沿用最近一次的档位"""
+    store = store_with(("standard", "install", 60, None, 137))
+    chosen = choose_profile(package(), "fp", store)
+    assert chosen["tier"] == "large" and "OOM on standard" in chosen["reason"], chosen
+
+    store = store_with(("small", "build", 300, 500, 0))
+    chosen = choose_profile(package(), "fp", store)
+    assert chosen["tier"] == "standard" and "build took 300s" in chosen["reason"], chosen
+
+    store = store_with(("small", "install", 60, None, 0), ("large", "install", 60, None, 0))
+    assert choose_profile(package(), "fp", store)["tier"] == "large"
+
+
+def test_cost_ceiling_and_requested():
+    """测试 4: 超过成本上限时降到上限内最高档位，显式指定的档位也受上限约束"""
+    store = store_with(("large", "install", 60, 5000, 0))
+    assert choose_profile(package(), "fp", store, max_cost=8)["tier"] == "xlarge"
+    capped = choose_profile(package(), "fp", store, max_cost=4)
+    assert capped["tier"] == "large" and "capped from xlarge" in capped["reason"], capped
+    assert choose_profile(package(), "fp", None, "xlarge", max_cost=2)["tier"] == "standard"
+    assert choose_profile(package(), "fp", None, "small")["reason"] == "requested"
+    try:
+        choose_profile(package(), "fp", None, "huge")
+        raise AssertionError("expected ValueError")
+    except ValueError:
+        pass
+
+
+def test_command_peak_and_fingerprint():
+    """测试 5: 只有命令期间峰值升高时才记录峰值；依赖不变时指纹不变"""
+    assert command_peak_mb(800, 1200) == 1200
+    assert command_peak_mb(1200, 1200) is None
+    assert command_peak_mb(None, 1200) is None and command_peak_mb(800, None) is None
+
+    base = json.loads(package({"react": "^18"}))
+    renamed = dict(base, name="other", scripts={"dev": "vite"})
+    assert dependency_fingerprint(json.dumps(base)) == dependency_fingerprint(json.dumps(renamed))
+    assert dependency_fingerprint(package({"react": "^18"})) != dependency_fingerprint(package({"react": "^17"}))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("沙盒资源选型测试")
+    print("=" * 60)
+
+    tests = [
+        test_baseline_profile,
+        test_history_memory_peak,
+        test_history_oom_and_slow_bump_tier,
+        test_cost_ceiling_and_requested,
+        test_command_peak_and_fingerprint,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+schema 检查工具测试
+验证 schema 解析（列定义与键约束拆分）和与数据库状态对比后生成的补齐 DDL
+"""
+
+import os
+import sys
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from schema_inspector import diff_schema, load_schema_model, parse_schema
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS teams (
+  id TEXT PRIMARY KEY,
+  slug TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS members (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  team_id TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+  email TEXT CONSTRAINT members_email_unique UNIQUE,
+  role TEXT DEFAULT 'member',
+  seats INTEGER DEFAULT 1,
+  UNIQUE(team_id, email),
+  CONSTRAINT members_seats_positive CHECK (seats > 0)
+);
+CREATE INDEX IF NOT EXISTS idx_members_team_id ON members(team_id);
+CREATE OR REPLACE FUNCTION touch() RETURNS trigger AS $$ BEGIN RETURN NEW; END; $$ LANGUAGE plpgsql;
+CREATE TRIGGER members_touch BEFORE UPDATE ON members FOR EACH ROW EXECUTE FUNCTION touch();
+"""
+
+
+def full_state(model):
+    return {
+        "tables": {name: set(spec["columns"]) for name, spec in model["tables"].items()},
+        "indexes": set(model["indexes"]),
+        "functions": set(model["functions"]),
+        "triggers": set(model["triggers"]),
+    }
+
+
+def test_parse_splits_key_constraints():
+    """测试 1: 列定义去掉 PRIMARY KEY/UNIQUE/REFERENCES，行内和表级键约束按 PostgreSQL 默认名记录"""
+    model = parse_schema(SCHEMA_SQL)
+    members = model["tables"]["members"]
+    assert members["columns"]["id"] == "id UUID DEFAULT gen_random_uuid()", members["columns"]["id"]
+    assert members["columns"]["team_id"] == "team_id TEXT NOT NULL"
+    assert members["columns"]["email"] == "email TEXT"
+    assert members["columns"]["role"] == "role TEXT DEFAULT 'member'"
+    constraints = {c["name"]: (c["columns"], c["ddl"]) for c in members["constraints"]}
+    assert constraints == {
+        "members_pkey": (["id"], "PRIMARY KEY (id)"),
+        "members_team_id_fkey": (["team_id"], "FOREIGN KEY (team_id) REFERENCES teams(id) ON DELETE CASCADE"),
+        "members_email_unique": (["email"], "UNIQUE (email)"),
+        "members_team_id_email_key": (["team_id", "email"], "UNIQUE(team_id, email)"),
+        "members_seats_positive": (["seats"], "CHECK (seats > 0)"),
+    }, constraints
+    teams = model["tables"]["teams"]
+    assert teams["columns"]["slug"] == "slug TEXT NOT NULL"
+    assert [c["name"] for c in teams["constraints"]] == ["teams_pkey", "teams_slug_key"]
+    assert model["indexes"]["idx_members_team_id"]["table"] == "members"
+    assert model["triggers"]["members_touch"]["table"] == "members"
+    assert "touch" in model["functions"]
+
+
+def test_diff_adds_columns_then_constraints():
+    """测试 2: 缺列时先补列，再用 ADD CONSTRAINT 补涉及该列的约束，已有列上的约束不重复添加"""
+    model = parse_schema(SCHEMA_SQL)
+    state = full_state(model)
+    state["tables"]["teams"].discard("id")
+    state["tables"]["members"] -= {"email", "seats"}
+    ddl = [change["ddl"] for change in diff_schema(model, state)]
+    assert ddl == [
+        "ALTER TABLE teams ADD COLUMN IF NOT EXISTS id TEXT;",
+        "ALTER TABLE teams ADD CONSTRAINT teams_pkey PRIMARY KEY (id);",
+        "ALTER TABLE members ADD COLUMN IF NOT EXISTS email TEXT;",
+        "ALTER TABLE members ADD COLUMN IF NOT EXISTS seats INTEGER DEFAULT 1;",
+        "ALTER TABLE members ADD CONSTRAINT members_email_unique UNIQUE (email);",
+        "ALTER TABLE members ADD CONSTRAINT members_team_id_email_key UNIQUE(team_id, email);",
+        "ALTER TABLE members ADD CONSTRAINT members_seats_positive CHECK (seats > 0);",
+    ], ddl
+
+
+def test_diff_missing_objects():
+    """测试 3: 缺表时使用完整 CREATE TABLE，缺函数、索引、触发器时按依赖顺序补齐；状态完整时没有变更"""
+    model = parse_schema(SCHEMA_SQL)
+    assert diff_schema(model, full_state(model)) == []
+    state = {"tables": {"teams": set(model["tables"]["teams"]["columns"])},
+             "indexes": set(), "functions": set(), "triggers": set()}
+    changes = diff_schema(model, state)
+    assert [(c["kind"], c["name"]) for c in changes] == [
+        ("table", "members"), ("function", "touch"), ("index", "idx_members_team_id"), ("trigger", "members_touch"),
+    ], changes
+    assert changes[0]["ddl"].startswith("CREATE TABLE IF NOT EXISTS members (")
+
+
+def test_repository_schema():
+    """测试 4: 仓库中的 database-schema.sql 解析后补列 DDL 不含键约束"""
+    model = load_schema_model()
+    assert {"projects", "project_states", "messages", "code_blobs"} <= set(model["tables"])
+    for table, spec in model["tables"].items():
+        for column, definition in spec["columns"].items():
+            assert "PRIMARY KEY" not in definition.upper() and " UNIQUE" not in definition.upper(), definition
+    names = {c["name"] for c in model["tables"]["project_states"]["constraints"]}
+    assert names == {"project_states_pkey", "project_states_project_id_user_id_key"}, names
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("schema 检查工具测试")
+    print("=" * 60)
+
+    tests = [
+        test_parse_splits_key_constraints,
+        test_diff_adds_columns_then_constraints,
+        test_diff_missing_objects,
+        test_repository_schema,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
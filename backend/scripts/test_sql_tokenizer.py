@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SQL 切分器模糊测试
+用随机分块大小和随机插入的引号/注释结构，验证流式切分结果与预期一致
+"""
+
+import io
+import os
+import random
+import sys
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sql_tokenizer import iter_statements, split_statements
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SQL_FILES = {
+    os.path.join(SCRIPT_DIR, "..", "docs", "database-schema.sql"): 16,
+    os.path.join(SCRIPT_DIR, "setup-database.sql"): 18,
+}
+
+# 每条都是完整语句，内部包含容易误切分的结构
+TRICKY_STATEMENTS = [
+    "SELECT 'a;b' AS x;",
+    "SELECT 'it''s; fine';",
+    "SELECT E'back\\'slash;' AS y;",
+    'SELECT "odd;""name" FROM t;',
+    "SELECT $$semi;colon$$;",
+    "CREATE FUNCTION f() RETURNS int AS $fn$ BEGIN RETURN 1; END; $fn$ LANGUAGE plpgsql;",
+    "DO $body$ BEGIN PERFORM $$inner;$$; END $body$;",
+    "SELECT a$b, $1 FROM t /* mid; /* nested; */ comment */ WHERE x = 1;",
+    "SELECT 1 -- trailing; comment\n;",
+]
+
+# 语句之间的分隔内容，不应产生额外语句
+SEPARATORS = [" ", "\n", "\n\n", " -- note; here\n", "/* a; b */", "/* x /* y; */ z */\n", "\t"]
+
+ITERATIONS = 300
+
+
+def run_chunked(sql: str, chunk_size: int):
+    return list(iter_statements(io.StringIO(sql), chunk_size=chunk_size))
+
+
+def test_schema_files():
+    """测试 1: schema 文件在任意分块大小下切分结果一致"""
+    rng = random.Random(26)
+    for path, expected_count in SQL_FILES.items():
+        with open(path, "r", encoding="utf-8") as f:
+            sql = f.read()
+        reference = split_statements(sql)
+        assert len(reference) == expected_count, f"{path}: {len(reference)} != {expected_count}"
+        assert any("$$" in s and "NEW.updated_at = NOW();" in s for s in reference)
+        for _ in range(ITERATIONS):
+            chunk_size = rng.randint(1, 64)
+            assert run_chunked(sql, chunk_size) == reference, f"{path}: chunk_size={chunk_size}"
+
+
+def test_tricky_statements():
+    """测试 2: 随机拼接含引号/注释的语句，多条语句可以在同一行"""
+    rng = random.Random(27)
+    for _ in range(ITERATIONS):
+        statements = [rng.choice(TRICKY_STATEMENTS) for _ in range(rng.randint(1, 8))]
+        parts = [rng.choice(SEPARATORS)]
+        for statement in statements:
+            parts.append(statement)
+            parts.append(rng.choice(SEPARATORS))
+        sql = "".join(parts)
+        chunk_size = rng.randint(1, 32)
+        assert run_chunked(sql, chunk_size) == statements, f"chunk_size={chunk_size}: {sql!r}"
+
+
+def test_mutated_schema():
+    """测试 3: 在 schema 语句之间插入干扰结构后，原语句仍被完整切出"""
+    rng = random.Random(28)
+    for path in SQL_FILES:
+        with open(path, "r", encoding="utf-8") as f:
+            reference = split_statements(f.read())
+        for _ in range(ITERATIONS // 3):
+            expected = []
+            parts = []
+            for statement in reference:
+                if rng.random() < 0.5:
+                    extra = rng.choice(TRICKY_STATEMENTS)
+                    parts.append(extra)
+                    expected.append(extra)
+                parts.append(rng.choice(SEPARATORS))
+                parts.append(statement)
+                expected.append(statement)
+            sql = "".join(parts)
+            assert run_chunked(sql, rng.randint(1, 128)) == expected
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("SQL 切分器模糊测试")
+    print("=" * 60)
+
+    tests = [test_schema_files, test_tricky_statements, test_mutated_schema]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
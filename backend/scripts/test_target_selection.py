@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Daytona target 选择测试
+用本地 HTTP 服务模拟各区域控制面，注入延迟和故障，验证排名、缓存和沙盒路由
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from target_selection import TargetRouter, parse_candidates, probe_rtt, shared_url_targets
+
+
+class StandInServer:
+    """带注入延迟/状态码的本地控制面替身，记录请求次数"""
+
+    def __init__(self, delay: float = 0.0, status: int = 401):
+        self.delay = delay
+        self.status = status
+        self.hits = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.hits += 1
+                time.sleep(stand_in.delay)
+                self.send_response(stand_in.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/api"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_router(servers, extra=(), **kwargs):
+    candidates = [(name, server.url) for name, server in servers.items()] + list(extra)
+    return TargetRouter(candidates, path=":memory:", **kwargs)
+
+
+def test_parse_candidates():
+    """测试 1: 解析候选列表，未配置 URL 的使用默认控制面"""
+    routes = parse_candidates("us, eu=http://eu.local/api,us", "us", "http://default/api")
+    assert routes == [("us", "http://default/api"), ("eu", "http://eu.local/api")], routes
+    assert parse_candidates(None, "asia", "http://default/api") == [("asia", "http://default/api")]
+
+
+def test_fastest_healthy_target():
+    """测试 2: 选择延迟最低的健康 target，5xx 和不可达的被排除"""
+    servers = {
+        "us": StandInServer(delay=0.15),
+        "eu": StandInServer(delay=0.02),
+        "asia": StandInServer(delay=0.0, status=503),
+    }
+    try:
+        router = make_router(servers, extra=[("dead", "http://127.0.0.1:9/api")])
+        ranking = router.ranking()
+        assert [e["target"] for e in ranking[:2]] == ["eu", "us"], ranking
+        assert {e["target"] for e in ranking[2:]} == {"asia", "dead"}
+        assert all(e["rtt_ms"] is None for e in ranking[2:])
+        assert router.choose() == ("eu", servers["eu"].url)
+        router.close()
+    finally:
+        for server in servers.values():
+            server.close()
+
+
+def test_ranking_cache_ttl():
+    """测试 3: TTL 内复用排名不再探测，过期后重新测量"""
+    servers = {"us": StandInServer(delay=0.0), "eu": StandInServer(delay=0.05)}
+    now = [1000.0]
+    try:
+        router = make_router(servers, ttl=60, clock=lambda: now[0])
+        assert router.choose()[0] == "us"
+        hits = sum(s.hits for s in servers.values())
+
+        # 延迟反转，但缓存未过期
+        servers["us"].delay, servers["eu"].delay = 0.05, 0.0
+        now[0] += 30
+        assert router.choose()[0] == "us"
+        assert sum(s.hits for s in servers.values()) == hits
+
+        now[0] += 31
+        assert router.choose()[0] == "eu"
+        assert sum(s.hits for s in servers.values()) > hits
+        router.close()
+    finally:
+        for server in servers.values():
+            server.close()
+
+
+def test_existing_sandbox_keeps_home():
+    """测试 4: 已有沙盒路由到创建时的 target，不受排名变化影响"""
+    latencies = {"http://us/api": 10.0, "http://eu/api": 50.0}
+    router = TargetRouter(
+        [("us", "http://us/api"), ("eu", "http://eu/api")],
+        path=":memory:",
+        ttl=0,
+        probe=lambda url: latencies[url],
+    )
+    route = router.choose()
+    assert route == ("us", "http://us/api")
+    router.remember("sandbox-1", route)
+
+    latencies["http://us/api"] = 500.0
+    assert router.choose() == ("eu", "http://eu/api")
+    assert router.home("sandbox-1") == ("us", "http://us/api")
+    # 未登记的沙盒使用配置中的第一个 target
+    assert router.home("sandbox-unknown") == ("us", "http://us/api")
+    router.forget("sandbox-1")
+    assert router.home("sandbox-1") == ("us", "http://us/api")
+    router.close()
+
+
+def test_locate_unregistered_sandbox():
+    """测试 5: 本机没有登记的沙盒（其它主机创建）逐个 target 查找并登记，找不到时使用第一个"""
+    candidates = [("us", "http://us/api"), ("eu", "http://eu/api")]
+    router = TargetRouter(candidates, path=":memory:", probe=lambda url: 10.0)
+    looked_up = []
+
+    def locate(route):
+        looked_up.append(route[0])
+        return route[0] == "eu"
+
+    assert router.home("sandbox-remote", locate=locate) == ("eu", "http://eu/api")
+    assert looked_up == ["us", "eu"]
+    # 找到后已登记，不再查找
+    assert router.home("sandbox-remote", locate=locate) == ("eu", "http://eu/api")
+    assert looked_up == ["us", "eu"]
+    assert router.home("sandbox-gone", locate=lambda route: False) == ("us", "http://us/api")
+    router.close()
+
+
+def test_probe_single_candidate_skipped():
+    """测试 6: 只有一个候选或所有候选共用一个 URL 时不探测，全部不健康时退回第一个"""
+    def fail(url):
+        raise AssertionError("should not probe")
+
+    router = TargetRouter([("us", "http://us/api")], path=":memory:", probe=fail)
+    assert router.choose() == ("us", "http://us/api")
+    router.close()
+
+    shared = parse_candidates("us,eu", "us", "http://default/api")
+    assert shared_url_targets(shared) == [["us", "eu"]]
+    router = TargetRouter(shared, path=":memory:", probe=fail)
+    assert router.choose() == ("us", "http://default/api")
+    router.close()
+
+    router = TargetRouter([("us", "http://us/api"), ("eu", "http://eu/api")], path=":memory:", probe=lambda url: None)
+    assert router.choose() == ("us", "http://us/api")
+    router.close()
+    assert probe_rtt("http://127.0.0.1:9/api", attempts=1, timeout=0.5) is None
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("Daytona target 选择测试")
+    print("=" * 60)
+
+    tests = [
+        test_parse_candidates,
+        test_fastest_healthy_target,
+        test_ranking_cache_ttl,
+        test_existing_sandbox_keeps_home,
+        test_locate_unregistered_sandbox,
+        test_probe_single_candidate_skipped,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+沙盒 Web 服务启动命令测试
+验证按 package.json 选择的启动命令、静态服务器的 npx serve 备选，以及端口清理命令可以在 sh 中执行
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# 添加脚本目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from web_server import FREE_PORT_COMMAND, KILL_COMMANDS, PORT_LISTENING, start_command, startup_seconds
+
+
+def package(scripts=None, deps=None) -> str:
+    return json.dumps({"name": "app", "scripts": scripts or {}, "dependencies": deps or {}})
+
+
+def test_start_command():
+    """测试 1: Next.js 使用显式的 -H/-p，其它 npm 项目优先 dev 脚本，没有脚本时用静态服务器并以 npx serve 兜底"""
+    assert start_command(package({"dev": "next dev"}, {"next": "14"})).endswith("npx next dev -H 0.0.0.0 -p 8080")
+    assert start_command(package({"start": "next start"}, {"next": "14"})).endswith("npx next start -H 0.0.0.0 -p 8080")
+    assert start_command(package({"dev": "vite", "start": "node ."})) == "cd /workspace && PORT=8080 HOST=0.0.0.0 npm run dev"
+    assert start_command(package({"start": "node ."})).endswith("npm start")
+    for static in (None, package(), "{not json", "[]"):
+        command = start_command(static)
+        assert "python3 -m http.server 8080 --bind 0.0.0.0 || npx -y serve -l 8080" in command, command
+    assert startup_seconds(package({"dev": "vite"}, {"vite": "5"})) == 8
+    assert startup_seconds(None) == 3
+
+
+def test_free_port_command():
+    """测试 2: 端口清理命令不含单引号、pkill 模式不匹配命令自身，语法可被 sh 解析"""
+    assert "'" not in FREE_PORT_COMMAND and "'" not in start_command(None)
+    for command in KILL_COMMANDS:
+        if command.startswith("pkill"):
+            pattern = command.split('"')[1]
+            assert pattern.startswith("["), pattern
+    assert "0A" in PORT_LISTENING and ":1F90 " in PORT_LISTENING
+    check = subprocess.run(["sh", "-n", "-c", FREE_PORT_COMMAND], capture_output=True, text=True)
+    assert check.returncode == 0, check.stderr
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("沙盒 Web 服务启动命令测试")
+    print("=" * 60)
+
+    tests = [
+        test_start_command,
+        test_free_port_command,
+    ]
+    tests_passed = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+            tests_passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+
+    print("\n" + "=" * 60)
+    print(f"测试结果: {tests_passed}/{len(tests)} 通过")
+    print("=" * 60)
+    sys.exit(0 if tests_passed == len(tests) else 1)
+
+
+if __name__ == "__main__":
+    main()
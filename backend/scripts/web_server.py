@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+沙盒 Web 服务的端口清理和启动命令
+mike.ts（经 daytona_sandbox.py start_server）和 deploy_queue.py 共用这里的定义，两条部署路径使用相同的命令。
+
+- 清理：杀掉可能占用 8080 端口的默认服务（如 FastAPI/uvicorn），再等待端口释放
+- 启动：有 start/dev 脚本时用 npm（Next.js 需要显式的 -H/-p 参数），否则用 Python 静态服务器，
+  没有 python3 时退回 npx serve
+"""
+
+import json
+from typing import Optional
+
+WEB_PORT = 8080
+# 等待端口释放的最长时间（秒）
+PORT_RELEASE_TIMEOUT = 5
+# 启动后等待服务就绪的时间（秒），Next.js 等框架需要更长时间
+FRAMEWORK_STARTUP_SECONDS = 8
+STATIC_STARTUP_SECONDS = 3
+FRAMEWORKS = ("next", "vite", "nuxt")
+
+# 模式首字母写成 [x] 形式，pkill -f 不会匹配到正在执行这条命令的 shell 自身
+KILL_COMMANDS = (
+    'pkill -9 -f "[u]vicorn"',
+    'pkill -9 -f "[f]astapi"',
+    f'pkill -9 -f "[p]ython.*{WEB_PORT}"',
+    f'pkill -9 -f "[:]{WEB_PORT}"',
+    f'fuser -k {WEB_PORT}/tcp 2>/dev/null',
+    f'kill -9 $(lsof -t -i:{WEB_PORT}) 2>/dev/null',
+)
+# /proc/net/tcp 中本地端口（十六进制）处于 LISTEN（0A）状态，不依赖 fuser/lsof
+PORT_LISTENING = f'grep -qs ":{WEB_PORT:04X} [0-9A-F]*:[0-9A-F]* 0A" /proc/net/tcp /proc/net/tcp6'
+
+# 命令中不使用单引号，run_command 会把整条命令包进 sh -c '...'
+FREE_PORT_COMMAND = "; ".join(f"{command} || true" for command in KILL_COMMANDS) + (
+    f"; i=0; while {PORT_LISTENING} && [ $i -lt {PORT_RELEASE_TIMEOUT * 2} ]; do sleep 0.5; i=$((i+1)); done; true"
+)
+
+STATIC_SERVER_COMMAND = (
+    f"python3 -m http.server {WEB_PORT} --bind 0.0.0.0 || npx -y serve -l {WEB_PORT} --no-clipboard"
+)
+
+
+def start_command(package_json: Optional[str]) -> str:
+    """启动 Web 服务的命令（非阻塞执行）"""
+    if package_json:
+        try:
+            pkg = json.loads(package_json)
+        except ValueError:
+            pkg = {}
+        if not isinstance(pkg, dict):
+            pkg = {}
+        scripts = pkg.get("scripts") or {}
+        deps = {**(pkg.get("dependencies") or {}), **(pkg.get("devDependencies") or {})}
+        if scripts.get("start") or scripts.get("dev"):
+            if "next" in deps:
+                mode = "dev" if scripts.get("dev") else "start"
+                cmd = f"npx next {mode} -H 0.0.0.0 -p {WEB_PORT}"
+            else:
+                cmd = "npm run dev" if scripts.get("dev") else "npm start"
+            return f"cd /workspace && PORT={WEB_PORT} HOST=0.0.0.0 {cmd}"
+    return f"cd /workspace && ({STATIC_SERVER_COMMAND})"
+
+
+def startup_seconds(package_json: Optional[str]) -> int:
+    """启动后需要等待的秒数"""
+    if package_json and any(f'"{name}"' in package_json for name in FRAMEWORKS):
+        return FRAMEWORK_STARTUP_SECONDS
+    return STATIC_STARTUP_SECONDS
@@ -1,5 +1,7 @@
 import { GoogleGenAI } from '@google/genai'
 import { supabase } from '../lib/supabase'
+import { dehydrateState, hydrateState } from '../lib/codeBlobs'
+import type { SandboxService } from '../services/sandbox'
 
 interface ProjectState {
   userMessage: string
@@ -837,10 +839,8 @@ async function loadProjectState(projectId: string): Promise<Partial<ProjectState
     
     if (!data || !data.state) return null
     
-    if (typeof data.state === 'string') {
-      return JSON.parse(data.state)
-    }
-    return data.state as Partial<ProjectState>
+    const state = typeof data.state === 'string' ? JSON.parse(data.state) : data.state
+    return await hydrateState(state) as Partial<ProjectState>
   } catch (error) {
     console.error('Load project state error:', error)
     return null
@@ -855,12 +855,13 @@ async function saveProjectState(projectId: string, userId: string, state: Projec
   }
   
   try {
-    const stateToSave = {
+    // 代码文件存入 code_blobs，state 中只保存哈希引用
+    const stateToSave = await dehydrateState({
       prd: state.prd,
       architecture: state.architecture,
       code: state.code,
       currentStatus: state.currentStatus,
-    }
+    })
     
     const { error } = await supabase
       .from('project_states')
@@ -885,6 +886,127 @@ async function saveProjectState(projectId: string, userId: string, state: Projec
   }
 }
 
+// 没有 index.html 但有 React 组件时，生成一个用 CDN React + Babel 运行的 index.html
+// 注意：Next.js 项目不需要生成 index.html
+function buildPreviewIndexHtml(code: Record<string, string>): string | null {
+  const pkgContent = code['package.json']
+  const isNextJsProject = pkgContent && (pkgContent.includes('"next"') || pkgContent.includes("'next'"))
+  if (code['index.html'] || isNextJsProject) return null
+
+  const mainFile = code['App.tsx'] || code['App.jsx'] || code['app.tsx'] || code['app.jsx']
+  if (!mainFile) return null
+
+  const cssContent = code['index.css'] || code['App.css'] || code['styles.css'] || ''
+  return `<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>Preview</title>
+  <script crossorigin src="https://cdn.staticfile.org/react/18.2.0/umd/react.development.js"></script>
+  <script crossorigin src="https://cdn.staticfile.org/react-dom/18.2.0/umd/react-dom.development.js"></script>
+  <script src="https://cdn.staticfile.org/babel-standalone/7.23.5/babel.min.js"></script>
+  <style>
+    body { margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; }
+    ${cssContent}
+  </style>
+</head>
+<body>
+  <div id="root"></div>
+  <script type="text/babel">
+    const { useState, useCallback, useEffect, useRef, useMemo } = React;
+    ${mainFile
+      .replace(/export default/g, 'const App =')
+      .replace(/export /g, '')
+      .replace(/import\s+.*?from\s+['"].*?['"];?\s*/g, '')
+      .replace(/import\s+['"].*?['"];?\s*/g, '')
+      .replace(/interface\s+\w+\s*\{[^}]*\}\s*/g, '')
+      .replace(/type\s+\w+\s*=\s*.*?;\s*/g, '')
+      .replace(/:\s*React\.\w+(<[^>]*>)?/g, '')
+      .replace(/useState\s*<[^>]+>/g, 'useState')
+      .replace(/useCallback\s*<[^>]+>/g, 'useCallback')
+      .replace(/useEffect\s*<[^>]+>/g, 'useEffect')
+      .replace(/:\s*(number|string|boolean|void|any)(\s*\|\s*(number|string|boolean|null))?/g, '')
+      .replace(/<(number|string|boolean)(\s*\|\s*null)?>/g, '')
+    }
+    const root = ReactDOM.createRoot(document.getElementById('root'));
+    root.render(<App />);
+  </script>
+</body>
+</html>`
+}
+
+// 直接创建沙盒并部署（未启用 DEPLOY_QUEUE 时）：写入文件、安装依赖、启动 Web 服务器
+// 返回沙盒信息，失败时返回 null，由调用方退回静态预览
+async function deployToSandbox(
+  sandboxService: SandboxService,
+  userId: string,
+  projectId: string,
+  code: Record<string, string>
+): Promise<any | null> {
+  try {
+    const sandboxResult = await sandboxService.createSandbox({
+      userId: userId,
+      projectId: projectId,
+      code: code,
+    })
+  
+    if (sandboxResult.type === 'daytona' && sandboxResult.containerId) {
+      // 一次写入所有生成的文件；如果没有 index.html 但有 React 组件，一并生成 index.html
+      const indexHtml = buildPreviewIndexHtml(code)
+      const files = indexHtml ? { ...code, 'index.html': indexHtml } : code
+      await sandboxService.writeFiles(sandboxResult.containerId, files)
+    
+      if (code['package.json'] && sandboxResult.restored) {
+        console.log('Restored node_modules from project snapshot, skipping npm install')
+      } else if (code['package.json']) {
+        try {
+          const install = await sandboxService.execCommand(
+            sandboxResult.containerId,
+            'cd /workspace && npm install',
+            true,
+            300
+          )
+          if (install.exitCode === 0) {
+            // 后台保存快照，下次 fork 时直接复用已安装的依赖
+            sandboxService.snapshotSandbox(sandboxResult.containerId, projectId || userId)
+              .then(snapshot => console.log('Saved sandbox snapshot:', snapshot))
+              .catch(error => console.error('Failed to snapshot sandbox:', error))
+          } else {
+            // 安装失败的 node_modules 不能保存为快照，否则之后的 fork 都会跳过安装
+            console.error(`npm install exited with ${install.exitCode}, skipping snapshot`)
+          }
+        } catch (error) {
+          console.error('Failed to install dependencies:', error)
+        }
+      }
+    
+      // 清理 8080 端口并启动 Web 服务器，命令与部署队列共用（scripts/web_server.py）
+      try {
+        const server = await sandboxService.startWebServer(sandboxResult.containerId, code['package.json'])
+        console.log('Started web server:', server.command)
+        // 等待服务器启动（Next.js 等框架需要更长时间）
+        await new Promise(resolve => setTimeout(resolve, server.waitSeconds * 1000))
+        console.log(`Web server should be ready now (waited ${server.waitSeconds}s)`)
+      } catch (error) {
+        console.error('Failed to start web server:', error)
+      }
+    
+      const sandboxInfo = {
+        sandboxId: sandboxResult.containerId,
+        vncUrl: sandboxResult.vncUrl,
+        websiteUrl: sandboxResult.websiteUrl,
+        type: 'daytona'  // 标记为沙盒类型
+      }
+      console.log('Sandbox created successfully:', sandboxInfo)
+      return sandboxInfo
+    }
+  } catch (error) {
+    console.error('Failed to create sandbox:', error)
+  }
+  return null
+}
+
 // 快速判断是否可能是修改需求
 function quickCheckModification(userMessage: string, previousState: Partial<ProjectState> | null): boolean {
   if (!previousState || (!previousState.prd && !previousState.code)) {
@@ -1300,188 +1422,39 @@ async function* invokeStream({ userMessage, projectId, userId, conversationHisto
               content: `🚀 **Alex (工程师)** 正在创建沙盒环境并部署应用...`,
             }
             
-            try {
-              const sandboxResult = await sandboxService.createSandbox({
-                userId: userId,
-                projectId: projectId,
-                code: state.code,
-              })
-              
-              if (sandboxResult.type === 'daytona' && sandboxResult.containerId) {
-                // 写入所有生成的文件
-                for (const [filePath, content] of Object.entries(state.code)) {
-                  await sandboxService.writeFile(sandboxResult.containerId, filePath, content)
-                }
-                
-                // 如果没有 index.html 但有 React 组件，生成一个 index.html
-                // 注意：Next.js 项目不需要生成 index.html
-                const pkgContent = state.code['package.json']
-                const isNextJsProject = pkgContent && (pkgContent.includes('"next"') || pkgContent.includes("'next'"))
-                
-                if (!state.code['index.html'] && !isNextJsProject) {
-                  const mainFile = state.code['App.tsx'] || state.code['App.jsx'] || state.code['app.tsx'] || state.code['app.jsx']
-                  if (mainFile) {
-                    const cssContent = state.code['index.css'] || state.code['App.css'] || state.code['styles.css'] || ''
-                    const indexHtml = `<!DOCTYPE html>
-<html lang="en">
-<head>
-  <meta charset="UTF-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1.0">
-  <title>Preview</title>
-  <script crossorigin src="https://cdn.staticfile.org/react/18.2.0/umd/react.development.js"></script>
-  <script crossorigin src="https://cdn.staticfile.org/react-dom/18.2.0/umd/react-dom.development.js"></script>
-  <script src="https://cdn.staticfile.org/babel-standalone/7.23.5/babel.min.js"></script>
-  <style>
-    body { margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; }
-    ${cssContent}
-  </style>
-</head>
-<body>
-  <div id="root"></div>
-  <script type="text/babel">
-    const { useState, useCallback, useEffect, useRef, useMemo } = React;
-    ${mainFile
-      .replace(/export default/g, 'const App =')
-      .replace(/export /g, '')
-      .replace(/import\s+.*?from\s+['"].*?['"];?\s*/g, '')
-      .replace(/import\s+['"].*?['"];?\s*/g, '')
-      .replace(/interface\s+\w+\s*\{[^}]*\}\s*/g, '')
-      .replace(/type\s+\w+\s*=\s*.*?;\s*/g, '')
-      .replace(/:\s*React\.\w+(<[^>]*>)?/g, '')
-      .replace(/useState\s*<[^>]+>/g, 'useState')
-      .replace(/useCallback\s*<[^>]+>/g, 'useCallback')
-      .replace(/useEffect\s*<[^>]+>/g, 'useEffect')
-      .replace(/:\s*(number|string|boolean|void|any)(\s*\|\s*(number|string|boolean|null))?/g, '')
-      .replace(/<(number|string|boolean)(\s*\|\s*null)?>/g, '')
-    }
-    const root = ReactDOM.createRoot(document.getElementById('root'));
-    root.render(<App />);
-  </script>
-</body>
-</html>`
-                    await sandboxService.writeFile(sandboxResult.containerId, 'index.html', indexHtml)
-                    console.log('Generated index.html for React app')
-                  }
-                }
-                
-                if (state.code['package.json']) {
-                  try {
-                    await sandboxService.runCommand(
-                      sandboxResult.containerId,
-                      'cd /workspace && npm install',
-                      true,
-                      300
-                    )
-                  } catch (error) {
-                    console.error('Failed to install dependencies:', error)
+            if (process.env.DEPLOY_QUEUE === 'true') {
+              // 交给 deploy_queue.py worker 执行：全局/每用户并发受限，多个用户的任务轮流调度
+              const indexHtml = buildPreviewIndexHtml(state.code)
+              const files = indexHtml ? { ...state.code, 'index.html': indexHtml } : state.code
+              try {
+                const job = await sandboxService.enqueueDeploy(userId, projectId || userId, files)
+                if (job.position > 1) {
+                  yield {
+                    type: 'agent_start',
+                    agent: 'alex',
+                    content: `⏳ 部署任务已排队，前面还有 ${job.position - 1} 个任务...`,
                   }
                 }
-                
-                // 先杀掉可能占用 8080 端口的默认服务（如 FastAPI/uvicorn）
-                try {
-                  // 尝试多种方式杀掉 8080 端口的进程
-                  await sandboxService.runCommand(
-                    sandboxResult.containerId,
-                    `pkill -9 -f uvicorn || true; \
-                     pkill -9 -f fastapi || true; \
-                     pkill -9 -f "python.*8080" || true; \
-                     pkill -9 -f ":8080" || true; \
-                     fuser -k 8080/tcp 2>/dev/null || true; \
-                     kill -9 $(lsof -t -i:8080) 2>/dev/null || true`,
-                    true,
-                    15
-                  )
-                  console.log('Killed existing process on port 8080')
-                  // 等待端口释放
-                  await new Promise(resolve => setTimeout(resolve, 2000))
-                } catch (error) {
-                  // 忽略错误，可能没有进程在运行
-                  console.log('No existing process on port 8080 or failed to kill:', error)
-                }
-                
-                // 启动 Web 服务器
-                let serverStarted = false
-                
-                if (state.code['package.json']) {
-                  try {
-                    const pkg = JSON.parse(state.code['package.json'])
-                    const isNextJs = pkg.dependencies?.next || pkg.devDependencies?.next
-                    
-                    if (pkg.scripts && (pkg.scripts.start || pkg.scripts.dev)) {
-                      let startCmd: string
-                      
-                      if (isNextJs) {
-                        // Next.js 需要特殊的启动参数
-                        if (pkg.scripts.dev) {
-                          startCmd = 'npx next dev -H 0.0.0.0 -p 8080'
-                        } else {
-                          startCmd = 'npx next start -H 0.0.0.0 -p 8080'
-                        }
-                        console.log('Detected Next.js project, using:', startCmd)
-                      } else {
-                        startCmd = pkg.scripts.dev ? 'npm run dev' : 'npm start'
-                      }
-                      
-                      // 设置 PORT 和 HOST 确保服务器绑定到正确的地址
-                      await sandboxService.runCommand(
-                        sandboxResult.containerId,
-                        `cd /workspace && PORT=8080 HOST=0.0.0.0 ${startCmd}`,
-                        false
-                      )
-                      serverStarted = true
-                    }
-                  } catch (error) {
-                    console.error('Failed to start npm server:', error)
-                  }
+                const deployed = await sandboxService.waitForDeploy(job.jobId)
+                sandboxInfo = {
+                  sandboxId: deployed.sandbox_id,
+                  vncUrl: deployed.vnc_url,
+                  websiteUrl: deployed.website_url,
+                  type: 'daytona'
                 }
-                
-                // 如果没有通过 npm 启动服务器，使用 Python 简单 HTTP 服务器
-                if (!serverStarted) {
-                  try {
-                    // 必须绑定到 0.0.0.0 才能从外部访问
-                    await sandboxService.runCommand(
-                      sandboxResult.containerId,
-                      'cd /workspace && python3 -m http.server 8080 --bind 0.0.0.0',
-                      false
-                    )
-                    console.log('Started Python HTTP server on port 8080 (0.0.0.0)')
-                  } catch (error) {
-                    console.error('Failed to start Python HTTP server:', error)
-                    // 尝试使用 npx serve 作为备选（默认绑定 0.0.0.0）
-                    try {
-                      await sandboxService.runCommand(
-                        sandboxResult.containerId,
-                        'cd /workspace && npx -y serve -l 8080 --no-clipboard',
-                        false
-                      )
-                      console.log('Started npx serve on port 8080')
-                    } catch (serveError) {
-                      console.error('Failed to start any HTTP server:', serveError)
-                    }
+                console.log('Sandbox deployed via queue:', sandboxInfo)
+              } catch (error: any) {
+                if (error.retryAfter) {
+                  yield {
+                    type: 'agent_start',
+                    agent: 'alex',
+                    content: `⚠️ 沙盒资源繁忙，请 ${error.retryAfter} 秒后重试，先为你生成静态预览`,
                   }
                 }
-                
-                // 等待服务器启动（Next.js 等框架需要更长时间）
-                const pkgForWait = state.code['package.json']
-                const isFrameworkProject = pkgForWait && (
-                  pkgForWait.includes('"next"') || 
-                  pkgForWait.includes('"vite"') ||
-                  pkgForWait.includes('"nuxt"')
-                )
-                const waitTime = isFrameworkProject ? 8000 : 3000
-                await new Promise(resolve => setTimeout(resolve, waitTime))
-                console.log(`Web server should be ready now (waited ${waitTime}ms)`)
-                
-                sandboxInfo = {
-                  sandboxId: sandboxResult.containerId,
-                  vncUrl: sandboxResult.vncUrl,
-                  websiteUrl: sandboxResult.websiteUrl,
-                  type: 'daytona'  // 标记为沙盒类型
-                }
-                console.log('Sandbox created successfully:', sandboxInfo)
+                console.error('Failed to deploy via queue:', error)
               }
-            } catch (error) {
-              console.error('Failed to create sandbox:', error)
+            } else {
+              sandboxInfo = await deployToSandbox(sandboxService, userId, projectId, state.code)
             }
           }
         } catch (error) {
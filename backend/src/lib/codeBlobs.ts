@@ -0,0 +1,155 @@
+import { createHash } from 'crypto'
+import { supabase } from './supabase'
+
+/**
+ * 代码内容寻址存储
+ *
+ * 文件内容按 sha256 存入 code_blobs 表，project_states.state 和 messages.artifacts
+ * 中只保存 { 路径: 哈希 } 引用（state.code_refs / artifact.content_refs）。
+ * 与 scripts/code_blobs.py 的格式保持一致。
+ */
+
+export type CodeMap = Record<string, string>
+export type CodeRefs = Record<string, string>
+
+// 每次查询的哈希数：.in() 把哈希拼进 URL，还要低于 PostgREST 的 1000 行上限
+const LOAD_CHUNK_SIZE = 200
+
+export function hashContent(content: string): string {
+  return createHash('sha256').update(content, 'utf8').digest('hex')
+}
+
+/**
+ * 写入文件内容，返回引用；code_blobs 不可用或含有非字符串内容时返回 null，调用方应继续内联保存
+ */
+export async function storeCode(code: CodeMap): Promise<CodeRefs | null> {
+  if (!supabase) return null
+  // 非字符串内容存成 blob 后只能还原为字符串，整份保持内联（与 code_blobs.py 一致）
+  if (!Object.values(code).every(content => typeof content === 'string')) return null
+
+  const refs: CodeRefs = {}
+  const blobs = new Map<string, string>()
+  for (const [filePath, content] of Object.entries(code)) {
+    const digest = hashContent(content)
+    refs[filePath] = digest
+    blobs.set(digest, content)
+  }
+
+  if (blobs.size === 0) return refs
+
+  const { error } = await supabase
+    .from('code_blobs')
+    .upsert(
+      Array.from(blobs, ([sha256, content]) => ({ sha256, content })),
+      { onConflict: 'sha256', ignoreDuplicates: true }
+    )
+
+  if (error) {
+    if (error.code === 'PGRST116' || error.code === '42P01' || error.message?.includes('does not exist')) {
+      console.warn('code_blobs table does not exist yet, storing code inline')
+    } else {
+      console.error('Store code blobs error:', error)
+    }
+    return null
+  }
+
+  return refs
+}
+
+/**
+ * 还原多组引用，哈希按 LOAD_CHUNK_SIZE 分批并行查询后合并
+ */
+export async function loadCode(refsList: CodeRefs[]): Promise<CodeMap[]> {
+  const hashes = Array.from(new Set(refsList.flatMap(refs => Object.values(refs))))
+  if (hashes.length === 0) return refsList.map(() => ({}))
+  if (!supabase) throw new Error('Database not configured')
+  const client = supabase
+
+  const chunks: string[][] = []
+  for (let i = 0; i < hashes.length; i += LOAD_CHUNK_SIZE) {
+    chunks.push(hashes.slice(i, i + LOAD_CHUNK_SIZE))
+  }
+  const results = await Promise.all(chunks.map(chunk =>
+    client
+      .from('code_blobs')
+      .select('sha256, content')
+      .in('sha256', chunk)
+  ))
+
+  const contents = new Map<string, string>()
+  for (const { data, error } of results) {
+    if (error) throw error
+    for (const row of (data || []) as any[]) {
+      contents.set(row.sha256, row.content)
+    }
+  }
+
+  return refsList.map(refs => {
+    const code: CodeMap = {}
+    for (const [filePath, digest] of Object.entries(refs)) {
+      const content = contents.get(digest)
+      if (content === undefined) {
+        throw new Error(`Missing code blob for ${filePath} (${digest})`)
+      }
+      code[filePath] = content
+    }
+    return code
+  })
+}
+
+/**
+ * state.code -> state.code_refs
+ */
+export async function dehydrateState<T extends { code?: CodeMap }>(state: T): Promise<any> {
+  if (!state.code) return state
+  const refs = await storeCode(state.code)
+  if (!refs) return state
+  const { code, ...rest } = state
+  return { ...rest, code_refs: refs }
+}
+
+/**
+ * state.code_refs -> state.code
+ */
+export async function hydrateState(state: any): Promise<any> {
+  if (!state || !state.code_refs) return state
+  const [code] = await loadCode([state.code_refs])
+  const { code_refs, ...rest } = state
+  return { ...rest, code }
+}
+
+/**
+ * code artifact 的 content -> content_refs
+ */
+export async function dehydrateArtifacts(artifacts: any[] | null): Promise<any[] | null> {
+  if (!Array.isArray(artifacts)) return artifacts
+  return Promise.all(artifacts.map(async artifact => {
+    if (artifact?.type !== 'code' || !artifact.content || typeof artifact.content !== 'object') {
+      return artifact
+    }
+    const refs = await storeCode(artifact.content)
+    if (!refs) return artifact
+    const { content, ...rest } = artifact
+    return { ...rest, content_refs: refs }
+  }))
+}
+
+/**
+ * 还原一批消息中所有 code artifact，所有消息的哈希合并后一起查询
+ */
+export async function hydrateMessages<T extends { artifacts?: any[] | null }>(messages: T[]): Promise<T[]> {
+  const targets: any[] = []
+  for (const message of messages) {
+    for (const artifact of message.artifacts || []) {
+      if (artifact?.content_refs) targets.push(artifact)
+    }
+  }
+  if (targets.length === 0) return messages
+
+  const codes = await loadCode(targets.map(artifact => artifact.content_refs))
+  targets.forEach((artifact, i) => {
+    artifact.content = codes[i]
+    delete artifact.content_refs
+  })
+  return messages
+}
@@ -1,5 +1,6 @@
 import express from 'express'
 import { supabase } from '../lib/supabase'
+import { dehydrateArtifacts, hydrateMessages } from '../lib/codeBlobs'
 
 const router = express.Router()
 
@@ -32,7 +33,7 @@ router.get('/:projectId', async (req, res) => {
       throw error
     }
 
-    res.json({ messages: data || [] })
+    res.json({ messages: await hydrateMessages(data || []) })
   } catch (error) {
     console.error('Get messages error:', error)
     res.status(500).json({ 
@@ -63,7 +64,7 @@ router.post('/', async (req, res) => {
         role: message.role,
         content: message.content,
         agent: message.agent || null,
-        artifacts: message.artifacts || null,
+        artifacts: await dehydrateArtifacts(message.artifacts || null),
         timestamp: message.timestamp || new Date().toISOString(),
       })
       .select()
@@ -78,7 +79,8 @@ router.post('/', async (req, res) => {
       throw error
     }
 
-    res.json({ message: data })
+    const [saved] = await hydrateMessages([data])
+    res.json({ message: saved })
   } catch (error) {
     console.error('Save message error:', error)
     res.status(500).json({ 
@@ -100,16 +102,16 @@ router.post('/batch', async (req, res) => {
       return res.status(500).json({ error: 'Database not configured' })
     }
 
-    const messagesToInsert = messages.map((msg: any) => ({
+    const messagesToInsert = await Promise.all(messages.map(async (msg: any) => ({
       id: msg.id || `${Date.now()}-${Math.random().toString(36).substr(2, 9)}`,
       project_id: projectId,
       user_id: userId,
       role: msg.role,
       content: msg.content,
       agent: msg.agent || null,
-      artifacts: msg.artifacts || null,
+      artifacts: await dehydrateArtifacts(msg.artifacts || null),
       timestamp: msg.timestamp || new Date().toISOString(),
-    }))
+    })))
 
     const { data, error } = await supabase
       .from('messages')
@@ -125,7 +127,7 @@ router.post('/batch', async (req, res) => {
       throw error
     }
 
-    res.json({ messages: data || messages })
+    res.json({ messages: data ? await hydrateMessages(data) : messages })
   } catch (error) {
     console.error('Batch save messages error:', error)
     res.status(500).json({ 
@@ -4,6 +4,9 @@ import { v4 as uuidv4 } from 'uuid'
 
 const router = express.Router()
 
+// 最后一条消息先只查最近这段时间：messages 按月分区时，带 timestamp 下界的查询只扫描最近的分区
+const LAST_MESSAGE_WINDOW_DAYS = 90
+
 // 获取用户的所有项目
 router.get('/', async (req, res) => {
   try {
@@ -47,19 +50,28 @@ router.get('/', async (req, res) => {
           .limit(1)
           .maybeSingle()
 
-        // 获取最后一条消息（作为对话预览）
-        const { data: lastMessage } = await db
-          .from('messages')
-          .select('content, role, timestamp')
-          .eq('project_id', project.id)
-          .eq('user_id', userId)
-          .order('timestamp', { ascending: false })
-          .limit(1)
-          .maybeSingle()
+        // 获取最后一条消息（作为对话预览）；最近没有消息时才扫描全部分区
+        const lastMessageQuery = (since?: string) => {
+          let query = db
+            .from('messages')
+            .select('content, role, timestamp')
+            .eq('project_id', project.id)
+            .eq('user_id', userId)
+          if (since) query = query.gte('timestamp', since)
+          return query
+            .order('timestamp', { ascending: false })
+            .limit(1)
+            .maybeSingle()
+        }
+        const since = new Date(Date.now() - LAST_MESSAGE_WINDOW_DAYS * 24 * 60 * 60 * 1000).toISOString()
+        let { data: lastMessage } = await lastMessageQuery(since)
+        if (!lastMessage) {
+          ({ data: lastMessage } = await lastMessageQuery())
+        }
 
         return {
           ...project,
-          hasCode: !!(stateData?.state?.code && Object.keys(stateData.state.code).length > 0),
+          hasCode: !!(Object.keys(stateData?.state?.code_refs || stateData?.state?.code || {}).length > 0),
           lastUpdated: stateData?.updated_at || project.updated_at,
           lastMessage: lastMessage ? {
             content: lastMessage.content.substring(0, 100) + (lastMessage.content.length > 100 ? '...' : ''),
@@ -238,6 +250,13 @@ router.delete('/:projectId', async (req, res) => {
       throw error
     }
 
+    // 后台删除项目的沙盒快照卷，失败不影响项目删除
+    if (process.env.DAYTONA_API_KEY) {
+      const { sandboxService } = await import('../services/sandbox')
+      sandboxService.deleteProjectSnapshots(projectId)
+        .catch(error => console.error('Failed to delete project snapshots:', error))
+    }
+
     res.json({ success: true })
   } catch (error) {
     console.error('Delete project error:', error)
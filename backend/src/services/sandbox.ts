@@ -24,6 +24,24 @@ interface SandboxResult {
   containerId?: string
   vncUrl?: string
   websiteUrl?: string
+  restored?: boolean
+}
+
+interface CommandResult {
+  output: string
+  exitCode: number | null
+  logId?: string
+}
+
+interface CommandLog {
+  output: string
+  nextOffset: number
+  truncatedBytes: number
+}
+
+interface DeployJob {
+  jobId: string
+  position: number
 }
 
 interface DaytonaSandboxInfo {
@@ -38,10 +56,12 @@ interface DaytonaSandboxInfo {
  */
 export class SandboxService {
   private pythonScriptPath: string
+  private queueScriptPath: string
   
   constructor() {
     // Python 脚本路径
     this.pythonScriptPath = path.join(__dirname, '../../scripts/daytona_sandbox.py')
+    this.queueScriptPath = path.join(__dirname, '../../scripts/deploy_queue.py')
   }
   
   /**
@@ -115,33 +135,63 @@ export class SandboxService {
    * 创建 Daytona 沙盒
    */
   async createDaytonaSandbox(options: SandboxOptions): Promise<SandboxResult> {
-    const { userId, projectId } = options
+    const { userId, projectId, code } = options
     const password = process.env.DAYTONA_VNC_PASSWORD || '123456'
+    // 资源档位：auto 按依赖指纹和历史测量自动选择，也可指定 small/standard/large/xlarge
+    const profile = process.env.DAYTONA_SANDBOX_PROFILE || 'auto'
     
-    const result = await this.callPythonScript('create', password, projectId || userId)
+    // 有 package.json 时从项目快照 fork，依赖指纹相同则跳过 npm install；
+    // create 同样通过 stdin 接收 package.json（可为空），用于选择资源档位
+    const result = await this.callPythonScriptStdin(
+      code['package.json'] ? 'fork' : 'create',
+      code['package.json'] || '',
+      password,
+      projectId || userId,
+      profile
+    )
     
     if (!result.success) {
       throw new Error(result.error || 'Failed to create sandbox')
     }
     
+    if (result.profile) {
+      console.log(`Sandbox profile: ${result.profile.tier} (${result.profile.reason})`)
+    }
+    
     return {
       url: result.website_url,
       type: 'daytona',
       containerId: result.sandbox_id,
       vncUrl: result.vnc_url,
       websiteUrl: result.website_url,
+      restored: !!result.restored,
     }
   }
   
   /**
-   * 在沙盒中写入文件
-   * 使用 stdin 传递文件内容，避免命令行长度限制
+   * 把沙盒中已安装依赖的工作区保存为项目快照
    */
-  async writeFile(sandboxId: string, filePath: string, content: string): Promise<void> {
+  async snapshotSandbox(sandboxId: string, projectId: string): Promise<string> {
+    const result = await this.callPythonScript('snapshot', sandboxId, projectId)
+    
+    if (!result.success) {
+      throw new Error(result.error || 'Failed to snapshot sandbox')
+    }
+    
+    return result.snapshot
+  }
+  
+  /**
+   * 调用 Python 脚本，通过 stdin 传递内容，避免命令行长度限制
+   */
+  private callPythonScriptStdin(action: string, input: string, ...args: string[]): Promise<any> {
+    return this.spawnPython([this.pythonScriptPath, action, ...args], input)
+  }
+  
+  private spawnPython(args: string[], input: string): Promise<any> {
     const { spawn } = require('child_process')
     
     return new Promise((resolve, reject) => {
-      const args = [this.pythonScriptPath, 'write_file_stdin', sandboxId, filePath]
       const child = spawn('python3', args, {
         env: {
           ...process.env,
@@ -163,14 +213,9 @@ export class SandboxService {
         stderr += data.toString()
       })
       
-      child.on('close', (code: number) => {
+      child.on('close', () => {
         try {
-          const result = JSON.parse(stdout.trim())
-          if (result.success) {
-            resolve()
-          } else {
-            reject(new Error(result.error || 'Failed to write file'))
-          }
+          resolve(JSON.parse(stdout.trim()))
         } catch (e) {
           reject(new Error(`Failed to parse response: ${stdout}\n${stderr}`))
         }
@@ -180,16 +225,63 @@ export class SandboxService {
         reject(err)
       })
       
-      // 通过 stdin 传递文件内容
-      child.stdin.write(content)
+      child.stdin.write(input)
       child.stdin.end()
     })
   }
   
+  /**
+   * 在沙盒中写入文件
+   * 使用 stdin 传递文件内容，避免命令行长度限制
+   * 大文件在沙盒内已有旧版本（如从快照 fork）时只传输不同的块
+   */
+  async writeFile(sandboxId: string, filePath: string, content: string): Promise<void> {
+    const result = await this.callPythonScriptStdin('patch', content, sandboxId, filePath)
+    
+    if (!result.success) {
+      throw new Error(result.error || 'Failed to write file')
+    }
+  }
+  
+  /**
+   * 在沙盒中批量写入文件
+   * 文件以 { 路径: 内容 } 的 JSON 经 stdin 传递；启用沙盒内代理时所有文件在一次请求中写入
+   */
+  async writeFiles(sandboxId: string, files: Record<string, string>): Promise<void> {
+    const result = await this.callPythonScriptStdin('write_files', JSON.stringify(files), sandboxId)
+
+    if (!result.success) {
+      throw new Error(result.error || 'Failed to write files')
+    }
+  }
+
+  /**
+   * 清理 8080 端口并在后台启动 Web 服务
+   * 命令定义在 scripts/web_server.py，与部署队列共用；返回启动命令和需要等待的秒数
+   */
+  async startWebServer(sandboxId: string, packageJson?: string): Promise<{ command: string; waitSeconds: number }> {
+    const result = await this.callPythonScriptStdin('start_server', packageJson || '', sandboxId)
+
+    if (!result.success) {
+      throw new Error(result.error || 'Failed to start web server')
+    }
+
+    return { command: result.command, waitSeconds: result.wait_seconds }
+  }
+
   /**
    * 在沙盒中执行命令
    */
   async runCommand(sandboxId: string, command: string, blocking: boolean = false, timeout: number = 60): Promise<string> {
+    const result = await this.execCommand(sandboxId, command, blocking, timeout)
+    return result.output
+  }
+  
+  /**
+   * 在沙盒中执行命令，同时返回退出码（非阻塞命令为 null）
+   * 命令以非零退出码结束时不会抛出错误，需要调用方检查 exitCode
+   */
+  async execCommand(sandboxId: string, command: string, blocking: boolean = false, timeout: number = 60): Promise<CommandResult> {
     const result = await this.callPythonScript(
       'run_command',
       sandboxId,
@@ -202,7 +294,90 @@ export class SandboxService {
       throw new Error(result.error || 'Failed to run command')
     }
     
-    return result.output || result.message || ''
+    return {
+      output: result.output || result.message || '',
+      exitCode: typeof result.exit_code === 'number' ? result.exit_code : null,
+      logId: result.log_id,
+    }
+  }
+  
+  /**
+   * 从字节偏移 offset 读取命令日志增量（日志 ID 由 run_command 返回）
+   * 只传回头尾有界的两段，中间部分在沙盒内截断
+   */
+  async getCommandLogs(sandboxId: string, logId: string, offset: number = 0, tailBytes: number = 60 * 1024): Promise<CommandLog> {
+    const result = await this.callPythonScript(
+      'logs',
+      sandboxId,
+      logId,
+      offset.toString(),
+      tailBytes.toString()
+    )
+    
+    if (!result.success) {
+      throw new Error(result.error || 'Failed to read command logs')
+    }
+    
+    return {
+      output: result.output || '',
+      nextOffset: result.next_offset,
+      truncatedBytes: result.truncated_bytes,
+    }
+  }
+  
+  /**
+   * 把部署任务写入 deploy_queue.py 的队列，队列已满时抛出带 retryAfter（秒）的错误
+   */
+  async enqueueDeploy(userId: string, projectId: string, files: Record<string, string>): Promise<DeployJob> {
+    const password = process.env.DAYTONA_VNC_PASSWORD || '123456'
+    const payload = {
+      project_id: projectId,
+      password,
+      profile: process.env.DAYTONA_SANDBOX_PROFILE || 'auto',
+      files,
+    }
+    const result = await this.spawnPython(
+      [this.queueScriptPath, 'enqueue', userId, projectId],
+      JSON.stringify(payload)
+    )
+    
+    if (!result.success) {
+      const error: any = new Error(result.error || 'Failed to enqueue deploy')
+      error.retryAfter = result.retry_after
+      throw error
+    }
+    
+    return { jobId: result.job_id, position: result.position }
+  }
+  
+  /**
+   * 轮询部署任务直到完成，返回 worker 的部署结果
+   */
+  async waitForDeploy(jobId: string, timeoutMs: number = 15 * 60 * 1000, intervalMs: number = 2000): Promise<any> {
+    const deadline = Date.now() + timeoutMs
+    while (Date.now() < deadline) {
+      const job = await this.spawnPython([this.queueScriptPath, 'status', jobId], '')
+      if (!job.success) {
+        throw new Error(job.error || 'Failed to read deploy job')
+      }
+      if (job.status === 'succeeded') return job.result
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Deploy job failed')
+      }
+      await new Promise(resolve => setTimeout(resolve, intervalMs))
+    }
+    throw new Error(`Deploy job ${jobId} timed out`)
+  }
+  
+  /**
+   * 删除项目的快照卷（以及仍挂载该卷的项目沙盒）
+   */
+  async deleteProjectSnapshots(projectId: string): Promise<void> {
+    const result = await this.callPythonScript('delete_project', projectId)
+    
+    if (!result.success) {
+      throw new Error(result.error || 'Failed to delete project snapshots')
+    }
   }
   
   /**